@@ -0,0 +1,507 @@
+"""
+Ingest benchmark for the Receiver Lambda
+Replays synthetic account files through CoreUpdateDb.load_from_sqs with SQS and S3 mocked by moto and the
+RDS Data API served by RdsDataShim on a local PostgreSQL. Reports per stage wall time, Data API / SQS / S3
+round trips, rows per second and peak traced memory from the Lambda's own StageMetrics (lambda_function.METRICS),
+the baseline ingest changes are compared against. Memory is traced with tracemalloc, which slows the Python side
+down, --no-trace-memory gives undisturbed timings without the memory column. A run in which a loader failed, a file was not loaded, a reported
+finding is missing or a table the payloads fill is empty is marked FAILED and exits with status 1.
+
+Usage:
+    pip install -r bench/requirements.txt
+    python bench/ingest_benchmark.py --dsn postgresql://postgres@localhost/postgres \\
+        --accounts 20 --services 200 --cost-reports 3 --findings 2000 --rounds 2 --change-ratio 0.1
+
+The benchmark creates (and unless --keep-db drops) its own database, loads sql/core-schema.sql and
+sql/core-view-schema.sql into it and runs every round until the queue is empty. Round 1 inserts everything,
+later rounds resend the same accounts with --change-ratio of the values changed.
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from functools import wraps
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse, urlunparse
+
+import boto3
+import psycopg2
+from moto import mock_aws
+
+BENCH_DIR   = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR    = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from rds_data_shim import RdsDataShim
+
+REGION          = 'us-east-1'
+MOTO_ACCOUNT    = '123456789012'
+QUEUE_NAME      = 'agency360-bench'
+BUCKET_NAME     = 'agency360-bench'
+
+# Stages reported by CoreUpdateDb (lambda_function.METRICS), in load order
+STAGES          = ['drain', 'read', 'ledger', 'account', 'services', 'cost', 'security', 'logs', 'deletes', 'views', 'partitions', 'other']
+
+# CoreUpdateDb loaders watched for failures, a False result or an exception fails the run
+LOADERS         = ['process_account', 'process_services', 'process_cost_data', 'process_security_data',
+                   'load_security_findings', 'process_logs']
+
+# Table -> benchmark argument that makes the payloads fill it, an empty table fails the run
+TABLES          =   {
+                        'accounts'          : 'accounts',
+                        'services'          : 'services',
+                        'services_daily'    : 'services',
+                        'cost_reports'      : 'cost_reports',
+                        'service_costs'     : 'cost_reports',
+                        'cost_forecasts'    : 'cost_reports',
+                        'security'          : 'findings',
+                        'findings'          : 'findings',
+                        'findings_daily'    : 'findings',
+                        'logs'              : 'accounts',
+                        'log_messages'      : 'log_messages',
+                        'ingest_ledger'     : 'accounts',
+                    }
+
+SEVERITIES      = ['CRITICAL', 'HIGH', 'MEDIUM', 'LOW', 'INFORMATIONAL']
+STATUSES        = ['NEW', 'NOTIFIED', 'RESOLVED', 'SUPPRESSED']
+WORKFLOWS       = ['NEW', 'NOTIFIED', 'IN_PROGRESS', 'RESOLVED']
+REGIONS         = ['us-east-1', 'us-west-2', 'eu-west-1', 'ap-southeast-2']
+SECURITY        = ['SecurityHub', 'GuardDuty']
+
+
+""" 1. METERING """
+class MeteredRdsDataShim(RdsDataShim):
+    def __init__(self, dsn: str, metrics, max_connections: int = 20):
+        """RdsDataShim reporting its requests to the Lambda StageMetrics, as the botocore event hooks do for a real client"""
+        super().__init__(dsn, max_connections)
+        self.metrics = metrics
+
+    def _count(self, operation: str) -> None:
+        super()._count(operation)
+        self.metrics.on_request(event_name=f"before-send.rds-data.{operation}")
+
+
+class LoaderFailures:
+    def __init__(self):
+        """Loader calls that returned False or raised, shared by the loader threads"""
+        self.lock       = threading.Lock()
+        self.failures   = []
+
+    def add(self, loader: str, reason: str) -> None:
+        with self.lock:
+            self.failures.append(f"{loader} {reason}")
+
+    def take(self) -> List[str]:
+        """Failures since the last call"""
+        with self.lock:
+            failures, self.failures = self.failures, []
+        return failures
+
+
+def watch_loaders(lf, failures: LoaderFailures) -> None:
+    """Wrap the CoreUpdateDb loaders so a False result or an exception is recorded, the result is passed on unchanged"""
+    for method in LOADERS:
+        original = getattr(lf.CoreUpdateDb, method)
+
+        def wrapper(original=original, method=method):
+            @wraps(original)
+            def watched(self, *args, **kwargs):
+                try:
+                    result = original(self, *args, **kwargs)
+                except Exception as e:
+                    failures.add(method, f"raised {type(e).__name__}: {e}")
+                    raise
+                if result is False or (isinstance(result, dict) and result.get('success') is False):
+                    failures.add(method, "returned False")
+                return result
+            return watched
+
+        setattr(lf.CoreUpdateDb, method, wrapper())
+
+
+""" 2. SYNTHETIC PAYLOADS """
+def account_number(index: int) -> str:
+    return f"{100000000000 + index:012d}"
+
+
+def finding_arn(account_id: str, service: str, i: int) -> str:
+    return f"arn:aws:{service.lower()}:{REGION}:{account_id}:finding/{service}-{i:08d}"
+
+
+def account_payload(rng: random.Random, index: int, services: int, cost_reports: int, findings: int,
+                    log_messages: int, revision: int, change_ratio: float) -> Dict[str, Any]:
+    """
+    One account file in the layout the collector writes to S3
+    Args:
+        rng (random.Random): Seeded per account so every round regenerates the same base values
+        revision (int): Round number, values picked by change_ratio move on every revision
+        change_ratio (float): Share of services, cost figures and findings changed per revision
+    """
+    account_id  = account_number(index)
+    today       = date.today()
+    midnight    = datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
+
+    def moved(value: float, key: str) -> float:
+        # Deterministic per key, so unchanged values hash equal between rounds
+        if revision and random.Random(f"{key}:{revision}").random() < change_ratio:
+            return round(value * (1 + 0.05 * revision), 4)
+        return value
+
+    service_rows = []
+    for i in range(services):
+        day = today - timedelta(days=i // 20)
+        service_rows.append({
+            'service'           : f"Service {i % 20:02d}",
+            'date_from'         : day.isoformat(),
+            'date_to'           : (day + timedelta(days=1)).isoformat(),
+            'cost'              : moved(round(rng.uniform(0, 500), 4), f"{account_id}:s{i}"),
+            'currency'          : 'USD',
+            'utilization'       : round(rng.uniform(0, 100), 2),
+            'utilization_unit'  : 'Hrs',
+            'usage_types'       : [f"Usage{i % 7}", f"Usage{i % 11}"]
+        })
+
+    reports = []
+    for i in range(cost_reports):
+        month   = today.year * 12 + today.month - 1 - i
+        start   = date(month // 12, month % 12 + 1, 1)
+        end     = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        current = moved(round(rng.uniform(1000, 9000), 4), f"{account_id}:c{i}")
+        reports.append({
+            'current_period_cost'           : current,
+            'previous_period_cost'          : round(current * 0.9, 4),
+            'cost_difference'               : round(current * 0.1, 4),
+            'cost_difference_percentage'    : 10.0,
+            'potential_monthly_savings'     : round(current * 0.05, 4),
+            'anomalies_detected'            : rng.randint(0, 3),
+            'saving_opportunities_count'    : rng.randint(0, 5),
+            'period'                        : {'start': start.isoformat(), 'end': end.isoformat(), 'granularity': 'MONTHLY'},
+            'top_services'                  : [{'service': f"Service {j:02d}", 'cost': round(current / (j + 2), 4)} for j in range(10)],
+            'forecast'                      : [
+                                                {
+                                                    'period'                            : {'start': (end + timedelta(days=1 + 30 * j)).isoformat(),
+                                                                                           'end': (end + timedelta(days=30 * (j + 1))).isoformat()},
+                                                    'amount'                            : round(current * 1.02, 4),
+                                                    'prediction_interval_lower_bound'   : round(current * 0.9, 4),
+                                                    'prediction_interval_upper_bound'   : round(current * 1.1, 4)
+                                                }
+                                                for j in range(3)
+                                              ]
+        })
+
+    security_rows = []
+    for service in SECURITY:
+        rows = []
+        for i in range(findings // 2):
+            created = midnight - timedelta(days=rng.randint(0, 120), minutes=rng.randint(0, 1439))
+            status  = STATUSES[rng.randrange(len(STATUSES))]
+            if revision and random.Random(f"{account_id}:f{service}{i}:{revision}").random() < change_ratio:
+                status = 'RESOLVED'
+            if i == 0:
+                # Closed long before the retention period, still reported, so it must never be purged
+                created = midnight - timedelta(days=400)
+                status  = 'RESOLVED'
+            rows.append({
+                'finding_id'        : finding_arn(account_id, service, i),
+                'service'           : service,
+                'title'             : f"Synthetic finding {i}",
+                'description'       : 'Generated by bench/ingest_benchmark.py',
+                'severity'          : SEVERITIES[rng.randrange(len(SEVERITIES))],
+                'status'            : status,
+                'resource_type'     : 'AwsEc2Instance',
+                'resource_id'       : f"i-{index:04d}{i:08d}",
+                'created_at'        : created.isoformat(),
+                'updated_at'        : (created + timedelta(days=1)).isoformat(),
+                'recommendation'    : 'Review the resource configuration',
+                'compliance_status' : 'FAILED',
+                'region'            : REGIONS[rng.randrange(len(REGIONS))],
+                'workflow_state'    : WORKFLOWS[rng.randrange(len(WORKFLOWS))],
+                'record_state'      : 'ACTIVE',
+                'product_name'      : service,
+                'company_name'      : 'AWS',
+                'product_arn'       : f"arn:aws:securityhub:{REGION}::product/aws/{service.lower()}",
+                'generator_id'      : f"generator-{i % 25}",
+                'generator'         : f"Control {i % 25}"
+            })
+
+        counts = {severity: sum(1 for f in rows if f['severity'] == severity) for severity in SEVERITIES}
+        security_rows.append({
+            'service'           : service,
+            'total_findings'    : len(rows),
+            'severity_counts'   : counts,
+            'open_findings'     : sum(1 for f in rows if f['status'] != 'RESOLVED'),
+            'resolved_findings' : sum(1 for f in rows if f['status'] == 'RESOLVED'),
+            'findings'          : rows
+        })
+
+    return {
+        'account'   : {
+                        'account_id'        : account_id,
+                        'account_name'      : f"Bench Account {index:04d}",
+                        'account_email'     : f"bench+{index}@example.com",
+                        'account_status'    : 'ACTIVE',
+                        'account_arn'       : f"arn:aws:organizations::{MOTO_ACCOUNT}:account/o-bench/{account_id}",
+                        'joined_method'     : 'CREATED',
+                        'joined_timestamp'  : '2020-01-01T00:00:00+00:00'
+                      },
+        'service'   : service_rows,
+        'cost'      : reports,
+        'security'  : security_rows,
+        'logs'      : {
+                        'account'   : 'SUCCESS',
+                        'cost'      : 'SUCCESS',
+                        'service'   : 'SUCCESS',
+                        'security'  : 'SUCCESS',
+                        'message'   : [{'INFO': f"Collected section {i}"} for i in range(log_messages)]
+                      }
+    }
+
+
+""" 3. DATABASE """
+def _database_dsn(dsn: str, database: str) -> str:
+    """Same server and credentials, other database"""
+    parts = urlparse(dsn)
+    return urlunparse(parts._replace(path=f"/{database}"))
+
+
+def create_database(dsn: str, database: str) -> str:
+    """Create an empty benchmark database with the core schema and views, returns its DSN"""
+    admin = psycopg2.connect(dsn)
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        cursor.execute(f'DROP DATABASE IF EXISTS "{database}"')
+        cursor.execute(f'CREATE DATABASE "{database}"')
+    admin.close()
+
+    bench_dsn   = _database_dsn(dsn, database)
+    connection  = psycopg2.connect(bench_dsn)
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        for name in ('core-schema.sql', 'core-view-schema.sql'):
+            with open(os.path.join(REPO_DIR, 'sql', name)) as f:
+                # The schema files start with a MySQL style USE statement
+                statements = '\n'.join(line for line in f.read().splitlines() if not line.strip().upper().startswith('USE '))
+            cursor.execute(statements)
+    connection.close()
+    return bench_dsn
+
+
+def drop_database(dsn: str, database: str) -> None:
+    admin = psycopg2.connect(dsn)
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        cursor.execute(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)')
+    admin.close()
+
+
+def check_findings(dsn: str, args) -> List[str]:
+    """
+    Every finding of the last round is reported by the source, so every one of them must be stored,
+    including the closed ones older than the retention period (finding 0 of each service)
+    Returns:
+        List[str]: Problems found, empty when the findings are complete
+    """
+    expected = {
+        finding_arn(account_number(index), service, i)
+        for index in range(args.accounts) for service in SECURITY for i in range(args.findings // 2)
+    }
+    connection = psycopg2.connect(dsn)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT finding_id FROM findings WHERE finding_id = ANY(%s)", (list(expected),))
+        stored = {row[0] for row in cursor.fetchall()}
+    connection.close()
+
+    missing = expected - stored
+    pinned  = sorted(f for f in missing if f.endswith('-00000000'))
+    if not missing:
+        return []
+    return [f"{len(missing)} reported finding(s) missing from findings, {len(pinned)} of them closed past retention (e.g. {sorted(missing)[0]})"]
+
+
+def check_tables(dsn: str, args) -> Dict[str, int]:
+    """
+    Row count of every table the payloads fill
+    Returns:
+        Dict[str, int]: Table -> rows, tables the benchmark arguments leave empty are not counted
+    """
+    counts      = {}
+    connection  = psycopg2.connect(dsn)
+    with connection.cursor() as cursor:
+        for table, argument in TABLES.items():
+            if getattr(args, argument) > 0:
+                cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                counts[table] = cursor.fetchone()[0]
+    connection.close()
+    return counts
+
+
+""" 4. BENCHMARK """
+def import_lambda(args) -> Any:
+    """Import lambda_function with the benchmark environment"""
+    os.environ.update({
+        'AWS_DEFAULT_REGION'    : REGION,
+        'AWS_ACCESS_KEY_ID'     : 'bench',
+        'AWS_SECRET_ACCESS_KEY' : 'bench',
+        'REGION'                : REGION,
+        'DB_NAME'               : 'core',
+        'AURORA_CLUSTER_ARN'    : f"arn:aws:rds:{REGION}:{MOTO_ACCOUNT}:cluster:bench",
+        'AURORA_SECRET_ARN'     : f"arn:aws:secretsmanager:{REGION}:{MOTO_ACCOUNT}:secret:bench",
+        'SQS_QUEUE_ARN'         : f"arn:aws:sqs:{REGION}:{MOTO_ACCOUNT}:{QUEUE_NAME}",
+        'BUCKET'                : BUCKET_NAME,
+        'FILE_CONCURRENCY'      : str(args.concurrency),
+    })
+    # moto answers long polls by sleeping, keep the drain from waiting on an empty queue
+    os.environ.setdefault('RECEIVE_WAIT_SECONDS', '1')
+    return importlib.import_module('lambda_function')
+
+
+def run_round(lf, args, revision: int, failures: LoaderFailures) -> Dict[str, Any]:
+    """Upload one file per account, queue them and invoke the loader until the queue is empty"""
+    s3      = boto3.client('s3', region_name=REGION)
+    sqs     = boto3.client('sqs', region_name=REGION)
+    url     = sqs.get_queue_url(QueueName=QUEUE_NAME)['QueueUrl']
+
+    upload_started = time.perf_counter()
+    for index in range(args.accounts):
+        payload = account_payload(random.Random(f"{args.seed}:{index}"), index, args.services, args.cost_reports,
+                                  args.findings, args.log_messages, revision, args.change_ratio)
+        key     = f"round-{revision}/{payload['account']['account_id']}.json"
+        s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=json.dumps(payload).encode())
+        sqs.send_message(QueueUrl=url, MessageBody=json.dumps({'path': f"s3://{BUCKET_NAME}/{key}"}))
+    upload_seconds = time.perf_counter() - upload_started
+
+    totals      = {'TOTAL': 0, 'LOADED': 0, 'DUPLICATES': 0, 'CREATED': 0, 'UPDATED': 0, 'SKIPPED': 0}
+    started     = time.perf_counter()
+    invocations = 0
+    while True:
+        stats = lf.CoreUpdateDb().load_from_sqs(max_messages=args.max_messages)
+        invocations += 1
+        for key in totals:
+            totals[key] += int(stats.get(key) or 0)
+        if not stats.get('TOTAL'):
+            break
+
+    # A failed file stays invisible on the queue, every file sent must be loaded or dropped as a duplicate
+    problems = [f"loader failure: {failure}" for failure in failures.take()]
+    if totals['LOADED'] + totals['DUPLICATES'] < args.accounts:
+        problems.append(f"{args.accounts - totals['LOADED'] - totals['DUPLICATES']} of {args.accounts} file(s) not loaded")
+
+    return {'revision': revision, 'invocations': invocations, 'upload_seconds': upload_seconds,
+            'seconds': time.perf_counter() - started, 'problems': problems, **totals}
+
+
+def report(summary: Dict[str, Any], rounds: List[Dict], tables: Dict[str, int], problems: List[str],
+           shim: RdsDataShim, args) -> Dict[str, Any]:
+    """Print the stage table (lambda_function.METRICS summary) and the checks, return the full result"""
+    stages          = summary['stages']
+    total_seconds   = sum(r['seconds'] for r in rounds)
+    total_rows      = sum(stage['rows'] for stage in stages.values())
+
+    print()
+    print(f"{'stage':<12}{'count':>8}{'seconds':>10}{'rows':>10}{'rows/s':>12}{'rds-data':>10}{'sqs':>6}{'s3':>6}{'peak MB':>10}")
+    for name in STAGES + sorted(set(stages) - set(STAGES)):
+        stage = stages.get(name)
+        if not stage:
+            continue
+        calls   = {service: counters['calls'] for service, counters in stage['services'].items()}
+        seconds = stage['duration_ms'] / 1000
+        rate    = stage['rows'] / seconds if seconds and stage['rows'] else 0
+        peak    = f"{stage['peak_memory_mb']:.1f}" if 'peak_memory_mb' in stage else '-'
+        print(f"{name:<12}{stage['count']:>8}{seconds:>10.3f}{stage['rows']:>10}{rate:>12.0f}"
+              f"{calls.get('rds-data', 0):>10}{calls.get('sqs', 0):>6}{calls.get('s3', 0):>6}{peak:>10}")
+
+    print()
+    for r in rounds:
+        print(f"Round {r['revision'] + 1}: {r['LOADED']}/{args.accounts} files loaded ({r['DUPLICATES']} duplicate) in {r['seconds']:.3f}s "
+              f"over {r['invocations']} invocation(s) - created {r['CREATED']}, updated {r['UPDATED']}, skipped {r['SKIPPED']}")
+        for problem in r['problems']:
+            print(f"    FAILED: {problem}")
+    print(f"Total: {total_rows} rows in {total_seconds:.3f}s ({total_rows / total_seconds if total_seconds else 0:.0f} rows/s), "
+          f"Data API calls {sum(shim.calls.values())} {shim.calls}, peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    print(f"Tables: {', '.join(f'{table} {rows}' for table, rows in tables.items())}")
+    for problem in problems:
+        print(f"FAILED: {problem}")
+    print("Result: FAILED" if problems or any(r['problems'] for r in rounds) else "Result: OK")
+
+    return {
+        'parameters'    : vars(args),
+        'rounds'        : rounds,
+        'stages'        : stages,
+        'data_api_calls': shim.calls,
+        'tables'        : tables,
+        'problems'      : problems,
+        'total_rows'    : total_rows,
+        'total_seconds' : total_seconds,
+        'peak_rss_mb'   : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description='Benchmark CoreUpdateDb.load_from_sqs against a local PostgreSQL')
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_DSN', 'postgresql://postgres@localhost:5432/postgres'),
+                        help='Server to create the benchmark database on (default: BENCH_DSN)')
+    parser.add_argument('--database', default='agency360_bench', help='Benchmark database name, dropped and recreated')
+    parser.add_argument('--keep-db', action='store_true', help='Keep the benchmark database for inspection')
+    parser.add_argument('--accounts', type=int, default=10, help='Account files per round')
+    parser.add_argument('--services', type=int, default=100, help='Services rows per account')
+    parser.add_argument('--cost-reports', type=int, default=3, help='Cost reports per account')
+    parser.add_argument('--findings', type=int, default=1000, help='Findings per account (split over two services)')
+    parser.add_argument('--log-messages', type=int, default=10, help='Log messages per account')
+    parser.add_argument('--rounds', type=int, default=2, help='Rounds, the first inserts and later ones resend the accounts')
+    parser.add_argument('--change-ratio', type=float, default=0.1, help='Share of values changed per later round')
+    parser.add_argument('--concurrency', type=int, default=4, help='FILE_CONCURRENCY of the loader')
+    parser.add_argument('--max-messages', type=int, default=100, help='Messages drained per load_from_sqs call')
+    parser.add_argument('--seed', default='agency360', help='Payload seed')
+    parser.add_argument('--no-trace-memory', dest='trace_memory', action='store_false',
+                        help='Do not trace the memory peak per stage (tracemalloc slows the loader down)')
+    parser.add_argument('--json', dest='json_path', help='Also write the results to this file')
+    args = parser.parse_args(argv)
+
+    bench_dsn   = create_database(args.dsn, args.database)
+    failures    = LoaderFailures()
+    shim        = None
+
+    try:
+        with mock_aws():
+            boto3.client('s3', region_name=REGION).create_bucket(Bucket=BUCKET_NAME)
+            boto3.client('sqs', region_name=REGION).create_queue(QueueName=QUEUE_NAME, Attributes={'VisibilityTimeout': '300'})
+
+            lf      = import_lambda(args)
+            shim    = MeteredRdsDataShim(bench_dsn, lf.METRICS, max_connections=max(4, args.concurrency * 2 + 2))
+            lf._CLIENTS[('rds-data', REGION)] = shim
+            watch_loaders(lf, failures)
+
+            # One METRICS for the whole run, the handler would reset it per invocation
+            lf.METRICS.reset(memory=args.trace_memory)
+            rounds = []
+            for revision in range(args.rounds):
+                rounds.append(run_round(lf, args, revision, failures))
+                rounds[-1]['problems'] += check_findings(bench_dsn, args)
+
+            tables      = check_tables(bench_dsn, args)
+            problems    = [f"table {table} is empty" for table, rows in tables.items() if rows == 0]
+            result      = report(lf.METRICS.summary(), rounds, tables, problems, shim, args)
+    finally:
+        if shim is not None:
+            shim.close()
+        if not args.keep_db:
+            drop_database(args.dsn, args.database)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(result, f, indent=4, default=str)
+
+    if result['problems'] or any(r['problems'] for r in rounds):
+        raise SystemExit(1)
+    return result
+
+
+if __name__ == '__main__':
+    main()
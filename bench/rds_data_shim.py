@@ -0,0 +1,221 @@
+"""
+RDS Data API stand-in backed by a local PostgreSQL
+Implements the subset of the boto3 'rds-data' client used by DBManager (execute_statement,
+batch_execute_statement and the transaction calls) on top of a psycopg2 connection pool, so the
+Receiver Lambda can run unchanged against a database on a plain Linux box.
+
+Differences from the real Data API worth knowing when reading benchmark numbers:
+    - stringValue parameters are sent as untyped literals, PostgreSQL infers their type
+    - there is no HTTP round trip, the 'calls' counters are the number of Data API requests made
+"""
+import json
+import re
+import threading
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from botocore.exceptions import ClientError
+
+# Named parameters (:name) outside of casts (::type)
+PARAMETER_PATTERN   = re.compile(r'(?<![:\w]):([A-Za-z_]\w*)')
+
+# PostgreSQL type OIDs mapped to the typeName the Data API reports in columnMetadata
+TYPE_NAMES          =   {
+                            16      : 'bool',
+                            20      : 'int8',
+                            21      : 'int2',
+                            23      : 'int4',
+                            25      : 'text',
+                            700     : 'float4',
+                            701     : 'float8',
+                            1043    : 'varchar',
+                            1082    : 'date',
+                            1114    : 'timestamp',
+                            1184    : 'timestamptz',
+                            1700    : 'numeric',
+                            1009    : '_text',
+                            1015    : '_varchar',
+                            3802    : 'jsonb',
+                        }
+
+
+class RdsDataShim:
+    def __init__(self, dsn: str, max_connections: int = 20):
+        """
+        Initialize the shim with a connection pool to the local database
+        Args:
+            dsn (str): psycopg2 connection string of the benchmark database
+            max_connections (int): Pool size, at least the Lambda FILE_CONCURRENCY
+        """
+        self.pool           = ThreadedConnectionPool(1, max_connections, dsn)
+        self.transactions   = {}
+        self.lock           = threading.Lock()
+        self.calls          = {}
+
+    def close(self) -> None:
+        """Close all pooled connections"""
+        self.pool.closeall()
+
+    def _count(self, operation: str) -> None:
+        """Count one Data API request"""
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+
+    @staticmethod
+    def _decode_parameter(value: Dict) -> Any:
+        """Python value of a Data API parameter value"""
+        if value.get('isNull'):
+            return None
+        for key in ('stringValue', 'longValue', 'doubleValue', 'booleanValue'):
+            if key in value:
+                return value[key]
+        if 'arrayValue' in value:
+            return next(iter(value['arrayValue'].values()), [])
+        return None
+
+    def _bind(self, sql: str, parameters: Optional[List[Dict]]) -> Tuple[str, Dict[str, Any]]:
+        """Rewrite :name placeholders to psycopg2 %(name)s and decode the parameter values"""
+        values  = {param['name']: self._decode_parameter(param['value']) for param in parameters or []}
+        sql     = sql.replace('%', '%%')
+        sql     = PARAMETER_PATTERN.sub(lambda m: f"%({m.group(1)})s" if m.group(1) in values else m.group(0), sql)
+        return sql, values
+
+    @staticmethod
+    def _json_value(value: Any) -> Any:
+        """Value as the Data API writes it in formattedRecords"""
+        if isinstance(value, Decimal):
+            return str(value)
+        if isinstance(value, datetime):
+            if value.tzinfo:
+                value = value.astimezone(timezone.utc).replace(tzinfo=None)
+            return value.isoformat(sep=' ')
+        if isinstance(value, date):
+            return value.isoformat()
+        return value
+
+    def _field(self, value: Any) -> Dict:
+        """Value as the Data API writes it in records / generatedFields"""
+        if value is None:
+            return {'isNull': True}
+        if isinstance(value, bool):
+            return {'booleanValue': value}
+        if isinstance(value, int):
+            return {'longValue': value}
+        if isinstance(value, float):
+            return {'doubleValue': value}
+        if isinstance(value, list):
+            return {'arrayValue': {'stringValues': [str(item) for item in value]}}
+        return {'stringValue': str(self._json_value(value))}
+
+    @staticmethod
+    def _client_error(error: psycopg2.Error, operation: str) -> ClientError:
+        """psycopg2 error raised the way the Data API reports database errors"""
+        message = (error.pgerror or str(error)).strip()
+        return ClientError(
+            {'Error': {'Code': 'BadRequestException', 'Message': f"{message}; SQLState: {error.pgcode}"}},
+            operation
+        )
+
+    def _run(self, connection, sql: str, parameters: Optional[List[Dict]]) -> Tuple[List[Tuple], List, int]:
+        """Execute one statement, returning rows, cursor description and affected row count"""
+        query, values = self._bind(sql, parameters)
+        with connection.cursor() as cursor:
+            cursor.execute(query, values)
+            rows = cursor.fetchall() if cursor.description else []
+            return rows, cursor.description or [], cursor.rowcount
+
+    def _with_connection(self, transaction_id: Optional[str], operation: str, work):
+        """Run work(connection) on the transaction connection or on a pooled connection in its own transaction"""
+        if transaction_id:
+            connection = self.transactions.get(transaction_id)
+            if connection is None:
+                raise ClientError({'Error': {'Code': 'BadRequestException', 'Message': 'Transaction not found'}}, operation)
+            try:
+                return work(connection)
+            except psycopg2.Error as e:
+                raise self._client_error(e, operation)
+
+        connection = self.pool.getconn()
+        try:
+            result = work(connection)
+            connection.commit()
+            return result
+        except psycopg2.Error as e:
+            connection.rollback()
+            raise self._client_error(e, operation)
+        finally:
+            self.pool.putconn(connection)
+
+    def execute_statement(self, sql: str, parameters: Optional[List[Dict]] = None, transactionId: Optional[str] = None,
+                          formatRecordsAs: str = 'NONE', includeResultMetadata: bool = False, **kwargs) -> Dict:
+        """rds-data ExecuteStatement"""
+        self._count('execute_statement')
+        rows, description, rowcount = self._with_connection(
+            transactionId, 'ExecuteStatement', lambda connection: self._run(connection, sql, parameters)
+        )
+
+        response = {'numberOfRecordsUpdated': max(rowcount, 0)}
+        if includeResultMetadata and description:
+            response['columnMetadata'] = [
+                {'name': column.name, 'label': column.name, 'typeName': TYPE_NAMES.get(column.type_code, 'text')}
+                for column in description
+            ]
+
+        if formatRecordsAs == 'JSON':
+            names = [column.name for column in description]
+            response['formattedRecords'] = json.dumps(
+                [{name: self._json_value(value) for name, value in zip(names, row)} for row in rows]
+            )
+        elif description:
+            response['records'] = [[self._field(value) for value in row] for row in rows]
+
+        return response
+
+    def batch_execute_statement(self, sql: str, parameterSets: List[List[Dict]], transactionId: Optional[str] = None,
+                                **kwargs) -> Dict:
+        """rds-data BatchExecuteStatement, all parameter sets run in one transaction"""
+        self._count('batch_execute_statement')
+
+        def work(connection):
+            results = []
+            for parameters in parameterSets:
+                rows, description, rowcount = self._run(connection, sql, parameters)
+                results.append({'generatedFields': [self._field(value) for value in rows[0]] if rows else []})
+            return results
+
+        return {'updateResults': self._with_connection(transactionId, 'BatchExecuteStatement', work)}
+
+    def begin_transaction(self, **kwargs) -> Dict:
+        """rds-data BeginTransaction, the transaction keeps a pooled connection until commit or rollback"""
+        self._count('begin_transaction')
+        transaction_id = uuid.uuid4().hex
+        with self.lock:
+            self.transactions[transaction_id] = self.pool.getconn()
+        return {'transactionId': transaction_id}
+
+    def _end_transaction(self, transaction_id: str, commit: bool) -> Dict:
+        """Commit or roll back a transaction and return its connection to the pool"""
+        with self.lock:
+            connection = self.transactions.pop(transaction_id, None)
+        if connection is None:
+            raise ClientError({'Error': {'Code': 'BadRequestException', 'Message': 'Transaction not found'}},
+                              'CommitTransaction' if commit else 'RollbackTransaction')
+        try:
+            connection.commit() if commit else connection.rollback()
+        finally:
+            self.pool.putconn(connection)
+        return {'transactionStatus': 'Transaction Committed' if commit else 'Rollback Complete'}
+
+    def commit_transaction(self, transactionId: str, **kwargs) -> Dict:
+        """rds-data CommitTransaction"""
+        self._count('commit_transaction')
+        return self._end_transaction(transactionId, commit=True)
+
+    def rollback_transaction(self, transactionId: str, **kwargs) -> Dict:
+        """rds-data RollbackTransaction"""
+        self._count('rollback_transaction')
+        return self._end_transaction(transactionId, commit=False)
@@ -5,9 +5,24 @@ load_dotenv()
 import boto3
 import json
 import os
-from typing import List, Dict, Any, Optional, Union
+import copy
+import codecs
+import hashlib
+import io
+import random
+import re
+import time
+import threading
+import cProfile
+import pstats
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Union, Iterator, Tuple, Callable
+from botocore.config import Config
 from botocore.exceptions import ClientError
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, date, timezone
 from urllib.parse import urlparse
 
 """ GLOBAL VARIABLES """
@@ -23,6 +38,51 @@ ARN_SQS         = os.environ.get("SQS_QUEUE_ARN")
 REGION          = os.environ.get("REGION")
 BUCKET          = os.environ.get("BUCKET")
 
+UPSERT_CHUNK_SIZE   = int(os.environ.get("UPSERT_CHUNK_SIZE", 200))     # Rows per multi-row INSERT ... ON CONFLICT
+BATCH_MAX_ROWS      = int(os.environ.get("BATCH_MAX_ROWS", 500))        # Parameter sets per batch_execute_statement
+BATCH_MAX_BYTES     = int(os.environ.get("BATCH_MAX_BYTES", 1000000))   # Request size budget per batch_execute_statement (Data API limit is larger)
+
+RECEIVE_WAIT_SECONDS    = int(os.environ.get("RECEIVE_WAIT_SECONDS", 5))        # SQS long polling wait per receive call (max 20)
+RECEIVE_CONCURRENCY     = int(os.environ.get("RECEIVE_CONCURRENCY", 4))         # Receive calls in flight while draining the queue
+DRAIN_BUDGET_RATIO      = float(os.environ.get("DRAIN_BUDGET_RATIO", 0.2))      # Share of the remaining Lambda time spent draining
+DRAIN_BUDGET_SECONDS    = int(os.environ.get("DRAIN_BUDGET_SECONDS", 30))       # Drain budget when no Lambda context is available
+FILE_CONCURRENCY        = int(os.environ.get("FILE_CONCURRENCY", 4))            # Account files processed at the same time
+
+STREAM_THRESHOLD_BYTES  = int(os.environ.get("STREAM_THRESHOLD_BYTES", 16777216))   # Files larger than this are parsed incrementally
+STREAM_READ_BYTES       = int(os.environ.get("STREAM_READ_BYTES", 1048576))         # Bytes read from the S3 body per chunk
+STREAM_FINDINGS_CHUNK   = int(os.environ.get("STREAM_FINDINGS_CHUNK", 1000))        # Findings handed to the loader at a time
+
+CLIENT_POOL_SIZE        = int(os.environ.get("CLIENT_POOL_SIZE", 50))           # HTTP connections kept per boto3 client
+HEALTH_CHECK_TTL        = int(os.environ.get("HEALTH_CHECK_TTL", 900))          # Seconds a passed health check is trusted
+QUERY_CACHE_SIZE        = int(os.environ.get("QUERY_CACHE_SIZE", 256))          # Prepared queries kept by DBManager
+COST_TOLERANCE          = 0.0001                                                # Smallest cost difference treated as a change
+FINDINGS_RETENTION_DAYS = int(os.environ.get("FINDINGS_RETENTION_DAYS", 90))    # Closed findings not reported for this many days are purged, 0 keeps them
+MATERIALIZED_VIEWS      = [view.strip() for view in os.environ.get("MATERIALIZED_VIEWS", "mview_summary").split(',') if view.strip()]   # Refreshed after a load that changed rows
+VIEW_REFRESH_INTERVAL   = int(os.environ.get("VIEW_REFRESH_INTERVAL", 300))     # Minimum seconds between two refreshes of a materialized view, changes in between wait for the next one
+
+SNAPSHOT_PAGE_BYTES     = int(os.environ.get("SNAPSHOT_PAGE_BYTES", 800000))    # Worst-case bytes per account snapshot page (Data API responses are limited to 1 MB)
+INGEST_LEDGER           = os.environ.get("INGEST_LEDGER", "true").lower() == "true"   # Skip redelivered messages and unchanged sections using the ingest_ledger table
+
+METRICS_NAMESPACE       = os.environ.get("METRICS_NAMESPACE", "Agency360/Receiver")   # CloudWatch namespace of the stage metrics (Embedded Metric Format)
+PROFILE_TOP_N           = int(os.environ.get("PROFILE_TOP_N", 25))                   # Functions / allocation sites reported by a 'profile' invocation
+
+RETRY_MAX_ATTEMPTS      = int(os.environ.get("RETRY_MAX_ATTEMPTS", 6))          # Attempts per Data API call on throttling / statement timeouts
+RETRY_RESUME_ATTEMPTS   = int(os.environ.get("RETRY_RESUME_ATTEMPTS", 10))      # Attempts per Data API call while a paused cluster resumes
+RETRY_BASE_DELAY        = float(os.environ.get("RETRY_BASE_DELAY", 0.2))        # Seconds, first backoff step (doubles per attempt)
+RETRY_RESUME_DELAY      = float(os.environ.get("RETRY_RESUME_DELAY", 1.0))      # Seconds, first backoff step while the cluster resumes
+RETRY_MAX_DELAY         = float(os.environ.get("RETRY_MAX_DELAY", 8.0))         # Seconds, longest single backoff
+RETRY_BUDGET            = int(os.environ.get("RETRY_BUDGET", 100))              # Data API retries allowed per invocation, then errors surface
+DB_MAX_IN_FLIGHT        = int(os.environ.get("DB_MAX_IN_FLIGHT", 8))            # Concurrent Data API calls, halved on throttling and regained on success
+
+ACK_SQS_BATCH           = 10                                                    # Receipt handles per delete_message_batch (SQS limit)
+ACK_S3_BATCH            = 1000                                                  # Keys per delete_objects (S3 limit)
+ACK_FLUSH_SECONDS       = float(os.environ.get("ACK_FLUSH_SECONDS", 5))         # Oldest buffered acknowledgement is flushed after this many seconds
+
+PARTITION_MONTHS_AHEAD      = int(os.environ.get("PARTITION_MONTHS_AHEAD", 3))         # Monthly partitions created ahead of the current month
+SERVICES_RETENTION_MONTHS   = int(os.environ.get("SERVICES_RETENTION_MONTHS", 0))      # services partitions older than this are dropped, 0 keeps them
+LOGS_RETENTION_MONTHS       = int(os.environ.get("LOGS_RETENTION_MONTHS", 0))          # logs / log_messages partitions older than this are dropped, 0 keeps them
+PARTITION_MAINTENANCE_TTL   = int(os.environ.get("PARTITION_MAINTENANCE_TTL", 21600))  # Seconds between partition maintenance runs per container
+
 AWS_TYPECASTS   =   {
                         'created_at': 'timestamp with time zone',
                         'updated_at': 'timestamp with time zone',
@@ -74,6 +134,66 @@ TYPE_CASTING    =   {
                         'numeric'                   : AWS_TYPECAST_2['numeric']
                     }
 
+# Reverse lookup column -> PostgreSQL type built from TYPE_CASTING
+POSTGRES_TYPES  =   {col: pg_type for pg_type, columns in TYPE_CASTING.items() for col in columns}
+
+""" CLIENT REGISTRY """
+# Clients live at module level so warm Lambda invocations reuse them (and their open connections)
+_SESSION        = None
+_CLIENTS        = {}
+_QUEUE_URLS     = {}
+_CLIENTS_LOCK   = threading.Lock()
+
+def _client_config(service_name: Optional[str] = None) -> Config:
+    """
+    Connection pool sized for the concurrent loaders, with TCP keep-alive where botocore supports it
+    rds-data calls are retried by DataApiRetry, botocore's own retries are turned off for it
+    """
+    options = {'max_pool_connections': CLIENT_POOL_SIZE}
+    if service_name == 'rds-data':
+        options['retries'] = {'max_attempts': 0}
+    try:
+        return Config(tcp_keepalive=True, **options)
+    except TypeError:
+        return Config(**options)
+
+def get_client(service_name: str, region_name: Optional[str] = None):
+    """
+    Return the shared boto3 client for a service and region, creating it on first use
+    Args:
+        service_name (str): boto3 service name, e.g. 'rds-data'
+        region_name (str, optional): Region, defaults to the session region
+    Returns:
+        The cached boto3 client
+    """
+    global _SESSION
+    key = (service_name, region_name)
+    client = _CLIENTS.get(key)
+    if client is not None:
+        return client
+
+    # Session and client creation are not thread-safe
+    with _CLIENTS_LOCK:
+        if key not in _CLIENTS:
+            if _SESSION is None:
+                _SESSION = boto3.session.Session()
+            client = _SESSION.client(service_name, region_name=region_name, config=_client_config(service_name))
+            # Every request is counted against the stage that made it (see StageMetrics)
+            client.meta.events.register('before-send', METRICS.on_request)
+            client.meta.events.register('after-call', METRICS.on_response)
+            _CLIENTS[key] = client
+        return _CLIENTS[key]
+
+# Accounts already in the database: account_id -> (primary key, content hash), kept across warm invocations
+_ACCOUNT_CACHE      = {}
+_ACCOUNT_CACHE_LOCK = threading.Lock()
+_ACCOUNT_CACHE_WARM = {'loaded': False}
+
+# Monthly partitions known to exist: (table, 'YYYY-MM'), and the last partition maintenance run
+_PARTITIONS             = set()
+_PARTITIONS_LOCK        = threading.Lock()
+_PARTITION_MAINTENANCE  = {'ran_at': None}
+
 """ HELPER CLASSES """
 
 """ 1. SQS MANAGER """
@@ -88,17 +208,21 @@ class SQSManager:
         self.region = queue_arn.split(':')[3]
         self.account_id = queue_arn.split(':')[4]
         self.queue_name = queue_arn.split(':')[-1]
-        self.sqs = boto3.client('sqs', region_name=self.region)
+        self.sqs = get_client('sqs', region_name=self.region)
         self.queue_url = self._get_queue_url()
 
     def _get_queue_url(self) -> str:
         """
-        Get queue URL from ARN
+        Get queue URL from ARN, resolved once per container
         Returns:
             str: Queue URL
         """
+        if self.queue_arn in _QUEUE_URLS:
+            return _QUEUE_URLS[self.queue_arn]
+
         try:
             response = self.sqs.get_queue_url(QueueName=self.queue_name,QueueOwnerAWSAccountId=self.account_id)
+            _QUEUE_URLS[self.queue_arn] = response['QueueUrl']
             return response['QueueUrl']
         except ClientError as e:
             print(f"{ERROR} Error getting queue URL: {e}")
@@ -245,6 +369,37 @@ class SQSManager:
             print(f"{ERROR} Error deleting message: {e}")
             return False
 
+    def delete_message_batch(self, receipt_handles: List[str]) -> Dict[str, List]:
+        """
+        Delete messages from the queue, ACK_SQS_BATCH receipt handles per call
+        Args:
+            receipt_handles (List[str]): Receipt handles of the messages to delete
+        Returns:
+            Dict[str, List]: Successful and failed receipt handles
+        """
+        successful  = []
+        failed      = []
+        for start in range(0, len(receipt_handles), ACK_SQS_BATCH):
+            chunk = receipt_handles[start:start + ACK_SQS_BATCH]
+            try:
+                response = self.sqs.delete_message_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[{'Id': str(i), 'ReceiptHandle': handle} for i, handle in enumerate(chunk)]
+                )
+
+                successful += [chunk[int(entry['Id'])] for entry in response.get('Successful', [])]
+                for entry in response.get('Failed', []):
+                    print(f"{FAIL} Batch delete of message entry {entry['Id']} failed: {entry.get('Code')} {entry.get('Message', '')}")
+                    failed.append(chunk[int(entry['Id'])])
+            except ClientError as e:
+                print(f"{ERROR} Error deleting message batch: {e}")
+                failed += chunk
+
+        return {
+            'successful': successful,
+            'failed': failed
+        }
+
     def purge_queue(self) -> bool:
         """
         Purge all messages from the queue
@@ -263,30 +418,132 @@ class SQSManager:
                 print(f"{ERROR} Error purging queue: {e}")
             return False
 
-""" 2. TEST AWS SERVICES MANAGER """
+""" 2. ACKNOWLEDGEMENT BUFFER """
+class AckBuffer:
+    def __init__(self, sqs: SQSManager, s3_client):
+        """
+        Collect the SQS messages and S3 files of loaded messages and delete them in batches,
+        delete_objects (ACK_S3_BATCH keys per call) and delete_message_batch (ACK_SQS_BATCH per call)
+        A flush happens when a batch is full, when the oldest entry is ACK_FLUSH_SECONDS old and at the
+        end of the invocation. Files are deleted before their messages, a message whose delete is lost
+        is redelivered and recognised by the ingest ledger
+        Args:
+            sqs (SQSManager): Queue the messages belong to
+            s3_client: Shared S3 client
+        """
+        self.sqs                = sqs
+        self.s3_client          = s3_client
+        self.lock               = threading.Lock()
+        self.receipt_handles    = []
+        self.objects            = {}
+        self.oldest             = None
+
+    def add(self, receipt_handle: Optional[str] = None, s3_path: Optional[str] = None) -> None:
+        """
+        Buffer a message and / or a file for deletion, flushes when a batch is full or the oldest entry is due
+        Args:
+            receipt_handle (str, optional): Receipt handle of the SQS message
+            s3_path (str, optional): s3://bucket-name/path/to/file.json
+        """
+        with self.lock:
+            if receipt_handle:
+                self.receipt_handles.append(receipt_handle)
+            if s3_path:
+                parsed_url = urlparse(s3_path)
+                self.objects.setdefault(parsed_url.netloc, []).append(parsed_url.path.lstrip('/'))
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+
+            due = (
+                    len(self.receipt_handles) >= ACK_SQS_BATCH
+                    or any(len(keys) >= ACK_S3_BATCH for keys in self.objects.values())
+                    or time.monotonic() - self.oldest >= ACK_FLUSH_SECONDS
+                  )
+
+        if due:
+            self.flush()
+
+    def _delete_objects(self, bucket: str, keys: List[str]) -> List[str]:
+        """Delete keys of a bucket in batches, keys failing in a batch are retried one by one; returns the keys left"""
+        failed = []
+        for start in range(0, len(keys), ACK_S3_BATCH):
+            chunk = keys[start:start + ACK_S3_BATCH]
+            try:
+                response    = self.s3_client.delete_objects(
+                                Bucket=bucket,
+                                Delete={'Objects': [{'Key': key} for key in chunk], 'Quiet': True}
+                              )
+                retry       = [error['Key'] for error in response.get('Errors', [])]
+            except ClientError as e:
+                print(f"{FAIL} Batch delete of {len(chunk)} file(s) in {bucket} failed: {e}")
+                retry       = chunk
+
+            for key in retry:
+                try:
+                    self.s3_client.delete_object(Bucket=bucket, Key=key)
+                except Exception as e:
+                    print(f"{ERROR} Could not delete s3://{bucket}/{key}: {str(e)}")
+                    failed.append(key)
+
+        return failed
+
+    def flush(self) -> Dict[str, int]:
+        """
+        Delete everything buffered, files first
+        Returns:
+            Dict[str, int]: Deleted messages and files and the entries that could not be deleted
+        """
+        with self.lock:
+            receipt_handles, self.receipt_handles   = self.receipt_handles, []
+            objects, self.objects                   = self.objects, {}
+            self.oldest                             = None
+
+        counts = {'messages': 0, 'objects': 0, 'failed': 0}
+
+        for bucket, keys in objects.items():
+            failed              = self._delete_objects(bucket, keys)
+            counts['objects']   += len(keys) - len(failed)
+            counts['failed']    += len(failed)
+
+        if receipt_handles:
+            result              = self.sqs.delete_message_batch(receipt_handles)
+            counts['messages']  += len(result['successful'])
+            for receipt_handle in result['failed']:
+                if self.sqs.delete_message(receipt_handle=receipt_handle):
+                    counts['messages'] += 1
+                else:
+                    counts['failed'] += 1
+
+        if counts['failed']:
+            print(f"{ERROR} {counts['failed']} message(s) / file(s) could not be deleted, they are handled again on redelivery")
+
+        return counts
+
+""" 3. TEST AWS SERVICES MANAGER """
 class TestAwsServices:
     def __init__(self, params=None):
         # Get current date and 30 days ago for CE
         self.end_date           = datetime.now()
         self.start_date         = self.end_date - timedelta(days=30)
+        # rds-data and s3 are tested by closing a client, so they get their own instead of the shared ones
         self.agency360_services    = {
                                     'sts'                : {
                                                             'name'      : 'STS',
-                                                            'client'    : boto3.client('sts'),
+                                                            'client'    : get_client('sts'),
                                                             'action'    : 'get_caller_identity',
                                                             'params'    : params,
                                                             'status'    : False,
                                                         },
                                     'account'            : {
                                                             'name'      : 'Account',
-                                                            'client'    : boto3.client('account'),
+                                                            'client'    : get_client('account'),
                                                             'action'    : 'get_contact_information',
                                                             'params'    : params,
                                                             'status'    : False
                                                         },
                                     'sqs'                : {
                                                             'name'      : 'SQS',
-                                                            'client'    : boto3.client('sqs', region_name=REGION),
+                                                            'client'    : get_client('sqs', region_name=REGION),
                                                             'action'    : 'list_queues',
                                                             'params'    : params,
                                                             'status'    : False
@@ -349,14 +606,149 @@ class TestAwsServices:
         else:
             return True
 
-""" 3. DB MANAGER """
+""" 4. DATA API RETRY """
+class DataApiRetry:
+    # Error codes by how they are retried
+    RESUMING    = ('DatabaseResumingException', 'DatabaseUnavailableException')
+    THROTTLED   = ('ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailableError', 'InternalServerErrorException')
+    TIMEOUT     = ('StatementTimeoutException',)
+    # Errors that can arrive after the statement ran and committed, only retried for idempotent calls
+    UNCERTAIN   = ('InternalServerErrorException', 'ServiceUnavailableError')
+
+    def __init__(self):
+        """
+        Retry layer shared by every DBManager call to the Data API
+        Retryable errors (cluster resuming, throttling, statement timeouts) are retried with jittered
+        exponential backoff within a per-invocation budget. Errors that do not prove the statement never
+        ran (internal errors, a dropped connection) are only retried for idempotent calls. Calls in flight are limited by an adaptive
+        limit that is halved when the database pushes back and grows back by one per limit successes,
+        so concurrent loaders slow down instead of failing
+        """
+        self.condition  = threading.Condition()
+        self.in_flight  = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """Start a new invocation with the full retry budget and concurrency limit"""
+        with self.condition:
+            self.budget = RETRY_BUDGET
+            self.limit  = float(max(1, DB_MAX_IN_FLIGHT))
+            self.condition.notify_all()
+
+    @classmethod
+    def classify(cls, error: Exception) -> Optional[str]:
+        """
+        Retry reason of a Data API error
+        Returns:
+            Optional[str]: 'resuming', 'throttled', 'timeout' or None if the error is not retryable
+        """
+        code    = getattr(error, 'response', {}).get('Error', {}).get('Code', '') if isinstance(error, ClientError) else ''
+        message = str(error)
+
+        if code in cls.RESUMING or 'is resuming' in message or 'Communications link failure' in message:
+            return 'resuming'
+        if code in cls.THROTTLED or 'Rate exceeded' in message:
+            return 'throttled'
+        if code in cls.TIMEOUT:
+            return 'timeout'
+        return None
+
+    @classmethod
+    def may_have_run(cls, error: Exception) -> bool:
+        """True when a Data API error does not prove the statement never ran, a retry could apply it twice"""
+        code = getattr(error, 'response', {}).get('Error', {}).get('Code', '') if isinstance(error, ClientError) else ''
+        return code in cls.UNCERTAIN or 'Communications link failure' in str(error)
+
+    def _acquire(self) -> None:
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def _release(self, pushed_back: bool) -> None:
+        """Return a slot, halve the limit when the database pushed back, otherwise grow it additively"""
+        with self.condition:
+            self.in_flight -= 1
+            if pushed_back:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(max(1, DB_MAX_IN_FLIGHT)), self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def _take_budget(self) -> bool:
+        with self.condition:
+            if self.budget <= 0:
+                return False
+            self.budget -= 1
+            return True
+
+    @staticmethod
+    def backoff(reason: str, attempt: int) -> float:
+        """
+        Seconds to wait before the next attempt
+        Throttling uses full jitter to spread competing callers, a resuming cluster or a timed out
+        statement uses equal jitter so the wait does not collapse to zero
+        """
+        base    = RETRY_RESUME_DELAY if reason == 'resuming' else RETRY_BASE_DELAY
+        ceiling = min(RETRY_MAX_DELAY, base * (2 ** (attempt - 1)))
+        if reason == 'throttled':
+            return random.uniform(0, ceiling)
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def call(self, operation: str, func, retry_timeout: bool = True, idempotent: bool = True, **kwargs) -> Dict:
+        """
+        Run a Data API call with retries
+        Args:
+            operation (str): Name used in messages, e.g. 'execute_statement'
+            func: Client method
+            retry_timeout (bool): Retry StatementTimeoutException, only safe when the statement was rolled back
+                (outside a transaction and without continueAfterTimeout)
+            idempotent (bool): Retry errors that may arrive after the statement committed, False for writes
+                that would be applied twice (plain inserts)
+            **kwargs: Call arguments
+        Returns:
+            Dict: Response of the call
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            self._acquire()
+            try:
+                response = func(**kwargs)
+            except Exception as e:
+                reason = self.classify(e)
+                self._release(pushed_back=reason in ('resuming', 'throttled'))
+
+                attempts = RETRY_RESUME_ATTEMPTS if reason == 'resuming' else RETRY_MAX_ATTEMPTS
+                if reason is None or (reason == 'timeout' and not retry_timeout) or attempt >= attempts:
+                    raise
+                if not idempotent and self.may_have_run(e):
+                    print(f"{ERROR} Data API {operation} failed ({reason}) and may have run, not retried")
+                    raise
+                if not self._take_budget():
+                    print(f"{ERROR} Data API retry budget exhausted, {operation} failed ({reason})")
+                    raise
+
+                delay = self.backoff(reason, attempt)
+                METRICS.add_retry('rds-data', reason)
+                print(f"{FAIL} Data API {operation} {reason}, retry {attempt}/{attempts - 1} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+
+            self._release(pushed_back=False)
+            return response
+
+# Shared by all DBManager instances, the handler resets the budget per invocation
+DATA_API_RETRY = DataApiRetry()
+
+""" 5. DB MANAGER """
 class DBManager:
     def __init__(self, database_name: str, cluster_arn: None, secret_arn: None):
         """
         Initialize the DBManager with database configuration
         """
         self.database       = database_name
-        self.client         = boto3.client('rds-data', region_name=REGION)
+        self.client         = get_client('rds-data', region_name=REGION)
         self.cluster_arn    = cluster_arn if(cluster_arn) else os.environ.get('AURORA_CLUSTER_ARN')
         self.secret_arn     = secret_arn if(secret_arn) else os.environ.get('AURORA_SECRET_ARN')
 
@@ -388,7 +780,28 @@ class DBManager:
 
         return formatted_params
 
-    def _extract_column_names(self, query: str) -> List[str]:
+    @staticmethod
+    @lru_cache(maxsize=QUERY_CACHE_SIZE)
+    def _prepare_query(query: str, param_names: frozenset) -> Tuple[str, Tuple[str, ...]]:
+        """
+        Compile a query once per query text and parameter-name set (bounded LRU)
+        Args:
+            query (str): SQL query with :name placeholders
+            param_names (frozenset): Names of the parameters passed with the query
+        Returns:
+            Tuple[str, Tuple[str, ...]]: Typed SQL and the column names of the SELECT list
+        """
+        typed_query = query
+        for param in param_names:
+            pg_type = POSTGRES_TYPES.get(param)
+            if pg_type:
+                # Whole placeholder only (:cost must not touch :cost_difference) and not already cast
+                typed_query = re.sub(rf"(?<![:\w]):{param}(?![\w:])", f":{param}::{pg_type}", typed_query)
+
+        return typed_query, tuple(DBManager._extract_column_names(query))
+
+    @staticmethod
+    def _extract_column_names(query: str) -> List[str]:
         """
         Extract column names from a SELECT query
         """
@@ -421,16 +834,96 @@ class DBManager:
             print(f"{ERROR} Error extracting column names: {str(e)}")
             return []
 
+    @staticmethod
+    def _to_number(value: Any) -> Optional[float]:
+        """Numeric/decimal values arrive as strings to keep their precision"""
+        return float(value) if isinstance(value, str) else value
+
+    @staticmethod
+    def _to_timestamp(value: Any, tz: Optional[timezone] = None) -> Any:
+        """Timestamps arrive as 'YYYY-MM-DD HH:MM:SS[.fff]' strings (timestamptz in UTC)"""
+        if not isinstance(value, str):
+            return value
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            try:
+                parsed = datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
+            except ValueError:
+                return value
+        return parsed.replace(tzinfo=tz) if tz and parsed.tzinfo is None else parsed
+
+    @staticmethod
+    def _to_date(value: Any) -> Any:
+        try:
+            return date.fromisoformat(value) if isinstance(value, str) else value
+        except ValueError:
+            return value
+
+    @staticmethod
+    def _to_array(value: Any) -> Any:
+        """Arrays arrive as JSON arrays, older engines send them as a string"""
+        if isinstance(value, str):
+            try:
+                return json.loads(value)
+            except ValueError:
+                return value
+        return value
+
+    def _column_converter(self, type_name: str):
+        """Return the conversion for a Data API column typeName, or None when the JSON value is already typed"""
+        type_name = (type_name or '').lower()
+        if type_name.startswith('_') or type_name.endswith('[]'):
+            return self._to_array
+        if type_name in ('numeric', 'decimal', 'money'):
+            return self._to_number
+        if type_name == 'timestamptz':
+            return lambda value: self._to_timestamp(value, timezone.utc)
+        if type_name == 'timestamp':
+            return self._to_timestamp
+        if type_name == 'date':
+            return self._to_date
+        return None
+
+    def _decode_json_records(self, response: Dict) -> List[Dict]:
+        """
+        Decode a formatRecordsAs=JSON response in one pass
+        Column names come from the database, columnMetadata (includeResultMetadata) drives the typed conversion
+        """
+        rows = json.loads(response.get('formattedRecords') or '[]')
+        if not rows:
+            return []
+
+        converters = [
+                        (column.get('label') or column.get('name'), converter)
+                        for column in response.get('columnMetadata', [])
+                        for converter in [self._column_converter(column.get('typeName'))]
+                        if converter
+                     ]
+
+        for row in rows:
+            for label, converter in converters:
+                if row.get(label) is not None:
+                    row[label] = converter(row[label])
+
+        return rows
+
     def _format_results(self, response: Dict, column_names: List[str], single_result: bool = False) -> Union[List[Dict], Optional[Dict]]:
         """
         Format query results
         Args:
             response (Dict): Database response
-            column_names (List[str]): List of column names
+            column_names (List[str]): List of column names, only used for responses without formattedRecords
             single_result (bool): If True, return single record instead of list
         Returns:
             Union[List[Dict], Optional[Dict]]: Formatted results as list or single record
         """
+        if response and 'formattedRecords' in response:
+            results = self._decode_json_records(response)
+            if single_result:
+                return results[0] if results else None
+            return results
+
         if not response or 'records' not in response or not response['records']:
             return None if single_result else []
 
@@ -463,11 +956,8 @@ class DBManager:
             Optional[Dict]: Single record or None
         """
         try:
-            typed_query = self._generate_typed_query(query, params) if params else query
-            response    = self.execute_statement(typed_query, params if params else {})
-
-            # Get column names using existing method
-            column_names = self._extract_column_names(query)
+            typed_query, column_names = self._prepare_query(query, frozenset(params or {}))
+            response    = self.execute_statement(typed_query, params if params else {}, format_records=True)
             result       = self._format_results(response=response, column_names=column_names, single_result=True)
 
 
@@ -487,11 +977,8 @@ class DBManager:
             List[Dict]: List of records
         """
         try:
-            typed_query = self._generate_typed_query(query, params) if params else query
-            response = self.execute_statement(typed_query, params if params else {})
-
-            # Get column names using existing method
-            column_names = self._extract_column_names(query)
+            typed_query, column_names = self._prepare_query(query, frozenset(params or {}))
+            response = self.execute_statement(typed_query, params if params else {}, format_records=True)
 
             return self._format_results(response=response, column_names=column_names)
 
@@ -528,14 +1015,21 @@ class DBManager:
 
     def _get_postgres_type(self, col: str, typecast_map: Dict) -> Optional[str]:
         """Get the PostgreSQL type for a column"""
-        for pg_type, columns in TYPE_CASTING.items():
-            if col in columns:
-                return pg_type
-        return None
+        return POSTGRES_TYPES.get(col)
 
-    def execute_statement(self, sql: str, parameters: Optional[Dict] = None) -> Dict:
+    def execute_statement(self, sql: str, parameters: Optional[Dict] = None, format_records: bool = False,
+                          transaction_id: Optional[str] = None, continue_after_timeout: bool = False,
+                          idempotent: bool = True) -> Dict:
         """
         Execute a single SQL statement
+        Args:
+            sql (str): SQL statement
+            parameters (Dict, optional): Statement parameters
+            format_records (bool): Return rows as JSON (formattedRecords) with column metadata
+            transaction_id (str, optional): Run inside a transaction started with begin_transaction
+            continue_after_timeout (bool): Let long running statements finish after the Data API call times out
+            idempotent (bool): Running the statement twice has the same effect as once, False keeps errors
+                that may arrive after a commit from being retried
         """
         try:
             params = {
@@ -548,7 +1042,19 @@ class DBManager:
             if parameters:
                 params['parameters'] = self._format_parameters(parameters)
 
-            response = self.client.execute_statement(**params)
+            if format_records:
+                params['formatRecordsAs']       = 'JSON'
+                params['includeResultMetadata'] = True
+
+            if transaction_id:
+                params['transactionId']         = transaction_id
+
+            if continue_after_timeout:
+                params['continueAfterTimeout']  = True
+
+            response = DATA_API_RETRY.call('execute_statement', self.client.execute_statement,
+                                           retry_timeout=not (transaction_id or continue_after_timeout),
+                                           idempotent=idempotent, **params)
             return response
 
         except Exception as e:
@@ -560,7 +1066,8 @@ class DBManager:
         Start a new transaction and return the transaction ID
         """
         try:
-            response = self.client.begin_transaction(
+            response = DATA_API_RETRY.call(
+                'begin_transaction', self.client.begin_transaction,
                 resourceArn = self.cluster_arn,
                 secretArn   = self.secret_arn,
                 database    = self.database
@@ -588,7 +1095,7 @@ class DBManager:
                 if 'parameters' in statement:
                     params['parameters'] = self._format_parameters(statement['parameters'])
 
-                response = self.client.execute_statement(**params)
+                response = DATA_API_RETRY.call('execute_statement', self.client.execute_statement, retry_timeout=False, **params)
                 results.append(response)
 
             return results
@@ -603,7 +1110,8 @@ class DBManager:
         Commit a transaction
         """
         try:
-            self.client.commit_transaction(
+            DATA_API_RETRY.call(
+                'commit_transaction', self.client.commit_transaction,
                 resourceArn     = self.cluster_arn,
                 secretArn       = self.secret_arn,
                 transactionId   = transaction_id
@@ -617,7 +1125,8 @@ class DBManager:
         Rollback a transaction
         """
         try:
-            self.client.rollback_transaction(
+            DATA_API_RETRY.call(
+                'rollback_transaction', self.client.rollback_transaction,
                 resourceArn     = self.cluster_arn,
                 secretArn       = self.secret_arn,
                 transactionId   = transaction_id
@@ -626,14 +1135,20 @@ class DBManager:
             print(f"{FAIL} Failed to rollback transaction: {e}")
             raise
 
-    def batch_execute_statement(self, sql: str, parameter_sets: List[Dict]) -> Dict:
+    def batch_execute_statement(self, sql: str, parameter_sets: List[Dict], idempotent: bool = True) -> Dict:
         """
         Execute a batch SQL statement
+        Args:
+            sql (str): SQL statement
+            parameter_sets (List[Dict]): Unformatted parameter sets
+            idempotent (bool): Running the batch twice has the same effect as once (see execute_statement)
         """
         try:
             formatted_parameter_sets = [self._format_parameters(params) for params in parameter_sets]
 
-            response = self.client.batch_execute_statement(
+            response = DATA_API_RETRY.call(
+                'batch_execute_statement', self.client.batch_execute_statement,
+                idempotent      = idempotent,
                 resourceArn     = self.cluster_arn,
                 secretArn       = self.secret_arn,
                 database        = self.database,
@@ -646,6 +1161,118 @@ class DBManager:
             print(f"{FAIL} Batch execution failed: {e}")
             raise
 
+    def _chunk_parameter_sets(self, sql: str, parameter_sets: List[Dict],
+                              max_rows: int = BATCH_MAX_ROWS,
+                              max_bytes: int = BATCH_MAX_BYTES) -> List[List[Dict]]:
+        """
+        Split parameter sets into chunks that stay under the Data API request size
+        Args:
+            sql (str): Statement executed for every parameter set
+            parameter_sets (List[Dict]): Unformatted parameter sets
+            max_rows (int): Maximum parameter sets per chunk
+            max_bytes (int): Approximate request size budget per chunk
+        Returns:
+            List[List[Dict]]: Chunks of parameter sets
+        """
+        chunks  = []
+        chunk   = []
+        size    = len(sql)
+
+        for params in parameter_sets:
+            params_size = len(json.dumps(self._format_parameters(params), default=str))
+
+            if chunk and (len(chunk) >= max_rows or size + params_size > max_bytes):
+                chunks.append(chunk)
+                chunk   = []
+                size    = len(sql)
+
+            chunk.append(params)
+            size += params_size
+
+        if chunk:
+            chunks.append(chunk)
+
+        return chunks
+
+    def batch_upsert(self,
+                     table: str,
+                     data: List[Dict[str, Any]],
+                     conflict_columns: List[str],
+                     extra_updates: Optional[Dict[str, str]] = None) -> Dict[str, int]:
+        """
+        Insert or update records with batch_execute_statement and INSERT ... ON CONFLICT DO UPDATE
+        Rows are grouped by the keys they carry and each group only inserts and updates those
+        columns, so a key missing from a record never overwrites the stored value with NULL.
+        Chunks are sized to stay under the Data API request limit, a failed chunk is reported
+        and counted without aborting the remaining chunks
+        Args:
+            table (str): Table name
+            data (List[Dict]): Records to upsert
+            conflict_columns (List[str]): Columns of the unique constraint used as conflict target
+            extra_updates (Dict, optional): SET expressions overriding EXCLUDED values on update
+        Returns:
+            Dict[str, int]: Created, updated and failed counts
+        """
+        counts = {'created': 0, 'updated': 0, 'failed': 0}
+        if not data:
+            return counts
+
+        groups = {}
+        for row in data:
+            groups.setdefault(tuple(row.keys()), []).append(row)
+
+        extra_updates = extra_updates or {}
+
+        for columns, rows in groups.items():
+            placeholders    = [
+                                f":{col}::{self._get_postgres_type(col, AWS_TYPECAST_2)}"
+                                if self._get_postgres_type(col, AWS_TYPECAST_2)
+                                else f":{col}"
+                                for col in columns
+                              ]
+            set_clause      = [f"{col} = EXCLUDED.{col}" for col in columns if col not in conflict_columns and col not in extra_updates]
+            set_clause     += [f"{col} = {expr}" for col, expr in extra_updates.items()]
+
+            query = f"""
+                INSERT INTO {table} ({', '.join(columns)})
+                VALUES ({', '.join(placeholders)})
+                ON CONFLICT ({', '.join(conflict_columns)}) DO UPDATE
+                SET {', '.join(set_clause)}
+                RETURNING (xmax = 0) AS inserted
+            """
+
+            for number, chunk in enumerate(self._chunk_parameter_sets(query, rows), start=1):
+                try:
+                    response = self.batch_execute_statement(query, chunk)
+                    for result in response.get('updateResults', []):
+                        generated = result.get('generatedFields') or [{}]
+                        if generated[0].get('booleanValue'):
+                            counts['created'] += 1
+                        else:
+                            counts['updated'] += 1
+                except Exception as e:
+                    counts['failed'] += len(chunk)
+                    print(f"{FAIL} Batch upsert of chunk {number} ({len(chunk)} rows) into {table} failed: {str(e)}")
+
+        return counts
+
+    def refresh_materialized_view(self, view_name: str, concurrently: bool = True) -> bool:
+        """
+        Refresh a materialized view, CONCURRENTLY keeps it readable while it is rebuilt
+        Args:
+            view_name (str): Materialized view name
+            concurrently (bool): Use REFRESH ... CONCURRENTLY (needs a unique index on the view)
+        Returns:
+            bool: Success status
+        """
+        try:
+            mode = "CONCURRENTLY " if concurrently else ""
+            self.execute_statement(f"REFRESH MATERIALIZED VIEW {mode}{view_name}", continue_after_timeout=True)
+            return True
+        except Exception as e:
+            print(f"{FAIL} Refresh of {view_name} failed: {str(e)}")
+            return False
+
     def process_results(self, response: Dict) -> List[Dict]:
         """
         Process and format query results
@@ -673,14 +1300,9 @@ class DBManager:
             List[Dict]: List of records
         """
         try:
-            typed_query = self._generate_typed_query(query, params) if params else query
-            response = self.execute_statement(typed_query, params if params else {})
+            typed_query, column_names = self._prepare_query(query, frozenset(params or {}))
+            response = self.execute_statement(typed_query, params if params else {}, format_records=True)
 
-            if not response or 'records' not in response or not response['records']:
-                return []
-
-            # Get column names using existing method
-            column_names    = self._extract_column_names(query)
             results         = self._format_results(response=response, column_names=column_names)
 
 
@@ -701,18 +1323,10 @@ class DBManager:
             Optional[Dict]: Single record or None
         """
         try:
-            typed_query = self._generate_typed_query(query, params) if params else query
-            response    = self.execute_statement(typed_query, params if params else {})
-
-            if not response or 'records' not in response or not response['records']:
-                return None
-
-            # Get column names using existing method
-            results         = []
-            column_names    = self._extract_column_names(query)
+            typed_query, column_names = self._prepare_query(query, frozenset(params or {}))
+            response    = self.execute_statement(typed_query, params if params else {}, format_records=True)
 
-            results         = self._format_results(response=response, column_names=column_names)
-            result          = results[0]
+            result          = self._format_results(response=response, column_names=column_names, single_result=True)
 
 
             return result
@@ -724,15 +1338,7 @@ class DBManager:
 
     def _generate_typed_query(self, query: str, params: Dict) -> str:
         """Helper method to generate typed query"""
-        typed_query = query
-        for param in params.keys():
-            typed_placeholder = (
-                f":{param}::{self._get_postgres_type(param, AWS_TYPECAST_2)}"
-                if self._get_postgres_type(param, AWS_TYPECAST_2)
-                else f":{param}"
-            )
-            typed_query = typed_query.replace(f":{param}", typed_placeholder)
-        return typed_query
+        return self._prepare_query(query, frozenset(params))[0]
 
     def insert(self, table: str, data: Dict[str, Any]) -> Optional[int]:
         """
@@ -761,7 +1367,7 @@ class DBManager:
                 RETURNING {', '.join(display)}
             """
 
-            response = self.execute_statement(query, data)
+            response = self.execute_statement(query, data, format_records=True)
             columns.insert(0, 'id')
             results         = self._format_results(response=response, column_names=columns)
 
@@ -806,6 +1412,84 @@ class DBManager:
             print(f"{FAIL} Bulk insert error: {str(e)}")
             return False
 
+    def bulk_upsert(self,
+                    table: str,
+                    data: List[Dict[str, Any]],
+                    conflict_columns: List[str],
+                    update_columns: List[str],
+                    extra_updates: Optional[Dict[str, str]] = None,
+                    chunk_size: int = UPSERT_CHUNK_SIZE) -> Dict[str, int]:
+        """
+        Insert or update multiple records with a multi-row INSERT ... ON CONFLICT DO UPDATE
+        Rows whose update_columns are unchanged are left untouched and counted as skipped. Inserts are told
+        apart from updates by the ids that existed before the statement, not by xmax, which partitioned
+        tables (services) cannot return
+        Args:
+            table (str): Table name
+            data (List[Dict]): Records to upsert, all with the same keys
+            conflict_columns (List[str]): Columns of the unique constraint used as conflict target
+            update_columns (List[str]): Columns to overwrite (and compare) when the row exists
+            extra_updates (Dict, optional): Additional SET expressions applied on update, e.g. {'updated_at': 'CURRENT_TIMESTAMP'}
+            chunk_size (int): Maximum number of rows per statement
+        Returns:
+            Dict[str, int]: Created, updated and skipped counts
+        """
+        counts = {'created': 0, 'updated': 0, 'skipped': 0}
+        if not data:
+            return counts
+
+        # Keep the last occurrence of each conflict key, ON CONFLICT cannot touch a row twice
+        unique_rows = {}
+        for row in data:
+            unique_rows[tuple(str(row[col]) for col in conflict_columns)] = row
+        rows = list(unique_rows.values())
+        counts['skipped'] += len(data) - len(rows)
+
+        columns     = list(rows[0].keys())
+        set_clause  = [f"{col} = EXCLUDED.{col}" for col in update_columns]
+        set_clause += [f"{col} = {expr}" for col, expr in (extra_updates or {}).items()]
+        changed     = " OR ".join(f"{table}.{col} IS DISTINCT FROM EXCLUDED.{col}" for col in update_columns)
+
+        for start in range(0, len(rows), chunk_size):
+            chunk   = rows[start:start + chunk_size]
+            params  = {}
+            values  = []
+
+            keys    = []
+
+            for i, row in enumerate(chunk):
+                placeholders = {}
+                for col in columns:
+                    name                = f"{col}_{i}"
+                    params[name]        = row[col]
+                    pg_type             = self._get_postgres_type(col, AWS_TYPECAST_2)
+                    placeholders[col]   = f":{name}::{pg_type}" if pg_type else f":{name}"
+                values.append(f"({', '.join(placeholders.values())})")
+                keys.append(f"({', '.join(placeholders[col] for col in conflict_columns)})")
+
+            query = f"""
+                WITH existing AS (
+                    SELECT id FROM {table}
+                    WHERE ({', '.join(conflict_columns)}) IN (VALUES {', '.join(keys)})
+                )
+                INSERT INTO {table} ({', '.join(columns)})
+                VALUES {', '.join(values)}
+                ON CONFLICT ({', '.join(conflict_columns)}) DO UPDATE
+                SET {', '.join(set_clause)}
+                WHERE {changed}
+                RETURNING id, id NOT IN (SELECT id FROM existing) AS inserted
+            """
+
+            response = self.execute_statement(query, params, format_records=True)
+            results  = self._format_results(response=response, column_names=['id', 'inserted'])
+
+            created  = sum(1 for r in results if r['inserted'])
+            counts['created'] += created
+            counts['updated'] += len(results) - created
+            counts['skipped'] += len(chunk) - len(results)
+
+        return counts
+
     def update(self, table: str, data: Dict[str, Any], condition: str, params: Dict) -> bool:
         """
         Update records
@@ -852,17 +1536,8 @@ class DBManager:
             bool: Success status
         """
         try:
-            # Generate placeholders with type casting for each parameter
-            typed_params = [
-                f":{param}::{self._get_postgres_type(param, AWS_TYPECAST_2)}" if self._get_postgres_type(param, AWS_TYPECAST_2)
-                else f":{param}"
-                for param in params.keys()
-            ]
-
             # Replace original placeholders with typed ones in the condition
-            typed_condition = condition
-            for param, typed_param in zip(params.keys(), typed_params):
-                typed_condition = typed_condition.replace(f":{param}", typed_param)
+            typed_condition = self._generate_typed_query(condition, params)
 
             query = f"DELETE FROM {table} WHERE {typed_condition}"
 
@@ -887,7 +1562,8 @@ class DBManager:
                 }
                 formatted_parameters.append(param)
 
-            response = self.client.execute_statement(
+            response = DATA_API_RETRY.call(
+                'execute_statement', self.client.execute_statement,
                 resourceArn=self.cluster_arn,
                 secretArn=self.secret_arn,
                 database=self.database,
@@ -920,96 +1596,808 @@ class DBManager:
             print(f"{FAIL} Transaction error: {str(e)}")
             return False
 
-""" 4. CORE DB MANAGER """
-class CoreUpdateDb:
-    def __init__(self):
+""" 6. JSON STREAM READER """
+class JsonStreamReader:
+    def __init__(self, chunks: Iterator[bytes]):
+        """
+        Incremental JSON reader over a stream of byte chunks
+        Containers are walked with iter_object/iter_array and leaf values are decoded with
+        read_value, so only the value being decoded has to be held in memory
+        Args:
+            chunks (Iterator[bytes]): UTF-8 encoded JSON document, e.g. StreamingBody.iter_chunks()
+        """
+        self.chunks     = iter(chunks)
+        self.decoder    = json.JSONDecoder()
+        self.utf8       = codecs.getincrementaldecoder('utf-8')()
+        self.buffer     = ""
+        self.pos        = 0
+        self.eof        = False
+
+    def _fill(self) -> bool:
+        """Append the next chunk to the buffer, returns False at the end of the stream"""
+        if self.eof:
+            return False
 
-        self.sts_client = boto3.client('sts')
-        self.db         = DBManager(database_name=DB_NAME, cluster_arn=ARN_AURORA, secret_arn=ARN_SECRET)
-        self.sqs        = SQSManager(queue_arn=ARN_SQS)
-        self.handle_arr = []
+        # Drop what has already been consumed before growing the buffer
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos    = 0
 
-        self.stats      = {
-                            'CREATED': 0,
-                            'UPDATED': 0,
-                            'SKIPPED': 0
-                          }
+        try:
+            self.buffer += self.utf8.decode(next(self.chunks))
+        except StopIteration:
+            self.buffer += self.utf8.decode(b"", final=True)
+            self.eof     = True
+        return True
+
+    def _peek(self) -> str:
+        """Return the next non-whitespace character without consuming it"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\n\r":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def _expect(self, char: str) -> None:
+        """Consume the given structural character"""
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos} but found '{found}'")
+        self.pos += 1
+
+    def read_value(self) -> Any:
+        """Decode the next complete JSON value"""
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number may continue in the next chunk, only trust it once it is delimited
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def iter_array(self) -> Iterator[int]:
+        """
+        Walk a JSON array, yields the index of each item
+        The caller must consume every item (read_value, iter_array or iter_object) before resuming
+        """
+        self._expect('[')
+        if self._peek() == ']':
+            self.pos += 1
+            return
+
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self._peek() == ',':
+                self.pos += 1
+                continue
+            self._expect(']')
+            return
+
+    def iter_object(self) -> Iterator[str]:
+        """
+        Walk a JSON object, yields each key
+        The caller must consume the key's value (read_value, iter_array or iter_object) before resuming
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+
+        while True:
+            key = self.read_value()
+            self._expect(':')
+            yield key
+            if self._peek() == ',':
+                self.pos += 1
+                continue
+            self._expect('}')
+            return
+
+    def iter_chunks(self, size: int) -> Iterator[List[Any]]:
+        """Walk a JSON array and yield its items in lists of at most size items"""
+        chunk = []
+        for _ in self.iter_array():
+            chunk.append(self.read_value())
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+""" 7. ACCOUNT SNAPSHOT """
+class AccountSnapshot:
+    # Worst-case width of a row in the JSON records of the Data API response, with 10 digit ids and
+    # every VARCHAR at its limit. Each query pages SNAPSHOT_PAGE_BYTES // width rows (800000 by default,
+    # the rest of the 1 MB is left for JSON escaping and the response envelope):
+    #   services      {"id":2147483647,"service":"<255>","date_from":"<10>","date_to":"<10>","content_hash":"<64>"}     416 B -> 1923 rows
+    #   cost_reports  {"id":2147483647,"period_start":"<10>","period_end":"<10>","content_hash":"<64>"}                 154 B -> 5194 rows
+    #   security      {"id":2147483647,"service":"<255>","content_hash":"<64>"}                                           368 B -> 2173 rows
+    #   findings      {"id":2147483647,"security_id":2147483647,"finding_id":"<255>","content_hash":"<64>","status":"<50>"}  458 B -> 1746 rows
+    ROW_BYTES = {
+                    'services'      : 416,
+                    'cost_reports'  : 154,
+                    'security'      : 368,
+                    'findings'      : 458
+                }
 
-        self.data       = []
+    def __init__(self, db: 'DBManager', account_id: int):
+        """
+        Content hashes of the rows an account already has, loaded once per table and file
+        Loaders compare the hash of each incoming record with the stored one and only hand
+        new or changed records to the writers
+        Args:
+            db (DBManager): Database manager
+            account_id (int): Account primary key
+        """
+        self.db             = db
+        self.account_id     = account_id
+        self._services      = None
+        self._cost_reports  = None
+        self._security      = None
+        self._findings      = None
+
+    @staticmethod
+    def content_hash(record: Any) -> str:
+        """Stable hash of a record as it is written, stored in the content_hash columns"""
+        return hashlib.sha256(json.dumps(record, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _select_pages(self, table: str, query: str, params: Dict, column_names: List[str]) -> Iterator[Dict]:
+        """
+        Run a keyset paginated snapshot query, the query filters on "id > :after" and ends with
+        "ORDER BY id LIMIT :page_size"
+        The page size keeps the response of the table's widest possible rows within SNAPSHOT_PAGE_BYTES
+        """
+        page_size   = max(1, SNAPSHOT_PAGE_BYTES // self.ROW_BYTES[table])
+        after       = 0
+        while True:
+            response    = self.db.execute_statement(query, {**params, 'after': after, 'page_size': page_size}, format_records=True)
+            rows        = self.db._format_results(response=response, column_names=column_names) or []
+            yield from rows
+
+            if len(rows) < page_size:
+                return
+            after = rows[-1]['id']
+
+    def services(self, since: str) -> Dict[Tuple[str, str, str], Optional[str]]:
+        """Stored services from a date on: (service, date_from, date_to) -> content_hash"""
+        if self._services is None:
+            query = """
+                SELECT id, service, date_from, date_to, content_hash
+                FROM services
+                WHERE account_id = :account_id
+                AND date_from >= :since::date
+                AND id > :after
+                ORDER BY id
+                LIMIT :page_size
+            """
+            rows = self._select_pages('services', query, {'account_id': self.account_id, 'since': since},
+                                      ['id', 'service', 'date_from', 'date_to', 'content_hash'])
+            self._services = {(row['service'], str(row['date_from']), str(row['date_to'])): row['content_hash'] for row in rows}
+        return self._services
+
+    def cost_reports(self) -> Dict[Tuple[str, str], Optional[str]]:
+        """Stored cost reports: (period_start, period_end) -> content_hash"""
+        if self._cost_reports is None:
+            query = """
+                SELECT id, period_start, period_end, content_hash
+                FROM cost_reports
+                WHERE account_id = :account_id
+                AND id > :after
+                ORDER BY id
+                LIMIT :page_size
+            """
+            rows = self._select_pages('cost_reports', query, {'account_id': self.account_id}, ['id', 'period_start', 'period_end', 'content_hash'])
+            self._cost_reports = {(str(row['period_start']), str(row['period_end'])): row['content_hash'] for row in rows}
+        return self._cost_reports
+
+    def security(self) -> Dict[str, Dict[str, Any]]:
+        """Stored security rows: service -> {'id', 'content_hash'}"""
+        if self._security is None:
+            query = """
+                SELECT id, service, content_hash
+                FROM security
+                WHERE account_id = :account_id
+                AND id > :after
+                ORDER BY id
+                LIMIT :page_size
+            """
+            rows = self._select_pages('security', query, {'account_id': self.account_id}, ['id', 'service', 'content_hash'])
+            self._security = {row['service']: {'id': row['id'], 'content_hash': row['content_hash']} for row in rows}
+        return self._security
+
+    def findings(self, security_id: int) -> Dict[str, Dict[str, Any]]:
+        """Stored findings of a security row: finding_id -> {'content_hash', 'status'}, all rows of the account load at once"""
+        if self._findings is None:
+            query = """
+                SELECT f.id, f.security_id, f.finding_id, f.content_hash, f.status
+                FROM findings f
+                INNER JOIN security s ON s.id = f.security_id
+                WHERE s.account_id = :account_id
+                AND f.id > :after
+                ORDER BY f.id
+                LIMIT :page_size
+            """
+            self._findings = {}
+            for row in self._select_pages('findings', query, {'account_id': self.account_id}, ['id', 'security_id', 'finding_id', 'content_hash', 'status']):
+                self._findings.setdefault(int(row['security_id']), {})[row['finding_id']] = {
+                    'content_hash'  : row['content_hash'],
+                    'status'        : row['status']
+                }
+        return self._findings.get(int(security_id), {})
 
-    def fetch_data(self, max_messages=10):
-        data = []
-        try:
-            received_messages = self.sqs.receive_messages(max_messages=max_messages, wait_time_seconds=0)
-            for message in received_messages:
-                data.append(json.loads(message.get('Body')))
+""" 8. INGEST LEDGER """
+class IngestLedger:
+    SECTIONS = ('account', 'service', 'cost', 'security')
 
-                sqs_details =   {
-                                    "receipt_handle"    :  message['ReceiptHandle'],
-                                    "message_id"        : message['MessageId']
-                                }
-                self.handle_arr.append(sqs_details)
+    def __init__(self, db: 'DBManager'):
+        """
+        Record of the files already loaded, one row per SQS message with the content hash of each
+        payload section and the time spent in every stage
+        Redelivered messages and files identical to the last load of their account are recognised
+        with a single lookup before the file is parsed, unchanged sections are not loaded again
+        Args:
+            db (DBManager): Database manager
+        """
+        self.db = db
+
+    @staticmethod
+    def new_entry(message_id: str, s3_path: str, object_etag: Optional[str]) -> Dict[str, Any]:
+        """Ledger row of a file being loaded, filled in by CoreUpdateDb.process_message"""
+        entry = {
+                    'message_id'        : message_id,
+                    's3_path'           : s3_path,
+                    'object_etag'       : object_etag,
+                    'account_id'        : None,
+                    'skipped_sections'  : [],
+                    'stage_timings'     : {}
+                }
+        entry.update({f"{section}_hash": None for section in IngestLedger.SECTIONS})
+        return entry
 
-            #with open('aws_data.json', 'w') as f:
-            #    json.dump(message, f, indent=4)
-            #self.sqs.purge_queue()
-            return data
-        except Exception as e:
-            print(f"{FAIL} fetch_data error: {str(e)}")
+    @staticmethod
+    def add_timing(entry: Dict[str, Any], stage: str, started: float) -> None:
+        """Add the seconds since started (time.perf_counter) to a stage of the entry"""
+        timings         = entry['stage_timings']
+        timings[stage]  = round(timings.get(stage, 0) + time.perf_counter() - started, 4)
 
-    def _convert_python_list_string_to_array(self, input_data: Union[str, List]) -> str:
+    def find_loaded(self, message_id: str, object_etag: Optional[str]) -> Optional[Dict]:
         """
-        Convert either a Python list string representation or actual list to a PostgreSQL array
+        Completed load of the same SQS message, or of an identical object (same ETag) that is still the
+        latest load of its account
+        Returns:
+            Optional[Dict]: message_id and s3_path of the earlier load, None if the file has to be loaded
         """
-        try:
-            elements = []
-
-            if isinstance(input_data, str):
-                # Handle string representation of list
-                cleaned_string = input_data.strip('[]')
-                if not cleaned_string:
-                    return "{}"
-                # Split by comma and clean up each element
-                elements = [elem.strip().strip("'").strip('"') for elem in cleaned_string.split(',')]
+        query = """
+            SELECT l.message_id, l.s3_path
+            FROM ingest_ledger l
+            WHERE l.message_id = :message_id
+            OR (
+                l.object_etag = :object_etag
+                AND NOT EXISTS (
+                    SELECT 1 FROM ingest_ledger n
+                    WHERE n.account_id = l.account_id
+                    AND n.completed_at > l.completed_at
+                )
+            )
+            LIMIT 1
+        """
+        response = self.db.execute_statement(query, {'message_id': message_id, 'object_etag': object_etag}, format_records=True)
+        return self.db._format_results(response=response, column_names=['message_id', 's3_path'], single_result=True)
 
-            elif isinstance(input_data, list):
-                # Handle actual list
-                elements = [str(elem).strip().strip("'").strip('"') for elem in input_data]
+    def previous_hashes(self, account_id: int) -> Dict[str, Optional[str]]:
+        """Section hashes of the latest completed load of an account: section -> content hash"""
+        columns = [f"{section}_hash" for section in self.SECTIONS]
+        query   = f"""
+            SELECT {', '.join(columns)}
+            FROM ingest_ledger
+            WHERE account_id = :account_id
+            ORDER BY completed_at DESC
+            LIMIT 1
+        """
+        response    = self.db.execute_statement(query, {'account_id': account_id}, format_records=True)
+        result      = self.db._format_results(response=response, column_names=columns, single_result=True) or {}
+        return {section: result.get(f"{section}_hash") for section in self.SECTIONS}
 
-            else:
-                print(f"{FAIL} Unsupported input type: {type(input_data)}")
-                return "{}"
+    def record(self, entry: Dict[str, Any]) -> None:
+        """Write the ledger row of a completed load"""
+        query = """
+            INSERT INTO ingest_ledger (message_id, s3_path, object_etag, account_id, account_hash, service_hash,
+                cost_hash, security_hash, skipped_sections, stage_timings)
+            VALUES (:message_id, :s3_path, :object_etag, :account_id, :account_hash, :service_hash,
+                :cost_hash, :security_hash, ARRAY(SELECT jsonb_array_elements_text(:skipped_sections::jsonb)), :stage_timings::jsonb)
+            ON CONFLICT (message_id) DO UPDATE
+            SET s3_path = EXCLUDED.s3_path,
+                object_etag = EXCLUDED.object_etag,
+                account_id = EXCLUDED.account_id,
+                account_hash = EXCLUDED.account_hash,
+                service_hash = EXCLUDED.service_hash,
+                cost_hash = EXCLUDED.cost_hash,
+                security_hash = EXCLUDED.security_hash,
+                skipped_sections = EXCLUDED.skipped_sections,
+                stage_timings = EXCLUDED.stage_timings,
+                completed_at = CURRENT_TIMESTAMP
+        """
+        params = {
+                    **entry,
+                    'skipped_sections'  : json.dumps(entry['skipped_sections']),
+                    'stage_timings'     : json.dumps(entry['stage_timings'])
+                 }
+        self.db.execute_statement(query, params)
+
+""" 9. STAGE METRICS """
+class StageMetrics:
+    def __init__(self):
+        """
+        Wall time, rows and AWS requests (count and bytes per service) of each load stage for one invocation
+        Stages are tracked per thread, so requests made by the concurrent loaders land in the stage of the
+        file that made them; requests outside any stage are reported under 'other'. While tracemalloc runs
+        the peak of traced memory during each stage is recorded as well
+        """
+        self.lock       = threading.Lock()
+        self.local      = threading.local()
+        self.reset()
 
-            # Convert to PostgreSQL array format
-            postgres_array = "{" + ",".join(f'"{elem}"' for elem in elements if elem) + "}"
+    def reset(self, profile: bool = False, memory: bool = False) -> None:
+        """
+        Start a new invocation, profile turns on cProfile and tracemalloc (see profile_report),
+        memory only tracemalloc for the per stage memory peaks
+        """
+        with self.lock:
+            self.stages     = {}
+            self.started    = time.perf_counter()
+            self.profiling  = profile
+            self.profiles   = []
+            self.tracing    = profile or memory
+            self.open       = []
 
-            return postgres_array
+        if self.tracing and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not self.tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
 
-        except Exception as e:
-            print(f"{FAIL} Error converting to array: {str(e)}")
-            return "{}"
+    def _stage(self, name: str) -> Dict[str, Any]:
+        return self.stages.setdefault(name, {'count': 0, 'seconds': 0.0, 'rows': 0, 'services': {}})
 
-    #1. Process and insert/update Account Data
-    def process_account(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        response = {
-            'success': False,
-            'id': None,
-            'stats': {
-                'created': 0,
-                'updated': 0,
-                'skipped': 0
+    def _open_peak(self) -> Optional[Dict[str, int]]:
+        """
+        Start measuring the memory peak of a stage
+        tracemalloc keeps one process wide peak, so before it is reset for the new stage the peak so far
+        is handed to every stage still running (in any thread) to keep their own peaks intact
+        """
+        if not (self.tracing and tracemalloc.is_tracing()):
+            return None
+        with self.lock:
+            current, peak = tracemalloc.get_traced_memory()
+            for frame in self.open:
+                frame['peak'] = max(frame['peak'], peak)
+            tracemalloc.reset_peak()
+            frame = {'peak': current}
+            self.open.append(frame)
+        return frame
+
+    def _close_peak(self, name: str, frame: Optional[Dict[str, int]]) -> None:
+        """Record the memory peak of a finished stage call, the stage keeps the highest of its calls"""
+        if frame is None:
+            return
+        with self.lock:
+            if frame in self.open:
+                self.open.remove(frame)
+            if tracemalloc.is_tracing():
+                frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            stage               = self._stage(name)
+            stage['peak_bytes'] = max(stage.get('peak_bytes', 0), frame['peak'])
+
+    @property
+    def current(self) -> str:
+        """Innermost stage of the calling thread"""
+        stack = getattr(self.local, 'stack', None)
+        return stack[-1] if stack else 'other'
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage and attribute the requests made inside it"""
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append(name)
+        frame   = self._open_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            stack.pop()
+            with self.lock:
+                stage               = self._stage(name)
+                stage['count']      += 1
+                stage['seconds']    += elapsed
+            self._close_peak(name, frame)
+
+    def bind(self, func: Callable) -> Callable:
+        """
+        Wrap func so that it runs under the calling thread's stages, for work handed to a thread pool
+        (the stage stack is per thread, so pool workers would otherwise report under 'other')
+        """
+        stack = list(getattr(self.local, 'stack', None) or [])
+
+        def bound(*args, **kwargs):
+            previous            = getattr(self.local, 'stack', None)
+            self.local.stack    = list(stack)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.local.stack = previous
+        return bound
+
+    def add_rows(self, rows: int) -> None:
+        """Count records handled by the current stage"""
+        with self.lock:
+            self._stage(self.current)['rows'] += rows
+
+    def _counters(self, service: str) -> Dict[str, int]:
+        """Counters of a service in the current stage"""
+        return self._stage(self.current)['services'].setdefault(service, {'calls': 0, 'bytes_sent': 0, 'bytes_received': 0, 'retries': 0})
+
+    def _service(self, event_name: str) -> Dict[str, int]:
+        """Counters of the service an event belongs to ('before-send.rds-data.ExecuteStatement')"""
+        return self._counters(event_name.split('.')[1] if event_name.count('.') >= 2 else 'unknown')
+
+    def add_retry(self, service: str, reason: str) -> None:
+        """Count a retried request of the current stage, per service and per reason"""
+        with self.lock:
+            counters                        = self._counters(service)
+            counters['retries']             += 1
+            counters[f"retries_{reason}"]   = counters.get(f"retries_{reason}", 0) + 1
+
+    def on_request(self, request=None, event_name: str = '', **kwargs) -> None:
+        """botocore 'before-send' handler, must return None or the request is not sent"""
+        body = getattr(request, 'body', None) or b''
+        size = len(body) if isinstance(body, (bytes, bytearray, str)) else int(getattr(request, 'headers', {}).get('Content-Length') or 0)
+        with self.lock:
+            counters                = self._service(event_name)
+            counters['calls']       += 1
+            counters['bytes_sent']  += size
+
+    def on_response(self, http_response=None, event_name: str = '', **kwargs) -> None:
+        """botocore 'after-call' handler, the body is not read so streaming S3 bodies are left untouched"""
+        headers = getattr(http_response, 'headers', None) or {}
+        with self.lock:
+            self._service(event_name)['bytes_received'] += int(headers.get('content-length') or 0)
+
+    def summary(self) -> Dict[str, Any]:
+        """Stage metrics of the invocation as returned by the handler"""
+        with self.lock:
+            return {
+                'duration_ms'   : round((time.perf_counter() - self.started) * 1000, 1),
+                'stages'        : {
+                                    name: {
+                                        'count'         : stage['count'],
+                                        'duration_ms'   : round(stage['seconds'] * 1000, 1),
+                                        'rows'          : stage['rows'],
+                                        'services'      : copy.deepcopy(stage['services']),
+                                        **({'peak_memory_mb': round(stage['peak_bytes'] / 1048576, 1)} if 'peak_bytes' in stage else {})
+                                    }
+                                    for name, stage in self.stages.items()
+                                  }
             }
-        }
 
+    def emit(self) -> Dict[str, Any]:
+        """
+        Print the metrics as CloudWatch Embedded Metric Format lines, one per stage and one per
+        stage and service, and return the summary
+        """
+        summary     = self.summary()
+        timestamp   = int(time.time() * 1000)
+
+        def line(dimensions: Dict[str, str], metrics: Dict[str, Tuple[Any, str]]) -> str:
+            return json.dumps({
+                '_aws': {
+                    'Timestamp'         : timestamp,
+                    'CloudWatchMetrics' : [{
+                        'Namespace'     : METRICS_NAMESPACE,
+                        'Dimensions'    : [list(dimensions.keys())],
+                        'Metrics'       : [{'Name': name, 'Unit': unit} for name, (_, unit) in metrics.items()]
+                    }]
+                },
+                **dimensions,
+                **{name: value for name, (value, _) in metrics.items()}
+            })
+
+        for name, stage in summary['stages'].items():
+            print(line({'Stage': name}, {
+                'Duration'  : (stage['duration_ms'], 'Milliseconds'),
+                'Count'     : (stage['count'], 'Count'),
+                'Rows'      : (stage['rows'], 'Count'),
+                **({'PeakMemory': (stage['peak_memory_mb'], 'Megabytes')} if 'peak_memory_mb' in stage else {})
+            }))
+            for service, counters in stage['services'].items():
+                print(line({'Stage': name, 'Service': service}, {
+                    'Calls'         : (counters['calls'], 'Count'),
+                    'BytesSent'     : (counters['bytes_sent'], 'Bytes'),
+                    'BytesReceived' : (counters['bytes_received'], 'Bytes'),
+                    'Retries'       : (counters['retries'], 'Count')
+                }))
+
+        return summary
+
+    def profiled(self, func, *args, **kwargs):
+        """Call func under its own cProfile profiler when profiling, profilers are per thread"""
+        if not self.profiling:
+            return func(*args, **kwargs)
+
+        profile = cProfile.Profile()
         try:
-            # Check if account exists using select_one
-            check_query = """
-                SELECT id, account_id
-                FROM accounts
-                WHERE account_id = :account_id
-            """
+            profile.enable()
+        except ValueError:
+            # Another profiler is active on this interpreter (one at a time since Python 3.12)
+            return func(*args, **kwargs)
 
-            existing_account = self.db.select_one(check_query, {"account_id": data['account_id']})
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self.lock:
+                self.profiles.append(profile)
+
+    def profile_report(self, top_n: int = PROFILE_TOP_N) -> Optional[Dict[str, List[str]]]:
+        """
+        Top functions by cumulative time (all profiled threads merged) and top allocation sites
+        of a profiled invocation, stops tracemalloc
+        """
+        if not self.profiling:
+            return None
+
+        report = {'cpu': [], 'memory': []}
+
+        # Memory first, so the report itself is not part of it, allocations of the profilers are left out
+        if tracemalloc.is_tracing():
+            snapshot            = tracemalloc.take_snapshot().filter_traces([
+                                    tracemalloc.Filter(False, cProfile.__file__),
+                                    tracemalloc.Filter(False, tracemalloc.__file__)
+                                  ])
+            report['memory']    = [str(stat) for stat in snapshot.statistics('lineno')[:top_n]]
+            tracemalloc.stop()
+
+        if self.profiles:
+            stream  = io.StringIO()
+            stats   = pstats.Stats(self.profiles[0], stream=stream)
+            for profile in self.profiles[1:]:
+                stats.add(profile)
+            stats.sort_stats('cumulative').print_stats(top_n)
+            report['cpu'] = [row for row in stream.getvalue().splitlines() if row.strip()]
+
+        self.profiling = False
+        return report
+
+# Metrics of the running invocation, the client event handlers report into it
+METRICS = StageMetrics()
+
+""" 10. CORE DB MANAGER """
+class CoreUpdateDb:
+    # Payload section -> load stage it is measured under
+    SECTION_STAGES = {'service': 'services', 'cost': 'cost', 'security': 'security'}
+
+    def __init__(self, concurrency: int = FILE_CONCURRENCY):
+
+        self.sts_client = get_client('sts')
+        self.s3_client  = get_client('s3')
+        self.db         = DBManager(database_name=DB_NAME, cluster_arn=ARN_AURORA, secret_arn=ARN_SECRET)
+        self.sqs        = SQSManager(queue_arn=ARN_SQS)
+        self.ledger     = IngestLedger(self.db)
+        self.acks       = AckBuffer(self.sqs, self.s3_client)
+        self.handle_arr = []
+
+        self.stats      = {
+                            'CREATED': 0,
+                            'UPDATED': 0,
+                            'SKIPPED': 0,
+                            'DUPLICATES': 0
+                          }
+
+        self.data           = []
+        self.concurrency    = max(1, int(concurrency))
+        self._stats_lock    = threading.Lock()
+        self._snapshot      = None
+
+    def _account_snapshot(self, account_id: int) -> AccountSnapshot:
+        """Snapshot of the account the current file belongs to"""
+        if self._snapshot is None or self._snapshot.account_id != account_id:
+            self._snapshot = AccountSnapshot(self.db, account_id)
+        return self._snapshot
+
+    def _merge_stats(self, stats: Dict[str, int]) -> None:
+        """Add a worker's counters to the shared stats"""
+        with self._stats_lock:
+            for key, value in stats.items():
+                self.stats[key] = self.stats.get(key, 0) + value
+
+    def _process_message_isolated(self, message: Dict, rh: Dict, delete_message: bool = True) -> Optional[bool]:
+        """
+        Run process_message for one file on a shallow copy of this loader with its own stats
+        Clients are shared (they are thread-safe), counters are merged once the file is done and
+        every file is written with its own Data API calls, so a failing file does not affect the others
+        """
+        worker              = copy.copy(self)
+        worker.stats        = {'CREATED': 0, 'UPDATED': 0, 'SKIPPED': 0, 'DUPLICATES': 0}
+        worker._snapshot    = None
+        try:
+            return METRICS.profiled(worker.process_message, message, rh, delete_message=delete_message)
+        except Exception as e:
+            print(f"{ERROR} Failed to process message {rh['message_id']} - {str(e)}")
+            return None
+        finally:
+            self._merge_stats(worker.stats)
+
+    def _process_messages(self, messages: List[Dict], handles: List[Dict], delete_message: bool = True) -> List[Optional[bool]]:
+        """
+        Process several files concurrently, bounded by self.concurrency
+        Returns:
+            List[Optional[bool]]: process_message status per file, in input order
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return list(executor.map(
+                        lambda item: self._process_message_isolated(item[0], item[1], delete_message=delete_message),
+                        zip(messages, handles)
+                    ))
+
+    def _drain_deadline(self, context=None) -> float:
+        """
+        Monotonic deadline for draining the queue, a share of the remaining Lambda time
+        so that most of the invocation is left for processing the received messages
+        """
+        if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+            budget = context.get_remaining_time_in_millis() / 1000 * DRAIN_BUDGET_RATIO
+        else:
+            budget = DRAIN_BUDGET_SECONDS
+        return time.monotonic() + budget
+
+    def fetch_data(self, max_messages=10, context=None):
+        """
+        Drain up to max_messages from the queue with long polling
+        Receive calls are issued RECEIVE_CONCURRENCY at a time (10 messages each) until the
+        requested count is reached, the queue comes back empty or the time budget runs out
+        """
+        data        = []
+        seen        = set()
+        deadline    = self._drain_deadline(context)
+        try:
+            receive = METRICS.bind(self.sqs.receive_messages)
+            with ThreadPoolExecutor(max_workers=RECEIVE_CONCURRENCY) as executor:
+                while len(data) < max_messages:
+                    time_left = deadline - time.monotonic()
+                    if time_left <= 0:
+                        break
+
+                    # Split the outstanding count into pages of at most 10 messages
+                    outstanding = max_messages - len(data)
+                    pages       = [min(10, outstanding - i) for i in range(0, outstanding, 10)][:RECEIVE_CONCURRENCY]
+                    wait        = max(0, min(RECEIVE_WAIT_SECONDS, 20, int(time_left)))
+
+                    futures = [
+                                executor.submit(receive, max_messages=page, wait_time_seconds=wait)
+                                for page in pages
+                              ]
+
+                    received = 0
+                    for future in futures:
+                        for message in future.result():
+                            if message['MessageId'] in seen:
+                                continue
+                            seen.add(message['MessageId'])
+                            received += 1
+
+                            data.append(json.loads(message.get('Body')))
+
+                            sqs_details =   {
+                                                "receipt_handle"    :  message['ReceiptHandle'],
+                                                "message_id"        : message['MessageId']
+                                            }
+                            self.handle_arr.append(sqs_details)
+
+                    if received == 0:
+                        # Every long poll came back empty, the queue is drained
+                        break
+
+            #with open('aws_data.json', 'w') as f:
+            #    json.dump(message, f, indent=4)
+            #self.sqs.purge_queue()
+            return data
+        except Exception as e:
+            print(f"{FAIL} fetch_data error: {str(e)}")
+            return data
+
+    def _convert_python_list_string_to_array(self, input_data: Union[str, List]) -> str:
+        """
+        Convert either a Python list string representation or actual list to a PostgreSQL array
+        """
+        try:
+            elements = []
+
+            if isinstance(input_data, str):
+                # Handle string representation of list
+                cleaned_string = input_data.strip('[]')
+                if not cleaned_string:
+                    return "{}"
+                # Split by comma and clean up each element
+                elements = [elem.strip().strip("'").strip('"') for elem in cleaned_string.split(',')]
+
+            elif isinstance(input_data, list):
+                # Handle actual list
+                elements = [str(elem).strip().strip("'").strip('"') for elem in input_data]
+
+            else:
+                print(f"{FAIL} Unsupported input type: {type(input_data)}")
+                return "{}"
+
+            # Convert to PostgreSQL array format
+            postgres_array = "{" + ",".join(f'"{elem}"' for elem in elements if elem) + "}"
+
+            return postgres_array
+
+        except Exception as e:
+            print(f"{FAIL} Error converting to array: {str(e)}")
+            return "{}"
+
+    #1. Process and insert/update Account Data
+    ACCOUNT_FIELDS = ('account_id', 'account_name', 'account_email', 'account_status', 'account_arn', 'joined_method', 'joined_timestamp')
+
+    def _account_fingerprint(self, account_data: Dict[str, Any]) -> str:
+        """Content hash of the account columns, timestamps normalised so stored and incoming rows compare equal"""
+        normalized = {}
+        for key in self.ACCOUNT_FIELDS:
+            value = account_data.get(key)
+            if key == 'joined_timestamp' and value is not None:
+                try:
+                    parsed = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+                    value  = (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).astimezone(timezone.utc).isoformat()
+                except ValueError:
+                    pass
+            normalized[key] = '' if value is None else str(value)
+
+        return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _warm_account_cache(self) -> None:
+        """Load every known account with one query, once per container"""
+        if _ACCOUNT_CACHE_WARM['loaded']:
+            return
+
+        with _ACCOUNT_CACHE_LOCK:
+            if _ACCOUNT_CACHE_WARM['loaded']:
+                return
+
+            query = f"SELECT id, {', '.join(self.ACCOUNT_FIELDS)} FROM accounts"
+            for row in self.db.select(query):
+                _ACCOUNT_CACHE[row['account_id']] = (row['id'], self._account_fingerprint(row))
+
+            _ACCOUNT_CACHE_WARM['loaded'] = True
+
+    def process_account(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Insert or update an account
+        Accounts whose content matches the cached hash cost no database call, anything else is a single
+        INSERT ... ON CONFLICT (account_id) DO UPDATE ... RETURNING id
+        """
+        response = {
+            'success': False,
+            'id': None,
+            'stats': {
+                'created': 0,
+                'updated': 0,
+                'skipped': 0
+            }
+        }
+
+        try:
+            self._warm_account_cache()
 
             # Prepare parameters
             account_data = {
@@ -1021,30 +2409,50 @@ class CoreUpdateDb:
                 'joined_method'     : data['joined_method'] if(data['joined_method'] != None) else 'Access Restricted',
                 'joined_timestamp'  : data['joined_timestamp'] if(data['joined_timestamp'] != None) else date.today()
             }
+            fingerprint = self._account_fingerprint(account_data)
+            cached      = _ACCOUNT_CACHE.get(account_data['account_id'])
+
             try:
-                if not existing_account:
-                    # Insert new account
-                    result = self.db.insert('accounts', account_data)
-                    if result:
-                        response['id']                  = result['id']
-                        response['stats']['created']    += 1
-                        response['success']             = True
-                        print(f"{SUCCESS} Created new account for {result['account_id']}")
-                    else:
-                        raise Exception("Failed to insert new account")
+                if cached and cached[1] == fingerprint:
+                    # Unchanged account
+                    response['id']                  = cached[0]
+                    response['stats']['skipped']    += 1
+                    response['success']             = True
                 else:
-                    # Update existing account
-                    account_data['updated_at']  = datetime.now()
-                    condition                   = "account_id = :account_id"
-                    result                      = self.db.update('accounts', account_data, condition, {"account_id": data['account_id']})
-
-                    if result:
-                        response['id']          = existing_account['id']
-                        response['stats']['updated']    += 1
-                        response['success']             = True
+                    query = """
+                        INSERT INTO accounts (account_id, account_name, account_email, account_status,
+                            account_arn, joined_method, joined_timestamp)
+                        VALUES (:account_id, :account_name, :account_email, :account_status,
+                            :account_arn, :joined_method, :joined_timestamp::timestamp with time zone)
+                        ON CONFLICT (account_id) DO UPDATE
+                        SET account_name = EXCLUDED.account_name,
+                            account_email = EXCLUDED.account_email,
+                            account_status = EXCLUDED.account_status,
+                            account_arn = EXCLUDED.account_arn,
+                            joined_method = EXCLUDED.joined_method,
+                            joined_timestamp = EXCLUDED.joined_timestamp,
+                            updated_at = CURRENT_TIMESTAMP
+                        RETURNING id, (xmax = 0) AS inserted
+                    """
+                    result = self.db._format_results(
+                                response        = self.db.execute_statement(query, account_data, format_records=True),
+                                column_names    = ['id', 'inserted'],
+                                single_result   = True
+                            )
+
+                    if not result:
+                        raise Exception("Failed to create or update account")
+
+                    response['id']      = result['id']
+                    response['success'] = True
+                    if result['inserted']:
+                        response['stats']['created'] += 1
+                        print(f"{SUCCESS} Created new account for {account_data['account_id']}")
                     else:
-                        response['stats']['skipped']    += 1
-                        response['success']             = False
+                        response['stats']['updated'] += 1
+
+                    with _ACCOUNT_CACHE_LOCK:
+                        _ACCOUNT_CACHE[account_data['account_id']] = (result['id'], fingerprint)
 
                 if not response['id']:
                     raise Exception("Failed to create or update account")
@@ -1067,112 +2475,62 @@ class CoreUpdateDb:
 
     def process_services(self, account_pk: int, data: List[Dict[str, Any]]) -> bool:
         """
-        Process and insert services data for an account, handling duplicates
+        Process and upsert services data for an account in bulk, handling duplicates
+        Services whose content hash matches the account snapshot are skipped without being sent,
+        the ON CONFLICT ... WHERE clause still guards rows written before content hashes existed
         """
-        inserted_count = 0
-        skipped_count = 0
-        updated_count = 0
-
         try:
+            services = []
             for service_data in data:
-                try:
-                    # Check for duplicate using select_one
-                    check_query = """
-                        SELECT id
-                        FROM services
-                        WHERE account_id = :account_id
-                        AND service = :service
-                        AND date_from = :date_from
-                        AND date_to = :date_to
-                    """
-                    check_params = {
-                        'account_id'    : account_pk,
-                        'service'       : service_data['service'],
-                        'date_from'     : service_data['date_from'],
-                        'date_to'       : service_data['date_to']
-                    }
+                # Convert usage_types to proper PostgreSQL array format
+                usage_types         = service_data.get('usage_types', [])
+                usage_types_str     = self._convert_python_list_string_to_array(usage_types)
+
+                services.append({
+                    'account_id'        : account_pk,
+                    'service'           : service_data['service'],
+                    'date_from'         : service_data['date_from'],
+                    'date_to'           : service_data['date_to'],
+                    'cost'              : service_data['cost'],
+                    'currency'          : service_data.get('currency', 'USD'),
+                    'utilization'       : service_data.get('utilization') if service_data.get('utilization') is not None else None,
+                    'utilization_unit'  : service_data.get('utilization_unit'),
+                    'usage_types'       : usage_types_str
+                })
+
+            if not services:
+                return True
 
-                    existing_service    = self.db.select_one(check_query, check_params)
-                    # Convert usage_types to proper PostgreSQL array format
-                    usage_types         = service_data.get('usage_types', [])
-                    usage_types_str     = self._convert_python_list_string_to_array(usage_types)
-
-                    # Prepare the service parameters
-
-                    service_params = {
-                        'account_id'        : account_pk,
-                        'service'           : service_data['service'],
-                        'date_from'         : service_data['date_from'],
-                        'date_to'           : service_data['date_to'],
-                        'cost'              : service_data['cost'],
-                        'currency'          : service_data.get('currency', 'USD'),
-                        'utilization'       : service_data.get('utilization') if service_data.get('utilization') is not None else None,
-                        'utilization_unit'  : service_data.get('utilization_unit'),
-                        'usage_types'       : usage_types_str
-                    }
+            # Only services that are new or changed since the last load are written
+            known   = self._account_snapshot(account_pk).services(since=min(str(service['date_from']) for service in services))
+            changed = []
+            for service in services:
+                service['content_hash'] = AccountSnapshot.content_hash(service)
+                if known.get((service['service'], str(service['date_from']), str(service['date_to']))) != service['content_hash']:
+                    changed.append(service)
 
-                    if existing_service:
-
-                        # Check existing data
-                        check_existing_query = """
-                            SELECT cost, currency, utilization, utilization_unit, usage_types
-                            FROM services
-                            WHERE id = :service_id
-                        """
-                        existing_data = self.db.select_one(check_existing_query,{'service_id': existing_service['id']})
-                        if existing_data:
-
-                            # Check if data has changed
-                            if self._is_service_data_changed(existing_data, service_params):
-
-                                # Update only if data has changed
-                                service_params['service_id'] = str(existing_service['id'])
-
-                                update_columns = {
-                                    'cost'              : service_params['cost'],
-                                    'currency'          : service_params['currency'],
-                                    'utilization'       : service_params['utilization'],
-                                    'utilization_unit'  : service_params['utilization_unit'],
-                                    'usage_types'       : service_params['usage_types'],
-                                    'updated_at'        : datetime.now()
-                                }
-                                service_params['service_id'] = int(service_params['service_id'])
-
-                                if self.db.update('services', update_columns, 'id = :service_id', service_params):
-                                    updated_count += 1
-                                else:
-                                    raise Exception(f"Failed to update service: {service_data['service']}")
-                            else:
-                                skipped_count += 1
-                    else:
+            self.stats['SKIPPED']   += len(services) - len(changed)
+            if not changed:
+                return True
 
-                        # Insert new service
-
-                        insert_columns = {
-                            'account_id': service_params['account_id'],
-                            'service': service_params['service'],
-                            'date_from': service_params['date_from'],
-                            'date_to': service_params['date_to'],
-                            'cost': service_params['cost'],
-                            'currency': service_params['currency'],
-                            'utilization': service_params['utilization'],
-                            'utilization_unit': service_params['utilization_unit'],
-                            'usage_types': service_params['usage_types']
-                        }
-
-                        if self.db.insert('services', insert_columns):
-                            inserted_count += 1
-                        else:
-                            raise Exception(f"Failed to insert service: {service_data['service']}")
+            self._ensure_partitions(['services'], [service['date_from'] for service in changed])
 
-                except Exception as e:
-                    print(f"{FAIL} Error processing service {service_data.get('service')}: {str(e)}")
-                    raise
+            counts = self.db.bulk_upsert(
+                table               = 'services',
+                data                = changed,
+                conflict_columns    = ['account_id', 'service', 'date_from', 'date_to'],
+                update_columns      = ['cost', 'currency', 'utilization', 'utilization_unit', 'usage_types', 'content_hash'],
+                extra_updates       = {'updated_at': 'CURRENT_TIMESTAMP'}
+            )
+
+            #print(f"Processing complete: {counts['created']} inserted, {counts['updated']} updated, {counts['skipped']} skipped")
+            self.stats['CREATED']   += counts['created']
+            self.stats['UPDATED']   += counts['updated']
+            self.stats['SKIPPED']   += counts['skipped']
 
-            #print(f"Processing complete: {inserted_count} inserted, {updated_count} updated, {skipped_count} skipped")
-            self.stats['CREATED']   += inserted_count
-            self.stats['UPDATED']    += updated_count
-            self.stats['SKIPPED']   += skipped_count
+            # Keep the daily rollup in step for the days this load wrote
+            if counts['created'] or counts['updated']:
+                self._rollup_services(account_pk, sorted({str(service['date_from']) for service in changed}))
 
             return  True
 
@@ -1180,178 +2538,488 @@ class CoreUpdateDb:
             print(f"{FAIL} Error processing services data: {str(e)}")
             return False
 
-    def _is_service_data_changed(self, existing_data: Dict, new_params: Dict) -> bool:
-        """Helper method to check if service data has changed"""
-        return (
-            existing_data['cost'] != new_params['cost'] or
-            existing_data['currency'] != new_params['currency'] or
-            existing_data['utilization'] != new_params['utilization'] or
-            existing_data['utilization_unit'] != new_params['utilization_unit'] or
-            existing_data['usage_types'] != new_params['usage_types'].replace('{','').replace('}','')
-        )
-
-
-    #3a. Checking if there is an existing cost data available fo rthe account_id
-    def check_existing_cost_report(self, account_id: int, period_start: str, period_end: str) -> Dict:
-        """Check if a cost report already exists"""
+    def _rollup_services(self, account_pk: int, days: List[str]) -> Dict[str, int]:
+        """
+        Recompute the services_daily rollup of an account for the given days from the services rows
+        Args:
+            account_pk (int): Account primary key
+            days (List[str]): Days (services date_from) written by the load
+        Returns:
+            Dict[str, int]: Number of rollup rows upserted and removed
+        """
         query = """
-            SELECT id, current_period_cost, previous_period_cost,
-                cost_difference, cost_difference_percentage,
-                potential_monthly_savings, anomalies_detected,
-                saving_opportunities_count
-            FROM cost_reports
-            WHERE account_id = :account_id
-            AND period_start = :period_start
-            AND period_end = :period_end
+            WITH days AS (
+                SELECT DISTINCT value::date AS day
+                FROM jsonb_array_elements_text(:days::jsonb)
+            ),
+            totals AS (
+                SELECT s.account_id, s.service, s.date_from AS day,
+                    SUM(s.cost) AS cost, SUM(s.utilization) AS utilization, COUNT(*) AS service_rows
+                FROM services s
+                WHERE s.account_id = :account_id
+                AND s.date_from IN (SELECT day FROM days)
+                GROUP BY s.account_id, s.service, s.date_from
+            ),
+            upserted AS (
+                INSERT INTO services_daily (account_id, service, day, cost, utilization, service_rows)
+                SELECT account_id, service, day, cost, utilization, service_rows FROM totals
+                ON CONFLICT (account_id, service, day) DO UPDATE
+                SET cost = EXCLUDED.cost,
+                    utilization = EXCLUDED.utilization,
+                    service_rows = EXCLUDED.service_rows,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE (services_daily.cost, services_daily.utilization, services_daily.service_rows)
+                    IS DISTINCT FROM (EXCLUDED.cost, EXCLUDED.utilization, EXCLUDED.service_rows)
+                RETURNING 1
+            ),
+            removed AS (
+                DELETE FROM services_daily d
+                WHERE d.account_id = :account_id
+                AND d.day IN (SELECT day FROM days)
+                AND NOT EXISTS (SELECT 1 FROM totals t WHERE t.service = d.service AND t.day = d.day)
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM upserted) AS upserted, (SELECT COUNT(*) FROM removed) AS removed
         """
+        params = {
+            'account_id'    : account_pk,
+            'days'          : json.dumps(days)
+        }
+
+        response    = self.db.execute_statement(query, params, format_records=True)
+        result      = self.db._format_results(response=response, column_names=['upserted', 'removed'], single_result=True) or {}
+
+        return {
+            'upserted'  : int(result.get('upserted') or 0),
+            'removed'   : int(result.get('removed') or 0)
+        }
+
+    #3. Process Cost Data
+    def _cost_report_params(self, account_id: int, report: Dict) -> Dict[str, Any]:
+        """Statement parameters of one cost report, including the content hash of the report and its children"""
+        # Keyed by service name and forecast period, a repeated key keeps its last value
+        service_costs = {
+            service.get('service', ''): {
+                'service_name': service.get('service', ''),
+                'cost': service.get('cost', 0)
+            }
+            for service in report.get('top_services') or []
+        }
+
+        forecasts = {
+            (forecast['period']['start'], forecast['period']['end']): {
+                'period_start': forecast['period']['start'],
+                'period_end': forecast['period']['end'],
+                'amount': forecast.get('amount', 0),
+                'prediction_interval_lower_bound': forecast.get('prediction_interval_lower_bound', 0),
+                'prediction_interval_upper_bound': forecast.get('prediction_interval_upper_bound', 0)
+            }
+            for forecast in report.get('forecast') or []
+        }
+
         params = {
             'account_id': account_id,
-            'period_start': period_start,
-            'period_end': period_end
+            'current_period_cost': report.get('current_period_cost', 0),
+            'previous_period_cost': report.get('previous_period_cost', 0),
+            'cost_difference': report.get('cost_difference', 0),
+            'cost_difference_percentage': report.get('cost_difference_percentage', 0),
+            'potential_monthly_savings': report.get('potential_monthly_savings', 0),
+            'anomalies_detected': report.get('anomalies_detected', 0),
+            'saving_opportunities_count': report.get('saving_opportunities_count', 0),
+            'period_start': report['period']['start'],
+            'period_end': report['period']['end'],
+            'period_granularity': report['period']['granularity'],
+            'service_costs': json.dumps(list(service_costs.values())),
+            'forecasts': json.dumps(list(forecasts.values())),
+            'tolerance': COST_TOLERANCE
         }
-        return self.db.select_one(query, params)
-
-    def has_data_changed(self, existing: Dict, new: Dict) -> bool:
-        """Compare existing and new data"""
-        fields_to_compare = [
-            'current_period_cost', 'previous_period_cost',
-            'cost_difference', 'cost_difference_percentage',
-            'potential_monthly_savings', 'anomalies_detected',
-            'saving_opportunities_count'
-        ]
+        params['content_hash'] = AccountSnapshot.content_hash(params)
+
+        return params
 
-        return any(
-            abs(float(existing.get(field, 0)) - float(new.get(field, 0))) > 0.0001
-            for field in fields_to_compare
-        )
+    def _sync_cost_report(self, params: Dict[str, Any], transaction_id: Optional[str] = None) -> Dict[str, int]:
+        """
+        Upsert one cost report and sync its service costs and forecasts in a single statement
+        The report row is only rewritten when a figure moved by more than COST_TOLERANCE. Children are
+        diffed against the stored rows (service costs by service name, forecasts by period) and only
+        added, changed or removed rows are written
+        Args:
+            params (Dict): Report parameters from _cost_report_params
+            transaction_id (str, optional): Transaction of the file's cost section
+        Returns:
+            Dict[str, int]: Created and updated report counts and the number of child rows written
+        """
+        query = """
+            WITH existing AS (
+                SELECT id, current_period_cost, previous_period_cost, cost_difference,
+                    cost_difference_percentage, potential_monthly_savings,
+                    anomalies_detected, saving_opportunities_count
+                FROM cost_reports
+                WHERE account_id = :account_id
+                AND period_start = :period_start::date
+                AND period_end = :period_end::date
+                LIMIT 1
+                FOR UPDATE
+            ),
+            updated AS (
+                UPDATE cost_reports cr
+                SET current_period_cost = :current_period_cost::numeric,
+                    previous_period_cost = :previous_period_cost::numeric,
+                    cost_difference = :cost_difference::numeric,
+                    cost_difference_percentage = :cost_difference_percentage::numeric,
+                    potential_monthly_savings = :potential_monthly_savings::numeric,
+                    anomalies_detected = :anomalies_detected,
+                    saving_opportunities_count = :saving_opportunities_count,
+                    period_granularity = :period_granularity::period_granularity_type,
+                    content_hash = :content_hash
+                FROM existing e
+                WHERE cr.id = e.id
+                AND (
+                    ABS(e.current_period_cost - :current_period_cost::numeric) > :tolerance::numeric
+                    OR ABS(e.previous_period_cost - :previous_period_cost::numeric) > :tolerance::numeric
+                    OR ABS(e.cost_difference - :cost_difference::numeric) > :tolerance::numeric
+                    OR ABS(e.cost_difference_percentage - :cost_difference_percentage::numeric) > :tolerance::numeric
+                    OR ABS(COALESCE(e.potential_monthly_savings, 0) - :potential_monthly_savings::numeric) > :tolerance::numeric
+                    OR COALESCE(e.anomalies_detected, 0) <> :anomalies_detected
+                    OR COALESCE(e.saving_opportunities_count, 0) <> :saving_opportunities_count
+                )
+                RETURNING cr.id
+            ),
+            stamped AS (
+                -- Changes within the tolerance only record the new content hash
+                UPDATE cost_reports cr
+                SET content_hash = :content_hash
+                FROM existing e
+                WHERE cr.id = e.id
+                AND NOT EXISTS (SELECT 1 FROM updated)
+                AND cr.content_hash IS DISTINCT FROM :content_hash
+                RETURNING cr.id
+            ),
+            inserted AS (
+                INSERT INTO cost_reports (account_id, current_period_cost, previous_period_cost, cost_difference,
+                    cost_difference_percentage, potential_monthly_savings, anomalies_detected,
+                    saving_opportunities_count, period_start, period_end, period_granularity, content_hash)
+                SELECT :account_id, :current_period_cost::numeric, :previous_period_cost::numeric, :cost_difference::numeric,
+                    :cost_difference_percentage::numeric, :potential_monthly_savings::numeric, :anomalies_detected,
+                    :saving_opportunities_count, :period_start::date, :period_end::date, :period_granularity::period_granularity_type,
+                    :content_hash
+                WHERE NOT EXISTS (SELECT 1 FROM existing)
+                RETURNING id
+            ),
+            report AS (
+                SELECT id FROM existing
+                UNION ALL
+                SELECT id FROM inserted
+            ),
+            incoming_service_costs AS (
+                SELECT r.id AS cost_report_id, sc.service_name, sc.cost
+                FROM report r
+                CROSS JOIN jsonb_to_recordset(:service_costs::jsonb) AS sc(service_name VARCHAR, cost NUMERIC)
+            ),
+            incoming_forecasts AS (
+                SELECT r.id AS cost_report_id, cf.period_start, cf.period_end, cf.amount,
+                    cf.prediction_interval_lower_bound, cf.prediction_interval_upper_bound
+                FROM report r
+                CROSS JOIN jsonb_to_recordset(:forecasts::jsonb) AS cf(period_start DATE, period_end DATE, amount NUMERIC,
+                    prediction_interval_lower_bound NUMERIC, prediction_interval_upper_bound NUMERIC)
+            ),
+            removed_service_costs AS (
+                DELETE FROM service_costs sc
+                WHERE sc.cost_report_id IN (SELECT id FROM existing)
+                AND NOT EXISTS (
+                    SELECT 1 FROM incoming_service_costs i
+                    WHERE i.service_name = sc.service_name
+                )
+                RETURNING sc.id
+            ),
+            changed_service_costs AS (
+                UPDATE service_costs sc
+                SET cost = i.cost
+                FROM incoming_service_costs i
+                WHERE sc.cost_report_id = i.cost_report_id
+                AND sc.service_name = i.service_name
+                AND ABS(sc.cost - i.cost) > :tolerance::numeric
+                RETURNING sc.id
+            ),
+            added_service_costs AS (
+                INSERT INTO service_costs (cost_report_id, service_name, cost)
+                SELECT i.cost_report_id, i.service_name, i.cost
+                FROM incoming_service_costs i
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM service_costs sc
+                    WHERE sc.cost_report_id = i.cost_report_id
+                    AND sc.service_name = i.service_name
+                )
+                RETURNING id
+            ),
+            removed_forecasts AS (
+                DELETE FROM cost_forecasts cf
+                WHERE cf.cost_report_id IN (SELECT id FROM existing)
+                AND NOT EXISTS (
+                    SELECT 1 FROM incoming_forecasts i
+                    WHERE i.period_start = cf.period_start
+                    AND i.period_end = cf.period_end
+                )
+                RETURNING cf.id
+            ),
+            changed_forecasts AS (
+                UPDATE cost_forecasts cf
+                SET amount = i.amount,
+                    prediction_interval_lower_bound = i.prediction_interval_lower_bound,
+                    prediction_interval_upper_bound = i.prediction_interval_upper_bound
+                FROM incoming_forecasts i
+                WHERE cf.cost_report_id = i.cost_report_id
+                AND cf.period_start = i.period_start
+                AND cf.period_end = i.period_end
+                AND (
+                    ABS(cf.amount - i.amount) > :tolerance::numeric
+                    OR ABS(COALESCE(cf.prediction_interval_lower_bound, 0) - COALESCE(i.prediction_interval_lower_bound, 0)) > :tolerance::numeric
+                    OR ABS(COALESCE(cf.prediction_interval_upper_bound, 0) - COALESCE(i.prediction_interval_upper_bound, 0)) > :tolerance::numeric
+                )
+                RETURNING cf.id
+            ),
+            added_forecasts AS (
+                INSERT INTO cost_forecasts (cost_report_id, period_start, period_end, amount,
+                    prediction_interval_lower_bound, prediction_interval_upper_bound)
+                SELECT i.cost_report_id, i.period_start, i.period_end, i.amount,
+                    i.prediction_interval_lower_bound, i.prediction_interval_upper_bound
+                FROM incoming_forecasts i
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM cost_forecasts cf
+                    WHERE cf.cost_report_id = i.cost_report_id
+                    AND cf.period_start = i.period_start
+                    AND cf.period_end = i.period_end
+                )
+                RETURNING id
+            )
+            SELECT
+                (SELECT COUNT(*) FROM inserted) AS created,
+                (SELECT COUNT(*) FROM updated) AS updated,
+                (SELECT COUNT(*) FROM removed_service_costs)
+                    + (SELECT COUNT(*) FROM changed_service_costs)
+                    + (SELECT COUNT(*) FROM added_service_costs)
+                    + (SELECT COUNT(*) FROM removed_forecasts)
+                    + (SELECT COUNT(*) FROM changed_forecasts)
+                    + (SELECT COUNT(*) FROM added_forecasts) AS children_changed
+        """
+
+        response    = self.db.execute_statement(query, params, format_records=True, transaction_id=transaction_id)
+        result      = self.db._format_results(response=response, column_names=['created', 'updated', 'children_changed'], single_result=True) or {}
+
+        return {
+            'created': int(result.get('created') or 0),
+            'updated': int(result.get('updated') or 0),
+            'children_changed': int(result.get('children_changed') or 0)
+        }
 
     def process_cost_data(self, account_id: int, data: List[Dict]) -> Dict:
-        """Process cost data with duplicate handling"""
-        try:
-            # Process each cost report in the data
+        """
+        Process cost data with duplicate handling
+        Reports whose content hash matches the account snapshot are skipped, the others are synced
+        in one transaction, one statement per report
+        """
+        if not data:
+            return self.stats
 
-            for report in data:
+        known   = self._account_snapshot(account_id).cost_reports()
+        reports = [self._cost_report_params(account_id, report) for report in data]
+        changed = [params for params in reports if known.get((params['period_start'], params['period_end'])) != params['content_hash']]
 
-                # Check for existing cost report
-                existing_report = self.check_existing_cost_report(
-                    account_id,
-                    report['period']['start'],
-                    report['period']['end']
-                )
-                
-                # Prepare cost report data
-                cost_report_data = {
-                    'account_id': account_id,
-                    'current_period_cost': report.get('current_period_cost', 0),
-                    'previous_period_cost': report.get('previous_period_cost', 0),
-                    'cost_difference': report.get('cost_difference', 0),
-                    'cost_difference_percentage': report.get('cost_difference_percentage', 0),
-                    'potential_monthly_savings': report.get('potential_monthly_savings', 0),
-                    'anomalies_detected': report.get('anomalies_detected', 0),
-                    'saving_opportunities_count': report.get('saving_opportunities_count', 0),
-                    'period_start': report['period']['start'],
-                    'period_end': report['period']['end'],
-                    'period_granularity': report['period']['granularity']
-                }
+        self.stats['SKIPPED'] += len(reports) - len(changed)
+        if not changed:
+            return self.stats
 
+        transaction_id = self.db.begin_transaction()
+        try:
+            counts = {'CREATED': 0, 'UPDATED': 0, 'SKIPPED': 0}
 
-                cost_report_id = None
-                if existing_report:
-                    if self.has_data_changed(existing_report, cost_report_data):
-                        # Update existing report
-                        update_success = self.db.update(table='cost_reports',
-                                                        data=cost_report_data,
-                                                        condition='id = :id',
-                                                        params=existing_report)
+            # Process each new or changed cost report in the data
+            for params in changed:
+                result = self._sync_cost_report(params, transaction_id)
 
-                        if update_success:
-                            cost_report_id = existing_report['id']
-                            self.stats['UPDATED'] += 1
-                        else:
-                            raise Exception("Failed to update cost report")
-                    else:
-                        self.stats['SKIPPED'] += 1
-                        continue
+                # A report whose only changes are in its children still counts as updated
+                if result['created']:
+                    counts['CREATED'] += 1
+                elif result['updated'] or result['children_changed']:
+                    counts['UPDATED'] += 1
                 else:
-                    # Insert new cost report
-                    cost_report = self.db.insert('cost_reports', cost_report_data)
-                    cost_report_id = cost_report['id']
+                    counts['SKIPPED'] += 1
 
-                    if cost_report_id:
-                        self.stats['CREATED'] += 1
-                    else:
-                        raise Exception("Failed to insert cost report")
-
-                # Clean up existing related records
-                self.db.delete('service_costs', 'cost_report_id = :cost_report_id', {'cost_report_id': cost_report_id})
-                self.db.delete('cost_forecasts', 'cost_report_id = :cost_report_id', {'cost_report_id': cost_report_id})
-
-                # Process service costs
-                if report.get('top_services'):
-                    service_costs = [
-                        {
-                            'cost_report_id': cost_report_id,
-                            'service_name': service.get('service', ''),
-                            'cost': service.get('cost', 0)
-                        }
-                        for service in report['top_services']
-                    ]
-
-                    if service_costs and not self.db.bulk_insert('service_costs', service_costs):
-                        raise Exception("Failed to insert service costs")
-
-                # Process forecasts
-                if report.get('forecast'):
-                    forecasts = [
-                        {
-                            'cost_report_id': cost_report_id,
-                            'period_start': forecast['period']['start'],
-                            'period_end': forecast['period']['end'],
-                            'amount': forecast.get('amount', 0),
-                            'prediction_interval_lower_bound': forecast.get('prediction_interval_lower_bound', 0),
-                            'prediction_interval_upper_bound': forecast.get('prediction_interval_upper_bound', 0)
-                        }
-                        for forecast in report['forecast']
-                    ]
-
-                    if forecasts and not self.db.bulk_insert('cost_forecasts', forecasts):
-                        raise Exception("Failed to insert forecasts")
+            self.db.commit_transaction(transaction_id)
+
+            for key, value in counts.items():
+                self.stats[key] += value
 
             return self.stats
 
         except Exception as e:
             print(f"{FAIL} Error processing cost data: {str(e)}")
+            self.db.rollback_transaction(transaction_id)
             raise
 
     #4. Security
-    def _finding_exists(self, finding):
-        """Check if finding already exists"""
+    def _sweep_findings(self, security_id: int, finding_ids: List[str], seen_ids: List[str]) -> Dict[str, int]:
+        """
+        Mark the given findings of a security row (no longer reported) as REMOVED/ARCHIVED and purge closed
+        (RESOLVED, REMOVED or ARCHIVED) findings the source has not reported for FINDINGS_RETENTION_DAYS
+        Retention runs on last_seen_at, set by the loader, not on the updated_at of the source payload.
+        Findings reported by this load are stamped as seen (at most once a day for unchanged ones) and are
+        never purged, whatever their status and age. The content hash of a marked finding is cleared so it
+        is written again if it comes back
+        Args:
+            security_id (int): Security row the findings belong to
+            finding_ids (List[str]): Stale finding ids, from the account snapshot
+            seen_ids (List[str]): Finding ids reported by this load
+        Returns:
+            Dict[str, Any]: Number of stale and purged findings and the days (created_at) they belong to
+        """
+        query = """
+            WITH stale_ids AS (
+                SELECT jsonb_array_elements_text(:finding_ids::jsonb) AS finding_id
+            ),
+            seen_ids AS (
+                SELECT jsonb_array_elements_text(:seen_ids::jsonb) AS finding_id
+            ),
+            seen AS (
+                UPDATE findings f
+                SET last_seen_at = CURRENT_TIMESTAMP
+                WHERE f.security_id = :security_id
+                AND f.last_seen_at < CURRENT_TIMESTAMP - INTERVAL '1 day'
+                AND f.finding_id IN (SELECT finding_id FROM seen_ids)
+            ),
+            stale AS (
+                UPDATE findings f
+                SET status = 'REMOVED',
+                    record_state = 'ARCHIVED',
+                    content_hash = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE f.security_id = :security_id
+                AND f.status <> 'REMOVED'
+                AND f.finding_id IN (SELECT finding_id FROM stale_ids)
+                RETURNING f.id, f.created_at
+            ),
+            purged AS (
+                DELETE FROM findings f
+                WHERE f.security_id = :security_id
+                AND :retention_days > 0
+                AND (f.status IN ('RESOLVED', 'REMOVED') OR f.record_state = 'ARCHIVED' OR f.workflow_state = 'ARCHIVED')
+                AND f.last_seen_at < CURRENT_TIMESTAMP - make_interval(days => :retention_days)
+                AND f.finding_id NOT IN (SELECT finding_id FROM seen_ids)
+                AND f.finding_id NOT IN (SELECT finding_id FROM stale_ids)
+                RETURNING f.id, f.created_at
+            ),
+            swept_days AS (
+                SELECT created_at::date AS day FROM stale
+                UNION
+                SELECT created_at::date AS day FROM purged
+            )
+            SELECT (SELECT COUNT(*) FROM stale) AS stale, (SELECT COUNT(*) FROM purged) AS purged,
+                (SELECT COALESCE(jsonb_agg(day), '[]'::jsonb) FROM swept_days)::text AS days
+        """
+        params = {
+            'security_id'       : security_id,
+            'finding_ids'       : json.dumps(finding_ids),
+            'seen_ids'          : json.dumps(seen_ids),
+            'retention_days'    : FINDINGS_RETENTION_DAYS
+        }
+
+        response    = self.db.execute_statement(query, params, format_records=True)
+        result      = self.db._format_results(response=response, column_names=['stale', 'purged', 'days'], single_result=True) or {}
+
+        return {
+            'stale'     : int(result.get('stale') or 0),
+            'purged'    : int(result.get('purged') or 0),
+            'days'      : json.loads(result.get('days') or '[]')
+        }
+
+    @staticmethod
+    def _finding_day(created_at: Any) -> str:
+        """Day (UTC) a finding belongs to in the findings_daily rollup"""
+        try:
+            return datetime.fromisoformat(str(created_at).replace('Z', '+00:00')).astimezone(timezone.utc).date().isoformat()
+        except ValueError:
+            return str(created_at)[:10]
+
+    def _rollup_findings(self, account_id: int, days: List[str]) -> Dict[str, int]:
+        """
+        Recompute the findings_daily rollup of an account for the given days from the findings rows
+        Args:
+            account_id (int): Account primary key
+            days (List[str]): Days (findings created_at) written or swept by the load
+        Returns:
+            Dict[str, int]: Number of rollup rows upserted and removed
+        """
         query = """
-            SELECT id FROM findings
-            WHERE  finding_id = :finding_id
-            AND resource_id = :resource_id
-            AND security_id = :security_id::int
+            WITH days AS (
+                SELECT DISTINCT value::date AS day
+                FROM jsonb_array_elements_text(:days::jsonb)
+            ),
+            totals AS (
+                SELECT s.account_id, f.created_at::date AS day, f.severity, f.status,
+                    COALESCE(f.workflow_state, '') AS workflow_state, f.service, COALESCE(f.region, '') AS region,
+                    COUNT(*) AS finding_count,
+                    COALESCE(SUM(CASE
+                        WHEN f.status IN ('RESOLVED', 'REMOVED')
+                        THEN EXTRACT(DAY FROM AGE(f.updated_at, f.created_at))
+                    END), 0) AS resolution_days
+                FROM findings f
+                INNER JOIN security s ON s.id = f.security_id
+                WHERE s.account_id = :account_id
+                AND f.created_at::date IN (SELECT day FROM days)
+                GROUP BY s.account_id, f.created_at::date, f.severity, f.status,
+                    COALESCE(f.workflow_state, ''), f.service, COALESCE(f.region, '')
+            ),
+            upserted AS (
+                INSERT INTO findings_daily (account_id, day, severity, status, workflow_state, service, region,
+                    finding_count, resolution_days)
+                SELECT account_id, day, severity, status, workflow_state, service, region,
+                    finding_count, resolution_days
+                FROM totals
+                ON CONFLICT (account_id, day, severity, status, workflow_state, service, region) DO UPDATE
+                SET finding_count = EXCLUDED.finding_count,
+                    resolution_days = EXCLUDED.resolution_days,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE (findings_daily.finding_count, findings_daily.resolution_days)
+                    IS DISTINCT FROM (EXCLUDED.finding_count, EXCLUDED.resolution_days)
+                RETURNING 1
+            ),
+            removed AS (
+                DELETE FROM findings_daily d
+                WHERE d.account_id = :account_id
+                AND d.day IN (SELECT day FROM days)
+                AND NOT EXISTS (
+                    SELECT 1 FROM totals t
+                    WHERE t.day = d.day
+                    AND t.severity = d.severity
+                    AND t.status = d.status
+                    AND t.workflow_state = d.workflow_state
+                    AND t.service = d.service
+                    AND t.region = d.region
+                )
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM upserted) AS upserted, (SELECT COUNT(*) FROM removed) AS removed
         """
         params = {
-            'finding_id': finding.get('finding_id'),
-            'resource_id': finding.get('resource_id'),
-            'security_id': int(finding.get('security_id'))
+            'account_id'    : account_id,
+            'days'          : json.dumps(days)
+        }
+
+        response    = self.db.execute_statement(query, params, format_records=True)
+        result      = self.db._format_results(response=response, column_names=['upserted', 'removed'], single_result=True) or {}
+
+        return {
+            'upserted'  : int(result.get('upserted') or 0),
+            'removed'   : int(result.get('removed') or 0)
         }
-        return self.db.select_one(query, params)
 
     def process_security_data(self, account_id: int, security_data: Dict) -> None:
         """
         Process single security service data
+        Upserts the (account, service) security row, loads its new or changed findings and sweeps the
+        findings that disappeared from the source, all decided against the account snapshot
         """
         try:
-            # Check if security record exists
-            sql     = "SELECT id FROM security WHERE account_id = :account_id AND service = :service"
-            params  = {  'account_id': account_id,
-                        'service': security_data['service']
-                    }
-
-            existing_security = self.db.select_one(sql, params)
-
             # Prepare security record with counts from severity_counts
             security_record = {
                 'account_id'                : account_id,
@@ -1366,58 +3034,95 @@ class CoreUpdateDb:
                 'resolved_findings'         : security_data['resolved_findings']
             }
 
-            # Update or insert security record
-            if existing_security:
-                up = self.db.update(table="security", data=security_record, condition="id = :id", params={"id": existing_security['id']})
-                security_id = existing_security['id'] if up else None
-
+            snapshot                        = self._account_snapshot(account_id)
+            stored                          = snapshot.security().get(security_data['service'])
+            security_record['content_hash'] = AccountSnapshot.content_hash(security_record)
+
+            # Insert or update security record
+            query = """
+                INSERT INTO security (account_id, service, total_findings, critical_count, high_count,
+                    medium_count, low_count, informational_count, open_findings, resolved_findings, content_hash)
+                VALUES (:account_id, :service, :total_findings, :critical_count, :high_count,
+                    :medium_count, :low_count, :informational_count, :open_findings, :resolved_findings, :content_hash)
+                ON CONFLICT (account_id, service) DO UPDATE
+                SET total_findings = EXCLUDED.total_findings,
+                    critical_count = EXCLUDED.critical_count,
+                    high_count = EXCLUDED.high_count,
+                    medium_count = EXCLUDED.medium_count,
+                    low_count = EXCLUDED.low_count,
+                    informational_count = EXCLUDED.informational_count,
+                    open_findings = EXCLUDED.open_findings,
+                    resolved_findings = EXCLUDED.resolved_findings,
+                    content_hash = EXCLUDED.content_hash,
+                    updated_at = CURRENT_TIMESTAMP
+                RETURNING id
+            """
+            if stored and stored['content_hash'] == security_record['content_hash']:
+                security_id = stored['id']
             else:
-                hasCreated  = self.db.insert(table="security", data=security_record)
-                security_id = hasCreated
+                response    = self.db.execute_statement(query, security_record, format_records=True)
+                security    = self.db._format_results(response=response, column_names=['id'], single_result=True)
+                security_id = security['id'] if security else None
 
             if not security_id:
                 raise Exception(f"Failed to handle security record for service {security_data['service']}")
 
-            # Process findings
-            if(len(security_data['findings']) > 0):
-                # Process findings
-                successful_inserts = 0
-                successful_updates = 0
-
-                for finding in security_data['findings']:
-                    try:
-                        # Add security_id to the finding
-                        #finding['security_id'] = security_id
-                        finding['security_id'] = int(security_id) if security_id else None
-
-                        # Check if finding exists
-                        existing_finding = self._finding_exists(finding)
-
-                        if existing_finding is not None:
-                            # Update existing finding
-                            condition = "id = :id"
-                            finding['updated_at'] = datetime.now()
-
-                            if self.db.update("findings", finding, condition, {'id': existing_finding['id']}):
-                                successful_updates += 1
-                            else:
-                                print(f"{FAIL} Failed to update finding: {existing_finding['id']}")
-                        else:
-                            # Insert new finding
-                            if self.db.insert("findings", finding):
-                                successful_inserts += 1
-                            else:
-                                print(f"{FAIL} Failed to insert finding: {finding.get('id')}")
+            # Process findings, a list or (when streamed) an iterator of finding lists
+            findings    = security_data['findings']
+            chunks      = [findings] if isinstance(findings, list) else findings
+            known       = snapshot.findings(int(security_id))
+            seen        = set()
+            days        = set()
+            failed      = 0
+
+            for chunk in chunks:
+                METRICS.add_rows(len(chunk))
+                changed = []
+                for finding in chunk:
+                    # Add security_id to the finding
+                    finding['security_id']  = int(security_id)
+                    finding['content_hash'] = AccountSnapshot.content_hash({k: v for k, v in finding.items() if k != 'content_hash'})
+                    seen.add(finding['finding_id'])
+
+                    if known.get(finding['finding_id'], {}).get('content_hash') != finding['content_hash']:
+                        changed.append(finding)
+                        days.add(self._finding_day(finding.get('created_at')))
+
+                self.stats['SKIPPED'] += len(chunk) - len(changed)
+                if(len(changed) == 0):
+                    continue
+
+                counts = self.db.batch_upsert(
+                    table               = "findings",
+                    data                = changed,
+                    conflict_columns    = ['finding_id'],
+                    extra_updates       = {'updated_at': 'CURRENT_TIMESTAMP', 'last_seen_at': 'CURRENT_TIMESTAMP'}
+                )
 
-                    except Exception as e:
-                        print(f"{FAIL} Error processing finding {finding['finding_id']}: {str(e)}")
-                        continue
+                failed += counts['failed']
 
-                #print(f"Processing completed: {successful_inserts} inserted, {successful_updates} updated")
-                self.stats['CREATED']   += successful_inserts
-                self.stats['UPDATED']    += successful_updates
+                #print(f"Processing completed: {counts['created']} inserted, {counts['updated']} updated")
+                self.stats['CREATED']   += counts['created']
+                self.stats['UPDATED']   += counts['updated']
 
-                return  True
+            # Findings no longer reported are closed, closed ones not reported for the retention period are purged
+            stale = [finding_id for finding_id, row in known.items() if finding_id not in seen and row['status'] != 'REMOVED']
+            swept = self._sweep_findings(int(security_id), stale, sorted(seen))
+            self.stats['UPDATED']   += swept['stale']
+
+            if swept['purged']:
+                print(f"{DELETED} Purged {swept['purged']} closed finding(s) not reported for {FINDINGS_RETENTION_DAYS} days for service {security_data['service']}")
+
+            # Keep the daily rollup in step for the days this load wrote or swept
+            days.update(swept['days'])
+            if days:
+                self._rollup_findings(account_id, sorted(days))
+
+            # Failed findings keep their old content hash, the redelivered message loads them again
+            if failed:
+                raise Exception(f"Failed to load {failed} finding(s) for service {security_data['service']}")
+
+            return  True
 
         except Exception as e:
             print(f"{FAIL} Error processing security data: {str(e)}")
@@ -1435,18 +3140,42 @@ class CoreUpdateDb:
             return self.stats
 
         except Exception as e:
-            print(f"Error: {str(e)}")
-            self.stats['CREATED']   += 0
-            self.stats['UPDATED']   += 0
-            self.stats['SKIPPED']   += 0
-
-            return True
+            print(f"{FAIL} Error loading security findings: {str(e)}")
+            raise
 
     #5. Process Logs
     def process_logs(self, account_id, data):
+        """
+        Insert the log header and all of its messages in one statement
+        Identical messages (same type and text) in a file are stored once
+        """
         try:
             logs    = data['logs']
             date_of_entry = datetime.strptime(data['service'][0]['date_to'], '%Y-%m-%d') if(len(data['service']) > 0) else datetime.now()
+
+            # Keep the first occurrence of each message, in order
+            messages = {}
+            for m in logs['message']:
+                msg_type, msg_text = next(iter(m.items()))
+                messages.setdefault((msg_type, msg_text), {'message': msg_text, 'message_type': msg_type})
+
+            query = """
+                WITH log AS (
+                    INSERT INTO logs (account_id, date_created, account_status, cost_status,
+                        service_status, security_status, created_at, updated_at)
+                    VALUES (:account_id, :date_created::timestamp with time zone, :account_status, :cost_status,
+                        :service_status, :security_status, :created_at::timestamp with time zone, :updated_at::timestamp with time zone)
+                    RETURNING id
+                ),
+                messages AS (
+                    INSERT INTO log_messages (log_id, message, message_type, created_at)
+                    SELECT log.id, m.message, m.message_type, :created_at::timestamp with time zone
+                    FROM log
+                    CROSS JOIN jsonb_to_recordset(:messages::jsonb) AS m(message TEXT, message_type VARCHAR)
+                    RETURNING id
+                )
+                SELECT (SELECT id FROM log) AS id, (SELECT COUNT(*) FROM messages) AS message_count
+            """
             logs_data = {
                 'account_id'        : account_id,
                 'date_created'      : date_of_entry,
@@ -1455,37 +3184,27 @@ class CoreUpdateDb:
                 'service_status'    : logs['service'],
                 'security_status'   : logs['security'],
                 'created_at'        : date_of_entry,
-                'updated_at'        : datetime.now()
+                'updated_at'        : datetime.now(),
+                'messages'          : json.dumps(list(messages.values()))
             }
-            log_update          = self.db.insert('logs', logs_data)
-            
-            log_id              = log_update['id']
-            logs_messages       = logs['message']
-            if log_id:
-                if(len(logs_messages) > 0):
-                    for m in logs_messages:
-                        msg_type, msg_text = next(iter(m.items()))
-                        log_message = {
-                            'log_id'        : log_id,
-                            'message'       : msg_text,
-                            'message_type'  : msg_type,
-                            'created_at'    : date_of_entry
-                        }
-                        log_msg = self.db.insert('log_messages', log_message)
-                        if log_msg['id']:
-                            self.stats['CREATED'] += 1
-                        else:
-                            raise Exception("Failed to Insert Log Message")
-                    
+            self._ensure_partitions(['logs', 'log_messages'], [date_of_entry])
+
+            # A plain insert, a retry after an error that may follow the commit would store the log twice
+            response    = self.db.execute_statement(query, logs_data, format_records=True, idempotent=False)
+            log_update  = self.db._format_results(response=response, column_names=['id', 'message_count'], single_result=True)
+
+            if log_update and log_update['id']:
+                self.stats['CREATED'] += int(log_update['message_count'] or 0)
             else:
                 raise Exception("Failed to Insert logs")
-       
+
         except Exception as e:
             print(f"{FAIL}process_logs error: {str(e)}")
+            raise
 
-    def read_s3_file(self, s3_path):
+    def _get_s3_object(self, s3_path) -> Optional[Dict]:
         """
-        Read JSON data from S3 path
+        Open an S3 object, returns the get_object response (streaming Body) or None if it cannot be read
         s3_path format: s3://bucket-name/path/to/file.json
         """
         try:
@@ -1493,95 +3212,506 @@ class CoreUpdateDb:
             parsed_url = urlparse(s3_path)
             bucket_name = parsed_url.netloc
             s3_key = parsed_url.path.lstrip('/')  # Remove leading slash
-            
-            # Create S3 client
-            s3_client = boto3.client('s3')
-            
+
             # Get object from S3
-            response = s3_client.get_object(Bucket=bucket_name,Key=s3_key)
-            
+            return self.s3_client.get_object(Bucket=bucket_name,Key=s3_key)
+
+        except Exception as e:
+            #print(f"{ERROR} Error reading from S3 {bucket_name}/{s3_key}: {str(e)}")
+            return None
+
+    def read_s3_file(self, s3_path):
+        """
+        Read JSON data from S3 path
+        s3_path format: s3://bucket-name/path/to/file.json
+        """
+        try:
+            response = self._get_s3_object(s3_path)
+            if response is None:
+                return None
+
             # Read and parse JSON data
             json_data = json.loads(response['Body'].read().decode('utf-8'))
             return json_data
-            
+
         except Exception as e:
-            #print(f"{ERROR} Error reading from S3 {bucket_name}/{s3_key}: {str(e)}")
+            #print(f"{ERROR} Error reading from S3 {s3_path}: {str(e)}")
+            return None
+
+    def read_s3_sections(self, s3_path, response: Optional[Dict] = None) -> Optional[Iterator[Tuple[str, Any]]]:
+        """
+        Read the top level sections of an account file as (key, value) pairs
+        Files up to STREAM_THRESHOLD_BYTES are parsed whole, larger ones are parsed incrementally
+        and their 'security' value is an iterator of sections (see _iter_security_sections)
+        Args:
+            s3_path (str): s3://bucket-name/path/to/file.json
+            response (Dict, optional): get_object response of the file when it is already open
+        Returns:
+            Optional[Iterator[Tuple[str, Any]]]: Sections in document order or None if the file cannot be read
+        """
+        response = response or self._get_s3_object(s3_path)
+        if response is None:
+            return None
+
+        if response.get('ContentLength', 0) <= STREAM_THRESHOLD_BYTES:
+            try:
+                return iter(json.loads(response['Body'].read().decode('utf-8')).items())
+            except Exception as e:
+                return None
+
+        return self._iter_s3_sections(response['Body'])
+
+    def _iter_s3_sections(self, body) -> Iterator[Tuple[str, Any]]:
+        """Stream the top level sections of an S3 body, only 'security' is left unparsed"""
+        reader = JsonStreamReader(body.iter_chunks(chunk_size=STREAM_READ_BYTES))
+        for key in reader.iter_object():
+            if key == 'security':
+                sections = self._iter_security_sections(reader)
+                yield key, sections
+                # Skip whatever the consumer left unread so the reader stays in sync
+                for _ in sections:
+                    pass
+            else:
+                yield key, reader.read_value()
+
+    def _iter_security_sections(self, reader: JsonStreamReader) -> Iterator[Dict]:
+        """
+        Yield each security service section with 'findings' as an iterator of finding lists
+        The section is handed out as soon as its findings start, so the summary keys are expected
+        before 'findings'; otherwise the findings of that section are collected in memory
+        """
+        summary_keys = ('service', 'total_findings', 'severity_counts', 'open_findings', 'resolved_findings')
+
+        for _ in reader.iter_array():
+            section = {}
+            yielded = False
+            for key in reader.iter_object():
+                if key == 'findings' and not yielded and all(k in section for k in summary_keys):
+                    findings            = reader.iter_chunks(STREAM_FINDINGS_CHUNK)
+                    section['findings'] = findings
+                    yielded             = True
+                    yield section
+                    for _ in findings:
+                        pass
+                elif key == 'findings':
+                    section['findings'] = [f for chunk in reader.iter_chunks(STREAM_FINDINGS_CHUNK) for f in chunk]
+                else:
+                    section[key] = reader.read_value()
+
+            if not yielded:
+                yield section
+
+    @contextmanager
+    def _stage(self, name: str, entry: Optional[Dict[str, Any]] = None):
+        """Run a block as a load stage, timed in the invocation metrics and in the ledger entry of the file"""
+        started = time.perf_counter()
+        try:
+            with METRICS.stage(name):
+                yield
+        finally:
+            if entry is not None:
+                IngestLedger.add_timing(entry, name, started)
+
+    def _load_section(self, account_id: int, key: str, value: Any) -> None:
+        """Hand a services, cost or security section to its loader, raises if the loader failed"""
+        if key == 'service':
+            #3. Load Services Data
+            METRICS.add_rows(len(value))
+            if not self.process_services(account_pk=account_id, data=value):
+                raise Exception(f"Failed to load {len(value)} service row(s)")
+        elif key == 'cost':
+            #4. Load Cost Data
+            METRICS.add_rows(len(value))
+            self.process_cost_data(account_id= account_id, data=value)
+        elif key == 'security':
+            #5. Load Security Data
+            self.load_security_findings(account_id= account_id, data=value)
+
+    def _ingest_section(self, account_id: int, key: str, value: Any, entry: Dict[str, Any], previous: Dict[str, Optional[str]]) -> None:
+        """
+        Load a section unless its content hash matches the latest load of the account
+        The hash is only put in the ledger entry once the loader succeeded, a loader failure raises
+        so a resend of the same section is loaded again. Streamed security sections cannot be hashed
+        before they are read and are always loaded
+        """
+        section_hash = None
+        if INGEST_LEDGER and isinstance(value, list):
+            section_hash = AccountSnapshot.content_hash(value)
+            if section_hash == previous.get(key):
+                entry[f"{key}_hash"] = section_hash
+                entry['skipped_sections'].append(key)
+                return
+
+        with self._stage(self.SECTION_STAGES[key], entry):
+            self._load_section(account_id, key, value)
+
+        if section_hash:
+            entry[f"{key}_hash"] = section_hash
+
+    def _drop_loaded_message(self, rh: Dict, s3_path: str, loaded: Dict, delete_message: bool = True) -> bool:
+        """Acknowledge a message whose file was already loaded and delete the file"""
+        with self._stage('deletes'):
+            self.acks.add(receipt_handle=rh['receipt_handle'] if delete_message else None, s3_path=s3_path)
+
+        self.stats['DUPLICATES'] += 1
+        print(f"{DELETED} Duplicate - Message {rh['message_id']} was already loaded by message {loaded['message_id']} ({loaded['s3_path']})")
+        return False
+
+    def process_message(self, message: Dict, rh: Dict, delete_message: bool = True) -> Optional[bool]:
+        """
+        Load the S3 file referenced by a single SQS message body into the database
+        Sections are loaded as they are read, sections that arrive before the account are held back
+        until the account id is known. Before the file is parsed the ingest ledger is checked for an
+        earlier load of the same message or object, sections unchanged since the last load are skipped
+        Args:
+            message (Dict): Parsed SQS message body containing the S3 'path'
+            rh (Dict): Receipt handle and message id of the SQS message
+            delete_message (bool): Delete the message from SQS once handled, False when Lambda acknowledges it
+        Returns:
+            Optional[bool]: True if loaded, False if the file does not exist or was already loaded (message dropped),
+                None if it failed
+        """
+        entry       = IngestLedger.new_entry(rh['message_id'], message['path'], None)
+        previous    = {}
+
+        with self._stage('read', entry):
+            response                = self._get_s3_object(message['path'])
+            entry['object_etag']    = (response or {}).get('ETag')
+
+        if response is not None and INGEST_LEDGER:
+            with self._stage('ledger', entry):
+                try:
+                    loaded = self.ledger.find_loaded(entry['message_id'], entry['object_etag'])
+                except Exception as e:
+                    print(f"{FAIL} Ingest ledger lookup failed, loading {message['path']}: {str(e)}")
+                    loaded = None
+
+            if loaded:
+                response['Body'].close()
+                return self._drop_loaded_message(rh, message['path'], loaded, delete_message=delete_message)
+
+        with self._stage('read', entry):
+            sections = self.read_s3_sections(message['path'], response=response) if response is not None else None
+
+        if(sections is None):
+            print(f'{ERROR} Error - File does not exist in {message["path"]}, Message {rh["message_id"]} DELETED from SQS Queue')
+
+            #Delete the Message in SQS
+            if delete_message:
+                with self._stage('deletes'):
+                    self.acks.add(receipt_handle=rh['receipt_handle'])
+            return False
+
+        d           = {}
+        pending     = []
+        account_id  = None
+
+        for key, value in sections:
+            if key == 'account':
+                #2. Load Account Data
+                with self._stage('account', entry):
+                    account                 = self.process_account(data=value)
+                    account_id              = account['id']
+                    entry['account_id']     = account_id
+                    entry['account_hash']   = AccountSnapshot.content_hash(value)
+
+                if not account_id:
+                    return None
+
+                # Fresh snapshot per file, the loaders diff their sections against it
+                self._snapshot  = AccountSnapshot(self.db, account_id)
+
+                if INGEST_LEDGER:
+                    with self._stage('ledger', entry):
+                        try:
+                            previous = self.ledger.previous_hashes(account_id)
+                        except Exception as e:
+                            print(f"{FAIL} Ingest ledger lookup failed, loading every section: {str(e)}")
+
+                for pending_key, pending_value in pending:
+                    self._ingest_section(account_id, pending_key, pending_value, entry, previous)
+                pending = []
+
+            elif key in ('service', 'cost', 'security'):
+                if account_id:
+                    self._ingest_section(account_id, key, value, entry, previous)
+                else:
+                    if key == 'security' and not isinstance(value, list):
+                        # Streamed before the account, keep it in memory until the account is loaded
+                        value = [
+                                    {**section, 'findings': [f for chunk in section['findings'] for f in chunk]}
+                                    if 'findings' in section and not isinstance(section['findings'], list) else section
+                                    for section in value
+                                ]
+                    pending.append((key, value))
+
+            if key != 'security':
+                d[key] = value
+
+        if not account_id:
             return None
-        
-    def load_from_sqs(self, max_messages=100):
+
+        parsed_url      = urlparse(message['path'])
+        bucket_name     = parsed_url.netloc
+        s3_key          = parsed_url.path.lstrip('/')
+
+        #6. Load Logs Data
+        with self._stage('logs', entry):
+            self.process_logs(account_id, data=d)
+
+        #Record the load before the file and message are removed, a redelivery is then recognised
+        if INGEST_LEDGER:
+            with self._stage('ledger'):
+                try:
+                    self.ledger.record(entry)
+                except Exception as e:
+                    print(f"{FAIL} Could not record message {rh['message_id']} in the ingest ledger: {str(e)}")
+
+        #Delete the File in S3 and the Message in SQS, batched with other files (see AckBuffer)
+        with self._stage('deletes'):
+            self.acks.add(receipt_handle=rh['receipt_handle'] if delete_message else None, s3_path=message['path'])
+
+        print(f'{SUCCESS} Success - Processed from SQS: {rh["message_id"]} & S3: s3://{bucket_name}/{s3_key}')
+        return True
+
+    def _ensure_partitions(self, tables: List[str], dates: List[Any]) -> None:
+        """
+        Create the monthly partitions the given dates fall in, once per container and month
+        Args:
+            tables (List[str]): Partitioned tables, e.g. ['logs', 'log_messages']
+            dates (List[Any]): Dates (date, datetime or 'YYYY-MM-DD...' strings) about to be written
+        """
+        months  = {str(value)[:7] for value in dates if value}
+        missing = sorted((table, month) for table in tables for month in months if (table, month) not in _PARTITIONS)
+        if not missing:
+            return
+
+        for table, month in missing:
+            try:
+                self.db.execute_statement(
+                    "SELECT create_monthly_partitions(:parent, :first_day::date, :first_day::date)",
+                    {'parent': table, 'first_day': f"{month}-01"}
+                )
+                with _PARTITIONS_LOCK:
+                    _PARTITIONS.add((table, month))
+            except Exception as e:
+                # A concurrent loader may have created it, the insert itself reports a real gap
+                print(f"{ERROR} Could not create {table} partition for {month}: {str(e)}")
+
+    def maintain_partitions(self) -> None:
+        """
+        Create the partitions of the coming months and detach/drop the expired ones
+        Runs at most once every PARTITION_MAINTENANCE_TTL seconds per container
+        """
+        ran_at = _PARTITION_MAINTENANCE['ran_at']
+        if ran_at is not None and time.monotonic() - ran_at < PARTITION_MAINTENANCE_TTL:
+            return
+
+        try:
+            query = """
+                SELECT table_name, created_partitions, dropped_partitions
+                FROM maintain_partitions(:months_ahead, :services_keep_months, :logs_keep_months)
+            """
+            params = {
+                'months_ahead'          : PARTITION_MONTHS_AHEAD,
+                'services_keep_months'  : SERVICES_RETENTION_MONTHS,
+                'logs_keep_months'      : LOGS_RETENTION_MONTHS
+            }
+            response    = self.db.execute_statement(query, params, format_records=True)
+            results     = self.db._format_results(response=response, column_names=['table_name', 'created_partitions', 'dropped_partitions']) or []
+
+            for result in results:
+                if result.get('dropped_partitions'):
+                    print(f"{DELETED} Dropped {result['dropped_partitions']} expired partition(s) of {result['table_name']}")
+
+            _PARTITION_MAINTENANCE['ran_at'] = time.monotonic()
+        except Exception as e:
+            print(f"{FAIL} Partition maintenance failed: {str(e)}")
+
+    def _claim_view_refresh(self, view_name: str, changed: bool) -> bool:
+        """
+        Mark a materialized view as pending when the load changed rows and claim its refresh when it is
+        pending and was last refreshed more than VIEW_REFRESH_INTERVAL seconds ago
+        The claim is a single upsert on view_refreshes, so of the concurrent invocations only one refreshes
+        Args:
+            view_name (str): Materialized view name
+            changed (bool): This load created or updated rows
+        Returns:
+            bool: True if this invocation has to refresh the view
+        """
+        query = """
+            INSERT INTO view_refreshes AS v (view_name, pending, refreshed_at)
+            VALUES (:view_name, FALSE, CASE WHEN :changed = 1 THEN CURRENT_TIMESTAMP ELSE '-infinity'::timestamptz END)
+            ON CONFLICT (view_name) DO UPDATE
+            SET pending = (v.pending OR :changed = 1) AND v.refreshed_at >= CURRENT_TIMESTAMP - make_interval(secs => :interval),
+                refreshed_at = CASE
+                    WHEN (v.pending OR :changed = 1) AND v.refreshed_at < CURRENT_TIMESTAMP - make_interval(secs => :interval)
+                    THEN CURRENT_TIMESTAMP
+                    ELSE v.refreshed_at
+                END
+            RETURNING refreshed_at = CURRENT_TIMESTAMP AS claimed
+        """
+        params = {
+            'view_name' : view_name,
+            'changed'   : int(changed),
+            'interval'  : VIEW_REFRESH_INTERVAL
+        }
+
+        response    = self.db.execute_statement(query, params, format_records=True)
+        result      = self.db._format_results(response=response, column_names=['claimed'], single_result=True) or {}
+        return bool(result.get('claimed'))
+
+    def refresh_views(self) -> None:
+        """
+        Refresh the dashboard materialized views changed by this or an earlier load, at most once every
+        VIEW_REFRESH_INTERVAL seconds, instead of once per loaded file
+        """
+        changed = bool(self.stats.get('CREATED', 0) or self.stats.get('UPDATED', 0))
+
+        for view_name in MATERIALIZED_VIEWS:
+            try:
+                if not self._claim_view_refresh(view_name, changed):
+                    continue
+            except Exception as e:
+                print(f"{FAIL} Could not check the refresh of {view_name}: {str(e)}")
+                continue
+
+            if self.db.refresh_materialized_view(view_name, concurrently=True):
+                print(f"{SUCCESS} Refreshed {view_name}")
+            else:
+                # Leave it pending and due, the next invocation tries again
+                try:
+                    self.db.execute_statement(
+                        "UPDATE view_refreshes SET pending = TRUE, refreshed_at = '-infinity' WHERE view_name = :view_name",
+                        {'view_name': view_name}
+                    )
+                except Exception as e:
+                    print(f"{FAIL} Could not mark {view_name} for a new refresh: {str(e)}")
+
+    def load_from_sqs(self, max_messages=100, context=None):
         data            = []
-        s3_client       = boto3.client('s3')
-        
 
         #1. Fetch Data From Queue
-        data        = self.fetch_data(max_messages=max_messages)
-        account_id  = None
+        with self._stage('drain'):
+            data    = self.fetch_data(max_messages=max_messages, context=context) or []
         count       = 0
         loaded      = 0
-        
+
         print(f"Available Data in SQS : {len(data)}")
 
         if(len(data) > 0):
             print(f"(*Once the data is processed the records will be DELETED from the SQS Queue {ARN_SQS} and the file from the S3 Bucket {BUCKET})")
-            for a in data:
-                rh  = self.handle_arr[count]
-                d   = self.read_s3_file(a['path'])
-                if(d is not None):
-                    #2. Load Account Data
-                    account         = self.process_account(data=d['account'])
-                    account_id      = account['id']
-
-                    parsed_url      = urlparse(a['path'])
-                    bucket_name     = parsed_url.netloc
-                    s3_key          = parsed_url.path.lstrip('/')
-
-                    if(account_id):
-                        #3. Load Services Data
-                        self.process_services(account_pk=account_id, data=d['service'])
-                        
-                        #4. Load Cost Data
-                        self.process_cost_data(account_id= account_id, data=d['cost'])
-                        
-                        #5. Load Security Data
-                        self.load_security_findings(account_id= account_id, data=d['security'])
-                        
-                        #6. Load Logs Data
-                        self.process_logs(account_id, data=d)
-                        
-                        #Delete the File in S3
-                        s3_client.delete_object(Bucket=bucket_name,Key=s3_key)
-
-                        #Delete the Message in SQS
-                        self.sqs.delete_message(receipt_handle=rh['receipt_handle'])
-                        count = count + 1
-                        loaded = loaded + 1
-
-                        print(f'{SUCCESS} Success - Processed from SQS: {rh["message_id"]} & S3: s3://{bucket_name}/{s3_key}')
-                        
-                else:
-                    print(f'{ERROR} Error - File does not exist in {a["path"]}, Message {rh["message_id"]} DELETED from SQS Queue')
-                    
-                    #Delete the Message in SQS
-                    self.sqs.delete_message(receipt_handle=rh['receipt_handle'])
+            for status in self._process_messages(data, self.handle_arr):
+                if status is not None:
                     count = count + 1
-                    continue
+                if status:
+                    loaded = loaded + 1
             #print(f"{SUCCESS} Loaded {loaded}/{count} set(s) of data to {DB_NAME} ")
         else:
             print(f"{FAIL} No Records found in SQS: {ARN_SQS}")
 
+        #Delete what is left of the processed Files and Messages
+        with self._stage('deletes'):
+            self.acks.flush()
+
+        #7. Refresh Dashboard Views
+        with self._stage('views'):
+            self.refresh_views()
+
+        #8. Partition Maintenance
+        with self._stage('partitions'):
+            self.maintain_partitions()
+
         self.stats['TOTAL']     = count
         self.stats['LOADED']    = loaded
-        
+
+        return self.stats
+
+    def load_from_event(self, records: List[Dict]) -> Dict:
+        """
+        Load the SQS records delivered by the Lambda event source mapping
+        Successful records are acknowledged by Lambda, failed ones are reported back
+        in 'batchItemFailures' so only they become visible again (ReportBatchItemFailures)
+        Args:
+            records (List[Dict]): event['Records'] of an SQS triggered invocation
+        Returns:
+            Dict: Stats including the 'batchItemFailures' partial batch response
+        """
+        count       = 0
+        loaded      = 0
+        failures    = []
+
+        print(f"Received Records from SQS : {len(records)}")
+
+        messages    = []
+        handles     = []
+        for record in records:
+            rh = {
+                    "receipt_handle"    : record['receiptHandle'],
+                    "message_id"        : record['messageId']
+                 }
+            try:
+                messages.append(json.loads(record['body']))
+                handles.append(rh)
+            except Exception as e:
+                print(f"{ERROR} Failed to parse message {rh['message_id']} - {str(e)}")
+                failures.append({'itemIdentifier': rh['message_id']})
+
+        for rh, status in zip(handles, self._process_messages(messages, handles, delete_message=False)):
+            if status is None:
+                failures.append({'itemIdentifier': rh['message_id']})
+                continue
+
+            count = count + 1
+            if status:
+                loaded = loaded + 1
+
+        #Delete what is left of the processed Files, Lambda deletes the Messages
+        with self._stage('deletes'):
+            self.acks.flush()
+
+        #7. Refresh Dashboard Views
+        with self._stage('views'):
+            self.refresh_views()
+
+        #8. Partition Maintenance
+        with self._stage('partitions'):
+            self.maintain_partitions()
+
+        self.stats['TOTAL']             = count
+        self.stats['LOADED']            = loaded
+        self.stats['batchItemFailures'] = failures
+
         return self.stats
 
-  
-""" 5. METHODS FOR LAMBDA """
-def test_connection():
-    check = TestAwsServices()
-    return check.test_obs_360_connection()
+
+""" 11. METHODS FOR LAMBDA """
+_HEALTH_CHECK = {'passed_at': None}
+
+def test_connection(force=False):
+    """
+    Run the connection test once per container and trust a pass for HEALTH_CHECK_TTL seconds
+    In between, failures surface from the real calls and invalidate_health_check() forces a new test
+    Args:
+        force (bool): Always run the full test (the 'health' event)
+    """
+    passed_at = _HEALTH_CHECK['passed_at']
+    if not force and passed_at is not None and time.monotonic() - passed_at < HEALTH_CHECK_TTL:
+        return True
+
+    check   = TestAwsServices()
+    passed  = check.test_obs_360_connection()
+
+    # Only a pass is cached, a failing container keeps testing on every invocation
+    _HEALTH_CHECK['passed_at'] = time.monotonic() if passed else None
+    return passed
+
+def invalidate_health_check():
+    """Make the next invocation run the full connection test again"""
+    _HEALTH_CHECK['passed_at'] = None
 
 def process_data_status(status):
-    status_arr = [0, 0, 0]
+    status_arr = [0, 0, 0, 0, 0]
     
     if(len(status) > 0):
         status_arr = [
@@ -1603,27 +3733,66 @@ def process_data_status(status):
     return [total, loaded, not_loaded]
 
 def lambda_handler(event=None, context=None):
-    result = {}
-    if(test_connection()):
+    result  = {}
+    records = event.get('Records', []) if isinstance(event, dict) else []
+
+    # Operator health check, always runs the full connection test
+    if isinstance(event, dict) and event.get('type') == 'health':
+        return {'healthy': test_connection(force=True)}
+
+    # Stage metrics of this invocation, 'profile' adds cProfile / tracemalloc top entries
+    METRICS.reset(profile=bool(event.get('profile')) if isinstance(event, dict) else False)
+    DATA_API_RETRY.reset()
+
+    with METRICS.stage('health'):
+        connected = test_connection()
+
+    if(connected):
         print("*"*15,"Connected","*"*15)
         try:
-            # Get max_messages from event or use default value of 10
-            max_messages = 10
-            if event and isinstance(event, dict) and 'max_messages' in event:
-                max_messages = int(event['max_messages'])
+            # Get concurrency from event or use default value of FILE_CONCURRENCY
+            concurrency = FILE_CONCURRENCY
+            if event and isinstance(event, dict) and 'concurrency' in event:
+                concurrency = int(event['concurrency'])
 
-            core    = CoreUpdateDb()  # Replace with your core class initialization
-            result  = core.load_from_sqs(max_messages=max_messages)
+            core    = CoreUpdateDb(concurrency=concurrency)  # Replace with your core class initialization
+
+            if records:
+                # Triggered by the SQS event source mapping, process the records handed to us
+                result  = METRICS.profiled(core.load_from_event, records)
+            else:
+                # Scheduled or manual run, poll the queue
+                # Get max_messages from event or use default value of 10
+                max_messages = 10
+                if event and isinstance(event, dict) and 'max_messages' in event:
+                    max_messages = int(event['max_messages'])
+
+                result  = METRICS.profiled(core.load_from_sqs, max_messages=max_messages, context=context)
 
         except Exception as e:
             print(f"{ERROR} Failed to process file - {str(e)}")
+            invalidate_health_check()
         print("*"*14,"Disconnected","*"*13)
 
-        res = process_data_status(result)
-        return res
+        res     = process_data_status(result)
+        output  = {'status': res, 'metrics': METRICS.emit()}
+
+        profile = METRICS.profile_report()
+        if profile:
+            print("\n".join(profile['cpu'] + profile['memory']))
+            output['profile'] = profile
+
+        if records:
+            # Partial batch response, anything not reported as processed is retried
+            failures = result.get('batchItemFailures') if 'batchItemFailures' in result else [{'itemIdentifier': r['messageId']} for r in records]
+            return {'batchItemFailures': failures, **output}
+
+        return output
 
     else:
         print("*"*13,"Not Connected","*"*13)
+        if records:
+            return {'batchItemFailures': [{'itemIdentifier': r['messageId']} for r in records]}
         return False
 
 # Uncomment the line below for development only
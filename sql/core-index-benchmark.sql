@@ -0,0 +1,164 @@
+-- Ingest Lookup Index Benchmark
+-- Compares the CoreUpdateDb lookups with the single column indexes of core-schema.sql (before) against the
+-- composite unique keys of core-table-patch.sql --05 (after), at 1M services rows.
+-- Runs in a scratch schema and drops it at the end:  psql -h <host> -d core -f sql/core-index-benchmark.sql
+--
+-- Measured on PostgreSQL 16.2, 1 vCPU, default settings (two runs, avg ms per lookup over 2000 random keys):
+--   lookup         before            after             speedup
+--   services       2.174 / 2.220     0.052 / 0.085     41.5x / 26.0x
+--   cost_reports   0.114 / 0.076     0.035 / 0.055      3.3x /  1.4x
+--   security       0.080 / 0.084     0.028 / 0.046      2.9x /  1.8x
+--   findings       0.041 / 0.053     0.043 / 0.066      1.0x /  0.8x  (finding_id is already unique, the key is not in --05)
+-- EXPLAIN ANALYZE of the services lookup: BitmapAnd of idx_services_account_id and idx_services_date_range
+-- (100000 index rows read, 49 removed by filter, 141 buffers, 2.1-3.3 ms) before, a single Index Scan on
+-- services_account_service_period_key (4 buffers, 0.04-0.05 ms) after.
+
+\set ON_ERROR_STOP on
+\timing off
+
+DROP SCHEMA IF EXISTS bench_index CASCADE;
+CREATE SCHEMA bench_index;
+SET search_path TO bench_index;
+
+--01 Tables (same columns the lookups use)
+CREATE TABLE services (
+    id SERIAL PRIMARY KEY,
+    account_id INTEGER NOT NULL,
+    service VARCHAR(255) NOT NULL,
+    date_from DATE NOT NULL,
+    date_to DATE NOT NULL,
+    cost DECIMAL(20,10) NOT NULL
+);
+
+CREATE TABLE cost_reports (
+    id SERIAL PRIMARY KEY,
+    account_id INTEGER NOT NULL,
+    current_period_cost NUMERIC(20,10) NOT NULL,
+    period_start DATE NOT NULL,
+    period_end DATE NOT NULL
+);
+
+CREATE TABLE security (
+    id SERIAL PRIMARY KEY,
+    account_id INTEGER NOT NULL,
+    service VARCHAR(255) NOT NULL
+);
+
+CREATE TABLE findings (
+    id SERIAL PRIMARY KEY,
+    security_id INTEGER NOT NULL,
+    finding_id VARCHAR(255) NOT NULL,
+    resource_id VARCHAR(255),
+    UNIQUE(finding_id)
+);
+
+--02 Data: 2,000 accounts, 1M services rows, 200k cost reports, 20k security rows, 500k findings
+INSERT INTO services (account_id, service, date_from, date_to, cost)
+SELECT g % 2000 + 1, 'service-' || (g / 2000 % 50), DATE '2024-01-01' + g / 100000, DATE '2024-01-01' + g / 100000 + 1, random() * 100
+FROM generate_series(0, 999999) g;
+
+INSERT INTO cost_reports (account_id, current_period_cost, period_start, period_end)
+SELECT g % 2000 + 1, random() * 1000, DATE '2020-01-01' + (g / 2000) * 7, DATE '2020-01-01' + (g / 2000) * 7 + 6
+FROM generate_series(0, 199999) g;
+
+INSERT INTO security (account_id, service)
+SELECT g % 2000 + 1, 'service-' || (g / 2000)
+FROM generate_series(0, 19999) g;
+
+INSERT INTO findings (security_id, finding_id, resource_id)
+SELECT g % 20000 + 1, 'finding-' || g, 'resource-' || g
+FROM generate_series(0, 499999) g;
+
+--03 Baseline indexes (core-schema.sql before the composite keys)
+CREATE INDEX idx_services_account_id ON services(account_id);
+CREATE INDEX idx_services_service ON services(service);
+CREATE INDEX idx_services_date_range ON services(date_from, date_to);
+CREATE INDEX idx_cost_reports_account_id ON cost_reports(account_id);
+CREATE INDEX idx_cost_reports_period ON cost_reports(period_start, period_end);
+CREATE INDEX idx_security_account_id ON security(account_id);
+CREATE INDEX idx_security_service ON security(service);
+CREATE INDEX idx_findings_security_id ON findings(security_id);
+
+ANALYZE;
+
+--04 Lookups, each driven by a random key in [0, key_space) that maps back onto the generated rows
+CREATE TABLE lookups (
+    name TEXT PRIMARY KEY,
+    key_space INTEGER NOT NULL,
+    sql TEXT NOT NULL
+);
+
+INSERT INTO lookups VALUES
+('services', 1000000,
+ 'SELECT id FROM services WHERE account_id = $1 % 2000 + 1 AND service = ''service-'' || ($1 / 2000 % 50)
+  AND date_from = DATE ''2024-01-01'' + $1 / 100000 AND date_to = DATE ''2024-01-01'' + $1 / 100000 + 1'),
+('cost_reports', 200000,
+ 'SELECT id FROM cost_reports WHERE account_id = $1 % 2000 + 1
+  AND period_start = DATE ''2020-01-01'' + ($1 / 2000) * 7 AND period_end = DATE ''2020-01-01'' + ($1 / 2000) * 7 + 6'),
+('security', 20000,
+ 'SELECT id FROM security WHERE account_id = $1 % 2000 + 1 AND service = ''service-'' || ($1 / 2000)'),
+('findings', 500000,
+ 'SELECT id FROM findings WHERE finding_id = ''finding-'' || $1 AND resource_id = ''resource-'' || $1
+  AND security_id = $1 % 20000 + 1');
+
+CREATE TABLE results (
+    phase TEXT NOT NULL,
+    name TEXT NOT NULL,
+    iterations INTEGER NOT NULL,
+    avg_ms NUMERIC NOT NULL,
+    PRIMARY KEY (phase, name)
+);
+
+CREATE FUNCTION run_lookups(run_phase TEXT, run_iterations INTEGER DEFAULT 2000) RETURNS VOID AS $$
+DECLARE
+    lookup RECORD;
+    started TIMESTAMPTZ;
+    hit INTEGER;
+BEGIN
+    FOR lookup IN SELECT * FROM lookups LOOP
+        started := clock_timestamp();
+        FOR i IN 1..run_iterations LOOP
+            EXECUTE lookup.sql INTO hit USING (random() * (lookup.key_space - 1))::INTEGER;
+        END LOOP;
+        INSERT INTO results VALUES (
+            run_phase, lookup.name, run_iterations,
+            EXTRACT(EPOCH FROM clock_timestamp() - started) * 1000 / run_iterations
+        );
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+--05 Before
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT id FROM services WHERE account_id = 42 AND service = 'service-7' AND date_from = DATE '2024-01-05' AND date_to = DATE '2024-01-06';
+
+SELECT run_lookups('before');
+
+--06 Composite unique keys (as in core-table-patch.sql --05 plus the findings key it leaves out, CONCURRENTLY is not needed on the scratch tables)
+CREATE UNIQUE INDEX services_account_service_period_key ON services(account_id, service, date_from, date_to);
+CREATE UNIQUE INDEX cost_reports_account_period_key ON cost_reports(account_id, period_start, period_end);
+CREATE UNIQUE INDEX security_account_service_key ON security(account_id, service);
+CREATE UNIQUE INDEX findings_finding_resource_security_key ON findings(finding_id, resource_id, security_id);
+
+ANALYZE;
+
+--07 After
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT id FROM services WHERE account_id = 42 AND service = 'service-7' AND date_from = DATE '2024-01-05' AND date_to = DATE '2024-01-06';
+
+SELECT run_lookups('after');
+
+--08 Report
+SELECT
+    b.name as lookup,
+    b.iterations,
+    ROUND(b.avg_ms, 4) as before_avg_ms,
+    ROUND(a.avg_ms, 4) as after_avg_ms,
+    ROUND(b.avg_ms / NULLIF(a.avg_ms, 0), 1) as speedup
+FROM results b
+INNER JOIN results a ON a.name = b.name AND a.phase = 'after'
+WHERE b.phase = 'before'
+ORDER BY b.name;
+
+RESET search_path;
+DROP SCHEMA bench_index CASCADE;
@@ -53,9 +53,9 @@ CREATE TABLE alternate_contacts (
 
 
 /* Services Table Schema */
--- Create the services table
+-- Create the services table, partitioned by month of date_from (see Partition Management)
 CREATE TABLE services (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     account_id INTEGER NOT NULL REFERENCES accounts(id),
     service VARCHAR(255) NOT NULL,
     date_from DATE NOT NULL,
@@ -65,10 +65,13 @@ CREATE TABLE services (
     utilization DECIMAL(20,10),
     utilization_unit VARCHAR(100),
     usage_types VARCHAR[] DEFAULT '{}',
+    content_hash VARCHAR(64),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    CONSTRAINT date_check CHECK (date_to >= date_from)
-);
+    PRIMARY KEY (id, date_from),
+    CONSTRAINT date_check CHECK (date_to >= date_from),
+    CONSTRAINT services_account_service_period_key UNIQUE (account_id, service, date_from, date_to)
+) PARTITION BY RANGE (date_from);
 
 
 /*Cost Table Schema*/
@@ -89,7 +92,9 @@ CREATE TABLE cost_reports (
     period_start DATE NOT NULL,
     period_end DATE NOT NULL,
     period_granularity period_granularity_type NOT NULL,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    content_hash VARCHAR(64),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT cost_reports_account_period_key UNIQUE (account_id, period_start, period_end)
 );
 
 -- Create the services cost table for top services
@@ -130,8 +135,10 @@ CREATE TABLE security (
     informational_count INTEGER NOT NULL DEFAULT 0,
     open_findings INTEGER NOT NULL DEFAULT 0,
     resolved_findings INTEGER NOT NULL DEFAULT 0,
+    content_hash VARCHAR(64),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT security_account_service_key UNIQUE (account_id, service)
 );
 
 -- Create the findings table
@@ -158,6 +165,8 @@ CREATE TABLE findings (
     product_arn VARCHAR(255),
     generator_id VARCHAR(255),
     generator VARCHAR(255),
+    content_hash VARCHAR(64),
+    last_seen_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,  -- last load that reported the finding, drives the retention purge
     UNIQUE(finding_id)
 );
 
@@ -184,26 +193,89 @@ CREATE TABLE product_accounts (
 );
 
 
--- Create the logs table
+-- Create the logs table, partitioned by month of date_created (see Partition Management)
 CREATE TABLE logs (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     account_id INTEGER NOT NULL REFERENCES accounts(id),
-    date_created TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    date_created TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
     account_status VARCHAR(50) NOT NULL,
     cost_status VARCHAR(50) NOT NULL,
     service_status VARCHAR(50) NOT NULL,
     security_status VARCHAR(50) NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-);
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, date_created)
+) PARTITION BY RANGE (date_created);
 
 -- Create the log_messages table for storing messages
+-- created_at is the date_created of its log, so a log and its messages share the same month partition
 CREATE TABLE log_messages (
-    id SERIAL PRIMARY KEY,
-    log_id INTEGER NOT NULL REFERENCES logs(id) ON DELETE CASCADE,
+    id SERIAL,
+    log_id INTEGER NOT NULL,
     message TEXT NOT NULL,
     message_type VARCHAR(50),
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at),
+    FOREIGN KEY (log_id, created_at) REFERENCES logs(id, date_created) ON DELETE CASCADE
+) PARTITION BY RANGE (created_at);
+
+/* Daily Rollups */
+-- Maintained by the Receiver Lambda for the days touched by each load, read by the trend and summary views
+
+-- Create the services daily rollup (account x service x day)
+CREATE TABLE services_daily (
+    account_id INTEGER NOT NULL REFERENCES accounts(id),
+    service VARCHAR(255) NOT NULL,
+    day DATE NOT NULL,
+    cost NUMERIC(20,10) NOT NULL DEFAULT 0,
+    utilization NUMERIC(20,10),
+    service_rows INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, service, day)
+);
+
+-- Create the findings daily rollup (account x severity x status x workflow x service x region x day)
+-- Missing workflow_state and region are stored as '' so they can be part of the key
+CREATE TABLE findings_daily (
+    account_id INTEGER NOT NULL REFERENCES accounts(id),
+    day DATE NOT NULL,
+    severity VARCHAR(50) NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    workflow_state VARCHAR(50) NOT NULL DEFAULT '',
+    service VARCHAR(255) NOT NULL,
+    region VARCHAR(50) NOT NULL DEFAULT '',
+    finding_count INTEGER NOT NULL DEFAULT 0,
+    resolution_days NUMERIC NOT NULL DEFAULT 0,  -- sum of days to resolve for RESOLVED / REMOVED findings
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, day, severity, status, workflow_state, service, region)
+);
+
+/* Ingest Ledger */
+-- One row per loaded SQS message, written by the Receiver Lambda once the file is loaded.
+-- Redelivered messages and unchanged payload sections are recognised from it without reloading,
+-- stage_timings keeps the seconds spent per stage ({"lookup": .., "read": .., "service": .., ...})
+CREATE TABLE ingest_ledger (
+    message_id VARCHAR(100) PRIMARY KEY,
+    s3_path TEXT NOT NULL,
+    object_etag VARCHAR(100),
+    account_id INTEGER REFERENCES accounts(id),
+    account_hash VARCHAR(64),
+    service_hash VARCHAR(64),
+    cost_hash VARCHAR(64),
+    security_hash VARCHAR(64),
+    skipped_sections VARCHAR[] DEFAULT '{}',
+    stage_timings JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+/* Materialized View Refreshes */
+-- One row per materialized view refreshed by the Receiver Lambda. A load that changed rows marks the
+-- view pending, the refresh is claimed once the last one is VIEW_REFRESH_INTERVAL seconds old.
+CREATE TABLE view_refreshes (
+    view_name VARCHAR(100) PRIMARY KEY,
+    pending BOOLEAN NOT NULL DEFAULT FALSE,
+    refreshed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT '-infinity'
 );
 
 /* Set Indexes */
@@ -244,4 +316,93 @@ CREATE INDEX idx_products_owner ON products(owner);
 -- Create index for frequent queries
 CREATE INDEX idx_logs_account_id ON logs(account_id);
 CREATE INDEX idx_logs_date_created ON logs(date_created);
-CREATE INDEX idx_log_messages_log_id ON log_messages(log_id);
+CREATE INDEX idx_log_messages_log_id ON log_messages(log_id, created_at);
+
+-- Rollups - Create indexes
+CREATE INDEX idx_services_daily_day ON services_daily(day);
+CREATE INDEX idx_findings_daily_day ON findings_daily(day);
+
+-- Ingest Ledger - Create indexes
+CREATE INDEX idx_ingest_ledger_object_etag ON ingest_ledger(object_etag);
+CREATE INDEX idx_ingest_ledger_account_completed ON ingest_ledger(account_id, completed_at DESC);
+
+/* Partition Management */
+-- services, logs and log_messages are range partitioned by month, partitions are named <table>_YYYY_MM.
+-- The Receiver Lambda creates the partitions a load needs and runs maintain_partitions periodically,
+-- expired months are detached and dropped instead of deleted row by row.
+
+-- Create the monthly partitions of a table covering first_day .. last_day
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent TEXT, first_day DATE, last_day DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    part_month DATE := date_trunc('month', COALESCE(first_day, CURRENT_DATE))::date;
+    last_month DATE := date_trunc('month', COALESCE(last_day, CURRENT_DATE))::date;
+    part_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE part_month <= last_month LOOP
+        part_name := format('%s_%s', parent, to_char(part_month, 'YYYY_MM'));
+        IF to_regclass(part_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                part_name, parent, part_month, (part_month + INTERVAL '1 month')::date);
+            created := created + 1;
+        END IF;
+        part_month := (part_month + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Detach and drop the monthly partitions older than keep_months full months (0 keeps everything)
+CREATE OR REPLACE FUNCTION drop_expired_partitions(parent TEXT, keep_months INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    cutoff DATE;
+    part RECORD;
+    dropped INTEGER := 0;
+BEGIN
+    IF COALESCE(keep_months, 0) <= 0 THEN
+        RETURN 0;
+    END IF;
+
+    cutoff := (date_trunc('month', CURRENT_DATE) - make_interval(months => keep_months))::date;
+
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        INNER JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = parent::regclass
+        AND c.relname ~ ('^' || parent || '_[0-9]{4}_[0-9]{2}$')
+        AND to_date(right(c.relname, 7), 'YYYY_MM') < cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', parent, part.relname);
+        EXECUTE format('DROP TABLE %I', part.relname);
+        dropped := dropped + 1;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create the partitions for the coming months and expire the old ones (log_messages before the logs they reference)
+CREATE OR REPLACE FUNCTION maintain_partitions(months_ahead INTEGER, services_keep_months INTEGER, logs_keep_months INTEGER)
+RETURNS TABLE(table_name TEXT, created_partitions INTEGER, dropped_partitions INTEGER) AS $$
+DECLARE
+    last_day DATE := (CURRENT_DATE + make_interval(months => GREATEST(months_ahead, 0)))::date;
+BEGIN
+    RETURN QUERY SELECT 'services'::TEXT,
+        create_monthly_partitions('services', CURRENT_DATE, last_day),
+        drop_expired_partitions('services', services_keep_months);
+    RETURN QUERY SELECT 'log_messages'::TEXT,
+        create_monthly_partitions('log_messages', CURRENT_DATE, last_day),
+        drop_expired_partitions('log_messages', logs_keep_months);
+    RETURN QUERY SELECT 'logs'::TEXT,
+        create_monthly_partitions('logs', CURRENT_DATE, last_day),
+        drop_expired_partitions('logs', logs_keep_months);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Initial partitions, the last 12 months and the next 3
+SELECT create_monthly_partitions('services', (CURRENT_DATE - INTERVAL '12 months')::date, (CURRENT_DATE + INTERVAL '3 months')::date);
+SELECT create_monthly_partitions('logs', (CURRENT_DATE - INTERVAL '12 months')::date, (CURRENT_DATE + INTERVAL '3 months')::date);
+SELECT create_monthly_partitions('log_messages', (CURRENT_DATE - INTERVAL '12 months')::date, (CURRENT_DATE + INTERVAL '3 months')::date);
@@ -8,3 +8,362 @@ DROP CONSTRAINT IF EXISTS accounts_account_email_key;
 ALTER TABLE accounts 
 DROP CONSTRAINT IF EXISTS accounts_account_arn_key;
 
+
+
+--02 Services Unique Period Key (required by the bulk upsert in CoreUpdateDb.process_services)
+
+-- Remove duplicate services rows, keeping the most recently updated one (rows without updated_at rank last)
+DELETE FROM services s
+USING (
+    SELECT id, date_from,
+           ROW_NUMBER() OVER (
+               PARTITION BY account_id, service, date_from, date_to
+               ORDER BY updated_at DESC NULLS LAST, id DESC
+           ) AS rn
+    FROM services
+) d
+WHERE s.id = d.id
+AND s.date_from = d.date_from
+AND d.rn > 1;
+
+-- Build the index without blocking writes, then attach it as the constraint (run outside a transaction)
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS services_account_service_period_key
+ON services(account_id, service, date_from, date_to);
+
+ALTER TABLE services
+ADD CONSTRAINT services_account_service_period_key UNIQUE USING INDEX services_account_service_period_key;
+
+
+--03 Security Unique Service Key (required by the security upsert in CoreUpdateDb.process_security_data)
+
+-- Move findings to the most recently updated security row of each (account_id, service)
+UPDATE findings f
+SET security_id = keep.id
+FROM security s
+JOIN LATERAL (
+    SELECT k.id
+    FROM security k
+    WHERE k.account_id = s.account_id
+    AND k.service = s.service
+    ORDER BY k.updated_at DESC NULLS LAST, k.id DESC
+    LIMIT 1
+) keep ON TRUE
+WHERE f.security_id = s.id
+AND s.id <> keep.id;
+
+-- Remove the duplicate security rows (same ordering as above, so the kept row is the one findings moved to)
+DELETE FROM security s
+USING (
+    SELECT id,
+           ROW_NUMBER() OVER (
+               PARTITION BY account_id, service
+               ORDER BY updated_at DESC NULLS LAST, id DESC
+           ) AS rn
+    FROM security
+) d
+WHERE s.id = d.id
+AND d.rn > 1;
+
+-- Build the index without blocking writes, then attach it as the constraint (run outside a transaction)
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS security_account_service_key
+ON security(account_id, service);
+
+ALTER TABLE security
+ADD CONSTRAINT security_account_service_key UNIQUE USING INDEX security_account_service_key;
+
+
+
+--04 Daily Rollup Tables (maintained by CoreUpdateDb, read by the trend and summary views)
+
+CREATE TABLE IF NOT EXISTS services_daily (
+    account_id INTEGER NOT NULL REFERENCES accounts(id),
+    service VARCHAR(255) NOT NULL,
+    day DATE NOT NULL,
+    cost NUMERIC(20,10) NOT NULL DEFAULT 0,
+    utilization NUMERIC(20,10),
+    service_rows INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, service, day)
+);
+
+CREATE TABLE IF NOT EXISTS findings_daily (
+    account_id INTEGER NOT NULL REFERENCES accounts(id),
+    day DATE NOT NULL,
+    severity VARCHAR(50) NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    workflow_state VARCHAR(50) NOT NULL DEFAULT '',
+    service VARCHAR(255) NOT NULL,
+    region VARCHAR(50) NOT NULL DEFAULT '',
+    finding_count INTEGER NOT NULL DEFAULT 0,
+    resolution_days NUMERIC NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, day, severity, status, workflow_state, service, region)
+);
+
+CREATE INDEX IF NOT EXISTS idx_services_daily_day ON services_daily(day);
+CREATE INDEX IF NOT EXISTS idx_findings_daily_day ON findings_daily(day);
+
+-- Backfill the rollups from the existing rows
+INSERT INTO services_daily (account_id, service, day, cost, utilization, service_rows)
+SELECT account_id, service, date_from, SUM(cost), SUM(utilization), COUNT(*)
+FROM services
+GROUP BY account_id, service, date_from
+ON CONFLICT DO NOTHING;
+
+INSERT INTO findings_daily (account_id, day, severity, status, workflow_state, service, region, finding_count, resolution_days)
+SELECT
+    s.account_id,
+    f.created_at::date,
+    f.severity,
+    f.status,
+    COALESCE(f.workflow_state, ''),
+    f.service,
+    COALESCE(f.region, ''),
+    COUNT(*),
+    COALESCE(SUM(CASE WHEN f.status IN ('RESOLVED', 'REMOVED') THEN EXTRACT(DAY FROM AGE(f.updated_at, f.created_at)) END), 0)
+FROM findings f
+INNER JOIN security s ON s.id = f.security_id
+GROUP BY s.account_id, f.created_at::date, f.severity, f.status, COALESCE(f.workflow_state, ''), f.service, COALESCE(f.region, '')
+ON CONFLICT DO NOTHING;
+
+
+
+--05 Ingest Lookup Keys (match the lookups in CoreUpdateDb, see sql/core-index-benchmark.sql)
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction block, run each statement on its own.
+-- A failed concurrent build leaves an INVALID index, drop it and re-run the statement.
+
+-- Remove duplicate cost reports (service costs and forecasts cascade), keeping the most recent one
+DELETE FROM cost_reports cr
+USING cost_reports d
+WHERE cr.account_id = d.account_id
+AND cr.period_start = d.period_start
+AND cr.period_end = d.period_end
+AND cr.id < d.id;
+
+-- Cost report lookup in CoreUpdateDb._sync_cost_report
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS cost_reports_account_period_key
+ON cost_reports(account_id, period_start, period_end);
+
+ALTER TABLE cost_reports
+ADD CONSTRAINT cost_reports_account_period_key UNIQUE USING INDEX cost_reports_account_period_key;
+
+-- No key for the finding lookup: UNIQUE(finding_id) already serves it (no gain in sql/core-index-benchmark.sql),
+-- drop the composite key where an earlier version of this patch created it
+DROP INDEX CONCURRENTLY IF EXISTS findings_finding_resource_security_key;
+
+-- Planner statistics for the new keys
+ANALYZE services;
+ANALYZE cost_reports;
+ANALYZE findings;
+ANALYZE security;
+
+
+
+--06 Monthly Partitions for services, logs and log_messages
+-- Rebuilds the three tables as range partitioned tables (by month of services.date_from, logs.date_created and
+-- log_messages.created_at) and copies the rows across in one transaction. The views reading these tables are
+-- dropped with the old tables, run sql/core-view-schema.sql again afterwards.
+
+-- Create the monthly partitions of a table covering first_day .. last_day
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent TEXT, first_day DATE, last_day DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    part_month DATE := date_trunc('month', COALESCE(first_day, CURRENT_DATE))::date;
+    last_month DATE := date_trunc('month', COALESCE(last_day, CURRENT_DATE))::date;
+    part_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE part_month <= last_month LOOP
+        part_name := format('%s_%s', parent, to_char(part_month, 'YYYY_MM'));
+        IF to_regclass(part_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                part_name, parent, part_month, (part_month + INTERVAL '1 month')::date);
+            created := created + 1;
+        END IF;
+        part_month := (part_month + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Detach and drop the monthly partitions older than keep_months full months (0 keeps everything)
+CREATE OR REPLACE FUNCTION drop_expired_partitions(parent TEXT, keep_months INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    cutoff DATE;
+    part RECORD;
+    dropped INTEGER := 0;
+BEGIN
+    IF COALESCE(keep_months, 0) <= 0 THEN
+        RETURN 0;
+    END IF;
+
+    cutoff := (date_trunc('month', CURRENT_DATE) - make_interval(months => keep_months))::date;
+
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        INNER JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = parent::regclass
+        AND c.relname ~ ('^' || parent || '_[0-9]{4}_[0-9]{2}$')
+        AND to_date(right(c.relname, 7), 'YYYY_MM') < cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', parent, part.relname);
+        EXECUTE format('DROP TABLE %I', part.relname);
+        dropped := dropped + 1;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create the partitions for the coming months and expire the old ones (log_messages before the logs they reference)
+CREATE OR REPLACE FUNCTION maintain_partitions(months_ahead INTEGER, services_keep_months INTEGER, logs_keep_months INTEGER)
+RETURNS TABLE(table_name TEXT, created_partitions INTEGER, dropped_partitions INTEGER) AS $$
+DECLARE
+    last_day DATE := (CURRENT_DATE + make_interval(months => GREATEST(months_ahead, 0)))::date;
+BEGIN
+    RETURN QUERY SELECT 'services'::TEXT,
+        create_monthly_partitions('services', CURRENT_DATE, last_day),
+        drop_expired_partitions('services', services_keep_months);
+    RETURN QUERY SELECT 'log_messages'::TEXT,
+        create_monthly_partitions('log_messages', CURRENT_DATE, last_day),
+        drop_expired_partitions('log_messages', logs_keep_months);
+    RETURN QUERY SELECT 'logs'::TEXT,
+        create_monthly_partitions('logs', CURRENT_DATE, last_day),
+        drop_expired_partitions('logs', logs_keep_months);
+END;
+$$ LANGUAGE plpgsql;
+
+BEGIN;
+
+ALTER TABLE log_messages RENAME TO log_messages_legacy;
+ALTER TABLE logs RENAME TO logs_legacy;
+ALTER TABLE services RENAME TO services_legacy;
+ALTER TABLE services_legacy RENAME CONSTRAINT services_account_service_period_key TO services_legacy_period_key;
+ALTER INDEX services_pkey RENAME TO services_legacy_pkey;
+ALTER INDEX logs_pkey RENAME TO logs_legacy_pkey;
+ALTER INDEX log_messages_pkey RENAME TO log_messages_legacy_pkey;
+
+CREATE TABLE services (
+    id SERIAL,
+    account_id INTEGER NOT NULL REFERENCES accounts(id),
+    service VARCHAR(255) NOT NULL,
+    date_from DATE NOT NULL,
+    date_to DATE NOT NULL,
+    cost DECIMAL(20,10) NOT NULL,
+    currency VARCHAR(3) DEFAULT 'USD',
+    utilization DECIMAL(20,10),
+    utilization_unit VARCHAR(100),
+    usage_types VARCHAR[] DEFAULT '{}',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, date_from),
+    CONSTRAINT date_check CHECK (date_to >= date_from),
+    CONSTRAINT services_account_service_period_key UNIQUE (account_id, service, date_from, date_to)
+) PARTITION BY RANGE (date_from);
+
+CREATE TABLE logs (
+    id SERIAL,
+    account_id INTEGER NOT NULL REFERENCES accounts(id),
+    date_created TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    account_status VARCHAR(50) NOT NULL,
+    cost_status VARCHAR(50) NOT NULL,
+    service_status VARCHAR(50) NOT NULL,
+    security_status VARCHAR(50) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, date_created)
+) PARTITION BY RANGE (date_created);
+
+CREATE TABLE log_messages (
+    id SERIAL,
+    log_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    message_type VARCHAR(50),
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at),
+    FOREIGN KEY (log_id, created_at) REFERENCES logs(id, date_created) ON DELETE CASCADE
+) PARTITION BY RANGE (created_at);
+
+-- Partitions covering the existing rows and the next 3 months
+SELECT create_monthly_partitions('services', (SELECT MIN(date_from) FROM services_legacy), (CURRENT_DATE + INTERVAL '3 months')::date);
+SELECT create_monthly_partitions('logs', (SELECT MIN(COALESCE(date_created, created_at, CURRENT_TIMESTAMP))::date FROM logs_legacy), (CURRENT_DATE + INTERVAL '3 months')::date);
+SELECT create_monthly_partitions('log_messages', (SELECT MIN(COALESCE(date_created, created_at, CURRENT_TIMESTAMP))::date FROM logs_legacy), (CURRENT_DATE + INTERVAL '3 months')::date);
+
+INSERT INTO services
+SELECT id, account_id, service, date_from, date_to, cost, currency, utilization, utilization_unit, usage_types, created_at, updated_at
+FROM services_legacy;
+
+INSERT INTO logs
+SELECT id, account_id, COALESCE(date_created, created_at, CURRENT_TIMESTAMP), account_status, cost_status, service_status,
+    security_status, created_at, updated_at
+FROM logs_legacy;
+
+-- Messages take the date_created of their log so they land in the same month partition
+INSERT INTO log_messages
+SELECT lm.id, lm.log_id, lm.message, lm.message_type, COALESCE(l.date_created, l.created_at, CURRENT_TIMESTAMP)
+FROM log_messages_legacy lm
+INNER JOIN logs_legacy l ON l.id = lm.log_id;
+
+SELECT setval(pg_get_serial_sequence('services', 'id'), COALESCE((SELECT MAX(id) FROM services), 0) + 1, false);
+SELECT setval(pg_get_serial_sequence('logs', 'id'), COALESCE((SELECT MAX(id) FROM logs), 0) + 1, false);
+SELECT setval(pg_get_serial_sequence('log_messages', 'id'), COALESCE((SELECT MAX(id) FROM log_messages), 0) + 1, false);
+
+DROP TABLE log_messages_legacy CASCADE;
+DROP TABLE logs_legacy CASCADE;
+DROP TABLE services_legacy CASCADE;
+
+CREATE INDEX idx_services_account_id ON services(account_id);
+CREATE INDEX idx_services_service ON services(service);
+CREATE INDEX idx_services_date_range ON services(date_from, date_to);
+CREATE INDEX idx_logs_account_id ON logs(account_id);
+CREATE INDEX idx_logs_date_created ON logs(date_created);
+CREATE INDEX idx_log_messages_log_id ON log_messages(log_id, created_at);
+
+COMMIT;
+
+ANALYZE services;
+ANALYZE logs;
+ANALYZE log_messages;
+
+
+--07 Content Hashes (compared against the account snapshot by CoreUpdateDb to skip unchanged rows)
+-- Existing rows keep a NULL hash and are rewritten once on their next load
+ALTER TABLE services ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+ALTER TABLE cost_reports ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+ALTER TABLE security ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+ALTER TABLE findings ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+
+--08 Ingest Ledger (checked by CoreUpdateDb.process_message before a file is parsed)
+CREATE TABLE IF NOT EXISTS ingest_ledger (
+    message_id VARCHAR(100) PRIMARY KEY,
+    s3_path TEXT NOT NULL,
+    object_etag VARCHAR(100),
+    account_id INTEGER REFERENCES accounts(id),
+    account_hash VARCHAR(64),
+    service_hash VARCHAR(64),
+    cost_hash VARCHAR(64),
+    security_hash VARCHAR(64),
+    skipped_sections VARCHAR[] DEFAULT '{}',
+    stage_timings JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_ingest_ledger_object_etag ON ingest_ledger(object_etag);
+CREATE INDEX IF NOT EXISTS idx_ingest_ledger_account_completed ON ingest_ledger(account_id, completed_at DESC);
+
+
+--09 Findings Last Seen (closed findings are purged by CoreUpdateDb._sweep_findings once not reported for the retention period)
+-- Existing rows start their retention period at the time of the patch
+ALTER TABLE findings ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+
+--10 Materialized View Refreshes (CoreUpdateDb.refresh_views refreshes each view at most once every VIEW_REFRESH_INTERVAL seconds)
+CREATE TABLE IF NOT EXISTS view_refreshes (
+    view_name VARCHAR(100) PRIMARY KEY,
+    pending BOOLEAN NOT NULL DEFAULT FALSE,
+    refreshed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT '-infinity'
+);
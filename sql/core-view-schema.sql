@@ -197,6 +197,7 @@ ORDER BY
 
 
 -- 6. View Account and Security Findings Summary
+-- Read from the findings_daily rollup maintained by the Receiver Lambda
 
 CREATE OR REPLACE VIEW view_acct_security_findings_summary AS
 SELECT
@@ -206,36 +207,36 @@ SELECT
     a.csp as account_csp,
     a.account_type as account_type,
     CONCAT(a.account_id, ' - ', a.account_name) as account_full,
-    f.severity,
+    fd.severity,
     -- Status Counts
-    COUNT(*) as total_findings,
-    COUNT(CASE WHEN f.status = 'NEW' THEN 1 END) as new_count,
-    COUNT(CASE WHEN f.status = 'NOTIFIED' THEN 1 END) as notified_count,
-    COUNT(CASE WHEN f.status = 'SUPPRESSED' THEN 1 END) as suppressed_count,
-    COUNT(CASE WHEN f.status = 'RESOLVED' THEN 1 END) as resolved_count,
-    COUNT(CASE WHEN f.status = 'REMOVED' THEN 1 END) as removed_count,
+    SUM(fd.finding_count) as total_findings,
+    SUM(CASE WHEN fd.status = 'NEW' THEN fd.finding_count ELSE 0 END) as new_count,
+    SUM(CASE WHEN fd.status = 'NOTIFIED' THEN fd.finding_count ELSE 0 END) as notified_count,
+    SUM(CASE WHEN fd.status = 'SUPPRESSED' THEN fd.finding_count ELSE 0 END) as suppressed_count,
+    SUM(CASE WHEN fd.status = 'RESOLVED' THEN fd.finding_count ELSE 0 END) as resolved_count,
+    SUM(CASE WHEN fd.status = 'REMOVED' THEN fd.finding_count ELSE 0 END) as removed_count,
     -- Workflow Status Counts
-    COUNT(CASE WHEN f.workflow_state = 'IN_PROGRESS' THEN 1 END) as in_progress_count,
-    COUNT(CASE WHEN f.workflow_state = 'ARCHIVED' THEN 1 END) as archived_count,
-    COUNT(CASE WHEN f.workflow_state = 'CLOSED' THEN 1 END) as closed_count,
+    SUM(CASE WHEN fd.workflow_state = 'IN_PROGRESS' THEN fd.finding_count ELSE 0 END) as in_progress_count,
+    SUM(CASE WHEN fd.workflow_state = 'ARCHIVED' THEN fd.finding_count ELSE 0 END) as archived_count,
+    SUM(CASE WHEN fd.workflow_state = 'CLOSED' THEN fd.finding_count ELSE 0 END) as closed_count,
     -- Active Issues (excluding resolved, removed, archived, closed)
-    COUNT(CASE
-        WHEN f.status NOT IN ('RESOLVED', 'REMOVED')
-        AND (f.workflow_state NOT IN ('ARCHIVED', 'CLOSED') OR f.workflow_state IS NULL)
-        THEN 1
+    SUM(CASE
+        WHEN fd.status NOT IN ('RESOLVED', 'REMOVED')
+        AND fd.workflow_state NOT IN ('ARCHIVED', 'CLOSED')
+        THEN fd.finding_count
+        ELSE 0
     END) as active_issues,
-    f.service as finding_service,
-    f.region
+    fd.service as finding_service,
+    NULLIF(fd.region, '') as region
 FROM accounts a
-INNER JOIN security s ON s.account_id = a.id
-INNER JOIN findings f ON f.security_id = s.id
+INNER JOIN findings_daily fd ON fd.account_id = a.id
 GROUP BY
     a.id,
     a.account_id,
     a.account_name,
-    f.severity,
-    f.service,
-    f.region;
+    fd.severity,
+    fd.service,
+    fd.region;
 
 -- 7. View Account and Security Findings Details
 CREATE OR REPLACE VIEW view_acct_security_findings_details AS
@@ -326,6 +327,9 @@ ORDER BY
     days_open DESC;
 
 -- 8. View Account and Security Findings Trends
+-- Read from the findings_daily rollup maintained by the Receiver Lambda, one row per rollup key
+DROP VIEW IF EXISTS view_acct_security_findings_trends;
+DROP MATERIALIZED VIEW IF EXISTS mview_acct_security_findings_trends;
 
 CREATE OR REPLACE VIEW view_acct_security_findings_trends AS
 SELECT
@@ -335,41 +339,31 @@ SELECT
     a.csp as account_csp,
     a.account_type as account_type,
     CONCAT(a.account_id, ' - ', a.account_name) as account_full,
-    DATE_TRUNC('day', f.created_at) as date,
-    f.severity,
-    f.status,
-    f.workflow_state,
-    COUNT(*) as finding_count,
+    fd.day::TIMESTAMP WITH TIME ZONE as date,
+    fd.severity,
+    fd.status,
+    NULLIF(fd.workflow_state, '') as workflow_state,
+    fd.finding_count::BIGINT as finding_count,
 
     -- Status-based metrics
-    COUNT(CASE WHEN f.status = 'NEW' THEN 1 END) as new_findings,
-    COUNT(CASE WHEN f.status IN ('RESOLVED', 'REMOVED') THEN 1 END) as resolved_findings,
-    COUNT(CASE WHEN f.workflow_state = 'IN_PROGRESS' THEN 1 END) as in_progress_findings,
+    CASE WHEN fd.status = 'NEW' THEN fd.finding_count ELSE 0 END::BIGINT as new_findings,
+    CASE WHEN fd.status IN ('RESOLVED', 'REMOVED') THEN fd.finding_count ELSE 0 END::BIGINT as resolved_findings,
+    CASE WHEN fd.workflow_state = 'IN_PROGRESS' THEN fd.finding_count ELSE 0 END::BIGINT as in_progress_findings,
 
     -- Average resolution time
-    AVG(CASE
-        WHEN f.status IN ('RESOLVED', 'REMOVED')
-        THEN EXTRACT(DAY FROM AGE(f.updated_at, f.created_at))
-    END) as avg_resolution_days,
+    CASE
+        WHEN fd.status IN ('RESOLVED', 'REMOVED')
+        THEN fd.resolution_days / NULLIF(fd.finding_count, 0)
+    END as avg_resolution_days,
 
-    f.service as finding_service,
-    f.region
+    fd.service as finding_service,
+    NULLIF(fd.region, '') as region
 FROM accounts a
-INNER JOIN security s ON s.account_id = a.id
-INNER JOIN findings f ON f.security_id = s.id
-GROUP BY
-    a.id,
-    a.account_id,
-    a.account_name,
-    DATE_TRUNC('day', f.created_at),
-    f.severity,
-    f.status,
-    f.workflow_state,
-    f.service,
-    f.region
+INNER JOIN findings_daily fd ON fd.account_id = a.id
 ORDER BY
     date DESC;
 
+
 -- 9. View Account and Aggregated products
 CREATE OR REPLACE VIEW view_acct_products AS
 SELECT a.id as account_id,
@@ -579,7 +573,11 @@ ORDER BY
 
 
 -- 13. View Account, Product, Security, Cost, Services Summary
-CREATE OR REPLACE VIEW view_summary AS
+-- Materialized, refreshed by the Receiver Lambda after a load that changed rows (REFRESH ... CONCURRENTLY)
+DROP VIEW IF EXISTS view_summary;
+DROP MATERIALIZED VIEW IF EXISTS mview_summary;
+
+CREATE MATERIALIZED VIEW mview_summary AS
 WITH latest_cost_report AS (
     -- Get the most recent cost report for each account and granularity
     SELECT *
@@ -587,14 +585,14 @@ WITH latest_cost_report AS (
     ORDER BY account_id, period_granularity, period_end DESC
 ),
 service_metrics AS (
-    -- Aggregate service metrics
+    -- Aggregate service metrics from the services_daily rollup
     SELECT
         account_id,
-        COUNT(DISTINCT id) as service_count,
+        SUM(service_rows) as service_count,
         COUNT(DISTINCT service) as unique_services,
         SUM(cost) as total_service_cost,
         STRING_AGG(DISTINCT service, ', ') as services_used
-    FROM services
+    FROM services_daily
     GROUP BY account_id
 ),
 security_metrics AS (
@@ -644,6 +642,7 @@ SELECT
     COALESCE(pc.number_of_products, 0) as number_of_products,
 
     -- Cost Metrics
+    cr.id as cost_report_id,
     cr.period_granularity,
     cr.period_start as date_from,
     cr.period_end as date_to,
@@ -706,8 +705,53 @@ LEFT JOIN product_count pc ON pc.account_id = a.id
 WHERE
     (cr.period_granularity::text = 'MONTHLY'::text OR
      cr.period_granularity::text = 'WEEKLY'::text OR
-     cr.period_granularity::text = 'DAILY'::text)
+     cr.period_granularity::text = 'DAILY'::text);
+
+-- Unique index required by REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX idx_mview_summary_cost_report_id ON mview_summary(cost_report_id);
+CREATE INDEX idx_mview_summary_account_id ON mview_summary(account_id);
 
+-- Same columns as before it was materialized, cost_report_id is only the key of the refresh
+CREATE OR REPLACE VIEW view_summary AS
+SELECT
+    account_id,
+    account,
+    account_name,
+    account_csp,
+    account_type,
+    account_full,
+    account_status,
+    number_of_products,
+    period_granularity,
+    date_from,
+    date_to,
+    current_period_cost,
+    previous_period_cost,
+    cost_difference,
+    cost_difference_percentage,
+    potential_savings,
+    service_count,
+    unique_services,
+    total_service_cost,
+    services_used,
+    total_findings,
+    open_findings,
+    resolved_findings,
+    critical_findings,
+    high_findings,
+    medium_findings,
+    low_findings,
+    security_resolution_rate,
+    latest_account_status,
+    latest_cost_status,
+    latest_service_status,
+    latest_security_status,
+    overall_health,
+    account_email,
+    joined_method,
+    joined_timestamp,
+    account_age_days
+FROM mview_summary
 ORDER BY
-    a.account_name,
-    cr.period_start DESC;
\ No newline at end of file
+    account_name,
+    date_from DESC;
\ No newline at end of file